@@ -1112,3 +1112,70 @@ vc.disconnect()
             group_id=group_id,
             volume_id=volume_id,
         )), volume_prefix)
+
+    def test_clone_volume_to_existing(self):
+        """
+        That a volume snapshot is copied into another volume, and that
+        purging a volume with many directories works with several workers.
+        """
+        self.mount_b.umount_wait()
+        self._configure_vc_auth(self.mount_b, "manila")
+
+        group_id = "grpid"
+        src_id = "srcvol"
+        dst_id = "dstvol"
+        mount_paths = self._volume_client_python(self.mount_b, dedent("""
+            for volume_id in ["{src_id}", "{dst_id}"]:
+                vp = VolumePath("{group_id}", volume_id)
+                print(vc.create_volume(vp, 1024*1024*100)['mount_path'])
+        """.format(
+            group_id=group_id,
+            src_id=src_id,
+            dst_id=dst_id
+        ))).split()
+
+        # Strip leading "/"
+        src_path, dst_path = [p[1:] for p in mount_paths]
+
+        for d in range(4):
+            subdir = os.path.join(src_path, "dir{0}".format(d), "sub")
+            self.mount_a.run_shell(["mkdir", "-p", subdir])
+            for f in range(4):
+                self.mount_a.write_n_mb(os.path.join(subdir, "file{0}".format(f)), d + f)
+        self.mount_a.run_shell(["chmod", "0600", os.path.join(src_path, "dir0/sub/file1")])
+        self.mount_a.run_shell(["ln", "-s", "sub/file2", os.path.join(src_path, "dir1/link")])
+
+        self._volume_client_python(self.mount_b, dedent("""
+            src = VolumePath("{group_id}", "{src_id}")
+            dst = VolumePath("{group_id}", "{dst_id}")
+            vc.create_snapshot_volume(src, "snap")
+            result = vc.clone_volume_to_existing(dst, src, "snap", workers=4)
+            assert result['files'] == 16, result
+            vc.destroy_snapshot_volume(src, "snap")
+        """.format(
+            group_id=group_id,
+            src_id=src_id,
+            dst_id=dst_id
+        )))
+
+        def listing(path):
+            return self.mount_a.run_shell([
+                "bash", "-c",
+                "cd {0} && find . -printf '%p %M %l\\n' | sort && "
+                "find . -type f -exec md5sum {{}} + | sort".format(path)
+            ]).stdout.getvalue()
+
+        self.assertEqual(listing(src_path), listing(dst_path))
+
+        self._volume_client_python(self.mount_b, dedent("""
+            for volume_id in ["{src_id}", "{dst_id}"]:
+                vp = VolumePath("{group_id}", volume_id)
+                vc.delete_volume(vp)
+                vc.purge_volume(vp, workers=4)
+        """.format(
+            group_id=group_id,
+            src_id=src_id,
+            dst_id=dst_id
+        )))
+
+        self.assertEqual(self.mount_a.ls("volumes/_deleting"), [])
@@ -37,3 +37,18 @@ class SummaryTest(DashboardTestCase):
         self.assertIsNotNone(data['health_status'])
         self.assertIsNotNone(data['mgr_id'])
         self.assertIsNotNone(data['have_mon_connection'])
+
+    def test_summary_updates(self):
+        data = self._get("/api/summary/updates?timeout=0")
+        self.assertStatus(200)
+        self.assertIn('version', data)
+        for key in ['health_status', 'have_mon_connection', 'mgr_host', 'executing_tasks',
+                    'finished_tasks']:
+            self.assertIn(key, data['changes'])
+
+        # nothing but the version changes after the version we have
+        update = self._get("/api/summary/updates?version={}&timeout=1".format(data['version']))
+        self.assertStatus(200)
+        self.assertGreaterEqual(update['version'], data['version'])
+        if update['version'] == data['version']:
+            self.assertEqual(update['changes'], {})
@@ -745,6 +745,54 @@ PyObject* ActivePyModules::get_latest_counter_python(
   return with_perf_counters(extract_latest_counters, svc_name, svc_id, path);
 }
 
+PyObject* ActivePyModules::get_latest_counters_python(
+    const std::string &svc_type,
+    const std::vector<std::string> &paths)
+{
+  PyThreadState *tstate = PyEval_SaveThread();
+  std::lock_guard l(lock);
+  PyEval_RestoreThread(tstate);
+
+  // the last two data points of each counter of each daemon of the
+  // service, oldest first: enough to compute the current rates
+  PyFormatter f;
+  for (const auto &statepair : daemon_state.get_by_service(svc_type)) {
+    const auto &state = statepair.second;
+    f.open_object_section(statepair.first.second.c_str());
+    std::lock_guard l2(state->lock);
+    for (const auto &path : paths) {
+      auto i = state->perf_counters.instances.find(path);
+      if (i == state->perf_counters.instances.end()) {
+        continue;
+      }
+      f.open_array_section(path.c_str());
+      if (state->perf_counters.types.at(path).type & PERFCOUNTER_LONGRUNAVG) {
+        const auto &data = i->second.get_data_avg();
+        for (auto p = data.size() > 2 ? data.end() - 2 : data.begin();
+             p != data.end(); ++p) {
+          f.open_array_section("datapoint");
+          f.dump_unsigned("t", p->t.sec());
+          f.dump_unsigned("s", p->s);
+          f.dump_unsigned("c", p->c);
+          f.close_section();
+        }
+      } else {
+        const auto &data = i->second.get_data();
+        for (auto p = data.size() > 2 ? data.end() - 2 : data.begin();
+             p != data.end(); ++p) {
+          f.open_array_section("datapoint");
+          f.dump_unsigned("t", p->t.sec());
+          f.dump_unsigned("v", p->v);
+          f.close_section();
+        }
+      }
+      f.close_section();
+    }
+    f.close_section();
+  }
+  return f.get();
+}
+
 PyObject* ActivePyModules::get_perf_schema_python(
     const std::string &svc_type,
     const std::string &svc_id)
@@ -85,6 +85,9 @@ public:
     const std::string &svc_type,
     const std::string &svc_id,
     const std::string &path);
+  PyObject *get_latest_counters_python(
+    const std::string &svc_type,
+    const std::vector<std::string> &paths);
   PyObject *get_perf_schema_python(
      const std::string &svc_type,
      const std::string &svc_id);
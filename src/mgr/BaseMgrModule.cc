@@ -595,6 +595,31 @@ get_latest_counter(BaseMgrModule *self, PyObject *args)
       svc_name, svc_id, counter_path);
 }
 
+static PyObject*
+get_latest_counters(BaseMgrModule *self, PyObject *args)
+{
+  char *svc_name = nullptr;
+  PyObject *path_list = nullptr;
+  if (!PyArg_ParseTuple(args, "sO:get_latest_counters", &svc_name,
+                                                          &path_list)) {
+    return nullptr;
+  }
+  if (!PyList_CheckExact(path_list)) {
+    derr << __func__ << " path_list not a list" << dendl;
+    Py_RETURN_NONE;
+  }
+  std::vector<std::string> paths;
+  for (Py_ssize_t i = 0; i < PyList_Size(path_list); ++i) {
+    PyObject *path = PyList_GET_ITEM(path_list, i);
+    if (!PyString_Check(path)) {
+      derr << __func__ << " path " << i << " not a string" << dendl;
+      Py_RETURN_NONE;
+    }
+    paths.push_back(PyString_AsString(path));
+  }
+  return self->py_modules->get_latest_counters_python(svc_name, paths);
+}
+
 static PyObject*
 get_perf_schema(BaseMgrModule *self, PyObject *args)
 {
@@ -1047,6 +1072,9 @@ PyMethodDef BaseMgrModule_methods[] = {
   {"_ceph_get_latest_counter", (PyCFunction)get_latest_counter, METH_VARARGS,
     "Get the latest performance counter"},
 
+  {"_ceph_get_latest_counters", (PyCFunction)get_latest_counters, METH_VARARGS,
+    "Get the last two samples of performance counters of all daemons of a service"},
+
   {"_ceph_get_perf_schema", (PyCFunction)get_perf_schema, METH_VARARGS,
     "Get the performance counter schema"},
 
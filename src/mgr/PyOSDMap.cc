@@ -147,11 +147,17 @@ static PyObject *osdmap_calc_pg_upmaps(BasePyOSDMap* self, PyObject *args)
 	   << " max_iterations " << max_iterations
 	   << " pools " << pools
 	   << dendl;
+  // let other python threads run meanwhile. The calculation reads the
+  // osdmap and its crush map, and writes to the incremental: callers
+  // running it from several threads must give each of them an osdmap
+  // (e.g. from apply_incremental()) and an incremental of its own.
+  PyThreadState *tstate = PyEval_SaveThread();
   int r = self->osdmap->calc_pg_upmaps(g_ceph_context,
 				 max_deviation,
 				 max_iterations,
 				 pools,
 				 incobj->inc);
+  PyEval_RestoreThread(tstate);
   dout(10) << __func__ << " r = " << r << dendl;
   return PyInt_FromLong(r);
 }
@@ -450,6 +456,28 @@ static PyObject *osdmap_inc_set_compat_weight_set_weights(
   Py_RETURN_NONE;
 }
 
+static PyObject *osdmap_inc_merge_pg_upmaps(BasePyOSDMapIncremental *self,
+    PyObject *args)
+{
+  BasePyOSDMapIncremental *other;
+  if (!PyArg_ParseTuple(args, "O!:merge_pg_upmaps",
+			&BasePyOSDMapIncrementalType, &other)) {
+    return nullptr;
+  }
+  for (auto& i : other->inc->new_pg_upmap) {
+    self->inc->new_pg_upmap[i.first] = i.second;
+  }
+  for (auto& i : other->inc->new_pg_upmap_items) {
+    self->inc->new_pg_upmap_items[i.first] = i.second;
+  }
+  self->inc->old_pg_upmap.insert(other->inc->old_pg_upmap.begin(),
+				 other->inc->old_pg_upmap.end());
+  self->inc->old_pg_upmap_items.insert(
+    other->inc->old_pg_upmap_items.begin(),
+    other->inc->old_pg_upmap_items.end());
+  Py_RETURN_NONE;
+}
+
 PyMethodDef BasePyOSDMapIncremental_methods[] = {
   {"_get_epoch", (PyCFunction)osdmap_inc_get_epoch, METH_NOARGS,
     "Get OSDMap::Incremental epoch"},
@@ -460,6 +488,8 @@ PyMethodDef BasePyOSDMapIncremental_methods[] = {
   {"_set_crush_compat_weight_set_weights",
    (PyCFunction)osdmap_inc_set_compat_weight_set_weights, METH_O,
    "Set weight values in the pending CRUSH compat weight-set"},
+  {"_merge_pg_upmaps", (PyCFunction)osdmap_inc_merge_pg_upmaps, METH_VARARGS,
+   "Merge the pg_upmap changes of another OSDMap::Incremental"},
   {NULL, NULL, 0, NULL}
 };
 
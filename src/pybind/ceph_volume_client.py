@@ -11,12 +11,18 @@ import json
 import logging
 import os
 import re
+import stat
 import struct
 import sys
 import threading
 import time
 import uuid
 
+try:
+    import queue as Queue
+except ImportError:
+    import Queue
+
 from ceph_argparse import json_command
 
 import cephfs
@@ -31,6 +37,13 @@ def to_bytes(param):
     else:
         return str(param).encode()
 
+class PurgeInterrupted(Exception):
+    """
+    A volume purge was stopped before the volume was fully removed
+    """
+    pass
+
+
 class RadosError(Exception):
     """
     Something went wrong talking to Ceph with librados
@@ -49,6 +62,15 @@ NO_GROUP_NAME = "_nogroup"
 # Filename extensions for meta files.
 META_FILE_EXT = ".meta"
 
+# Size of the reads and writes done when copying files
+COPY_BLOCK_SIZE = 4 * 1024 * 1024
+
+# Largest extended attribute value copied
+XATTR_MAX_SIZE = 64 * 1024
+
+# Size of the reads and writes done on meta files
+METADATA_IO_SIZE = 1024 * 1024
+
 class VolumePath(object):
     """
     Identify a volume's path as group->volume
@@ -276,6 +298,14 @@ class CephFSVolumeClient(object):
         # UUID
         self._id = struct.unpack(">Q", uuid.uuid1().bytes[0:8])[0]
 
+        # Serialized meta files, as path -> ((ino, change attribute), bytes).
+        # Every meta file access happens under its lock, so a cached copy is
+        # still current as long as the file's change attribute is unchanged.
+        # Parsing the bytes again gives every caller a private copy, and is
+        # cheaper than deep copying the parsed data.
+        self._metadata_cache = {}
+        self._metadata_cache_lock = threading.Lock()
+
         # TODO: version the on-disk structures
 
     def recover(self):
@@ -334,7 +364,7 @@ class CephFSVolumeClient(object):
                 auth_meta = self._auth_metadata_get(auth_id)
                 if not auth_meta or not auth_meta['volumes']:
                     # Clean up auth meta file
-                    self.fs.unlink(self._auth_metadata_path(auth_id))
+                    self._metadata_unlink(self._auth_metadata_path(auth_id))
                     continue
                 if not auth_meta['dirty']:
                     continue
@@ -389,7 +419,7 @@ class CephFSVolumeClient(object):
 
         if not auth_meta['volumes']:
             # Clean up auth meta file
-            self.fs.unlink(self._auth_metadata_path(auth_id))
+            self._metadata_unlink(self._auth_metadata_path(auth_id))
             return
 
         # Recovered from all partial auth updates for the auth ID.
@@ -466,7 +496,7 @@ class CephFSVolumeClient(object):
             group_id
         )
 
-    def _connect(self, premount_evict):
+    def _connect(self, premount_evict, recover=True):
         log.debug("Connecting to cephfs...")
         self.fs = cephfs.LibCephFS(rados_inst=self.rados)
         log.debug("CephFS initializing...")
@@ -481,15 +511,19 @@ class CephFSVolumeClient(object):
 
         # Recover from partial auth updates due to a previous
         # crash.
-        self.recover()
+        if recover:
+            self.recover()
 
-    def connect(self, premount_evict = None):
+    def connect(self, premount_evict = None, recover=True):
         """
 
         :param premount_evict: Optional auth_id to evict before mounting the filesystem: callers
                                may want to use this to specify their own auth ID if they expect
                                to be a unique instance and don't want to wait for caps to time
                                out after failure of another instance of themselves.
+        :param recover: Whether to recover from partial auth updates left by a
+                        crash; callers that already did it since they last
+                        could have crashed may skip it.
         """
         if self.own_rados:
             log.debug("Configuring to RADOS with config {0}...".format(self.conf_path))
@@ -503,7 +537,7 @@ class CephFSVolumeClient(object):
                 log.debug("Connecting to RADOS...")
                 self.rados.connect()
                 log.debug("Connection to RADOS complete")
-        self._connect(premount_evict)
+        self._connect(premount_evict, recover)
 
     def get_mon_addrs(self):
         log.info("get_mon_addrs")
@@ -729,14 +763,23 @@ class CephFSVolumeClient(object):
         # Delete the volume meta file, if it's not already deleted
         vol_meta_path = self._volume_metadata_path(volume_path)
         try:
-            self.fs.unlink(vol_meta_path)
+            self._metadata_unlink(vol_meta_path)
         except cephfs.ObjectNotFound:
             pass
 
-    def purge_volume(self, volume_path, data_isolated=False):
+    def purge_volume(self, volume_path, data_isolated=False, workers=1,
+                     progress=None, stop=None):
         """
         Finish clearing up a volume that was previously passed to delete_volume.  This
         function is idempotent.
+
+        :param workers: number of threads removing the volume's subtrees in
+                        parallel
+        :param progress: optional callable, periodically passed the number of
+                         entries removed so far and the number of entries
+                         the volume had
+        :param stop: optional threading.Event, interrupts the purge (with a
+                     PurgeInterrupted error) when set
         """
 
         trash = os.path.join(self.volume_prefix, "_deleting")
@@ -749,27 +792,7 @@ class CephFSVolumeClient(object):
                 trashed_volume))
             return
 
-        def rmtree(root_path):
-            log.debug("rmtree {0}".format(root_path))
-            dir_handle = self.fs.opendir(root_path)
-            d = self.fs.readdir(dir_handle)
-            while d:
-                if d.d_name not in [".", ".."]:
-                    # Do not use os.path.join because it is sensitive
-                    # to string encoding, we just pass through dnames
-                    # as byte arrays
-                    d_full = "{0}/{1}".format(root_path, d.d_name)
-                    if d.is_dir():
-                        rmtree(d_full)
-                    else:
-                        self.fs.unlink(d_full)
-
-                d = self.fs.readdir(dir_handle)
-            self.fs.closedir(dir_handle)
-
-            self.fs.rmdir(root_path)
-
-        rmtree(trashed_volume)
+        self._rmtree(trashed_volume, workers, progress, stop)
 
         if data_isolated:
             pool_name = "{0}{1}".format(self.POOL_PREFIX, volume_path.volume_id)
@@ -788,6 +811,157 @@ class CephFSVolumeClient(object):
                                     "yes_i_really_really_mean_it": True
                                 })
 
+    def list_deleted_volumes(self):
+        """
+        Ids of the volumes passed to delete_volume that were not purged yet.
+        """
+        trash = os.path.join(self.volume_prefix, "_deleting")
+        try:
+            dir_handle = self.fs.opendir(trash)
+        except cephfs.ObjectNotFound:
+            return []
+
+        volume_ids = []
+        d = self.fs.readdir(dir_handle)
+        while d:
+            if d.d_name not in [b".", b".."]:
+                volume_ids.append(d.d_name.decode('utf-8'))
+            d = self.fs.readdir(dir_handle)
+        self.fs.closedir(dir_handle)
+        return volume_ids
+
+    def _walk_parallel(self, root, process, workers):
+        """
+        Call process(item, push) on root, and on every item passed to push
+        by these calls, from up to `workers` threads at a time.  Returns
+        once every item was processed, or raises the first error.
+        """
+        lock = threading.Lock()
+        finished = threading.Event()
+        items = Queue.Queue()
+        # [items queued or being processed, first error]
+        state = [1, None]
+
+        def push(item):
+            with lock:
+                state[0] += 1
+            items.put(item)
+
+        def finish():
+            finished.set()
+            # wake up the idle workers
+            for i in range(max(workers, 1)):
+                items.put(None)
+
+        def worker():
+            while True:
+                item = items.get()
+                if item is None or finished.is_set():
+                    return
+                try:
+                    process(item, push)
+                except Exception as e:
+                    with lock:
+                        if state[1] is None:
+                            state[1] = e
+                    finish()
+                    return
+                with lock:
+                    state[0] -= 1
+                    if not state[0]:
+                        finish()
+
+        items.put(root)
+        if workers <= 1:
+            worker()
+        else:
+            threads = [threading.Thread(target=worker)
+                       for i in range(workers)]
+            for t in threads:
+                t.daemon = True
+                t.start()
+            for t in threads:
+                t.join()
+        if state[1] is not None:
+            raise state[1]
+
+    def _rmtree(self, root_path, workers=1, progress=None, stop=None):
+        """
+        Remove a directory tree, listing and emptying up to `workers`
+        directories at a time. A directory is removed by whoever finishes
+        the last of its subdirectories (or its own listing).
+        """
+        log.debug("rmtree {0} ({1} workers)".format(root_path, workers))
+
+        total = 0
+        if progress:
+            try:
+                total = int(self.fs.getxattr(root_path, "ceph.dir.rentries"))
+            except (cephfs.Error, ValueError):
+                pass
+
+        lock = threading.Lock()
+        removed = [0]
+
+        class Dir(object):
+            def __init__(self, path, parent):
+                self.path = path
+                self.parent = parent
+                # subdirectories left to remove, plus our own listing
+                self.pending = 1
+
+        def count(n):
+            with lock:
+                removed[0] += n
+                total_removed = removed[0]
+            if progress and (n > 1 or total_removed % 1000 == 0):
+                progress(total_removed, max(total, total_removed))
+
+        def done(d):
+            while d:
+                with lock:
+                    d.pending -= 1
+                    if d.pending:
+                        return
+                self.fs.rmdir(d.path)
+                count(1)
+                d = d.parent
+
+        def empty(d, push):
+            unlinked = 0
+            dir_handle = self.fs.opendir(d.path)
+            try:
+                entry = self.fs.readdir(dir_handle)
+                while entry:
+                    if stop is not None and stop.is_set():
+                        raise PurgeInterrupted(root_path)
+                    if entry.d_name not in [b".", b".."]:
+                        # Do not use os.path.join because it is sensitive
+                        # to string encoding, we just pass through dnames
+                        # as byte arrays
+                        d_full = d.path + b"/" + entry.d_name
+                        if entry.is_dir():
+                            with lock:
+                                d.pending += 1
+                            push(Dir(d_full, d))
+                        else:
+                            self.fs.unlink(d_full)
+                            unlinked += 1
+                            if unlinked == 1000:
+                                count(unlinked)
+                                unlinked = 0
+                    entry = self.fs.readdir(dir_handle)
+            finally:
+                self.fs.closedir(dir_handle)
+            if unlinked:
+                count(unlinked)
+            done(d)
+
+        self._walk_parallel(Dir(to_bytes(root_path), None), empty, workers)
+
+        if progress:
+            progress(removed[0], max(total, removed[0]))
+
     def _get_ancestor_xattr(self, path, attr):
         """
         Helper for reading layout information: if this xattr is missing
@@ -815,28 +989,61 @@ class CephFSVolumeClient(object):
             log.error(msg)
             raise CephFSVolumeClientError(msg)
 
+    def _metadata_version(self, fd):
+        return self.fs.fstat(fd).st_ino, self.fs.fchange_attr(fd)
+
     def _metadata_get(self, path):
         """
         Return a deserialized JSON object, or None
         """
         fd = self.fs.open(path, "r")
-        # TODO iterate instead of assuming file < 4MB
-        read_bytes = self.fs.read(fd, 0, 4096 * 1024)
-        self.fs.close(fd)
-        if read_bytes:
-            return json.loads(read_bytes.decode())
-        else:
-            return None
+        try:
+            version = self._metadata_version(fd)
+            with self._metadata_cache_lock:
+                cached = self._metadata_cache.get(path)
+            if cached is not None and cached[0] == version:
+                serialized = cached[1]
+            else:
+                chunks = []
+                offset = 0
+                while True:
+                    buf = self.fs.read(fd, offset, METADATA_IO_SIZE)
+                    if not buf:
+                        break
+                    chunks.append(buf)
+                    offset += len(buf)
+                serialized = b"".join(chunks)
+                with self._metadata_cache_lock:
+                    self._metadata_cache[path] = (version, serialized)
+        finally:
+            self.fs.close(fd)
+
+        return json.loads(serialized.decode()) if serialized else None
 
     def _metadata_set(self, path, data):
-        serialized = json.dumps(data)
+        serialized = to_bytes(json.dumps(data))
         fd = self.fs.open(path, "w")
         try:
-            self.fs.write(fd, to_bytes(serialized), 0)
+            for offset in range(0, len(serialized), METADATA_IO_SIZE):
+                self.fs.write(fd, serialized[offset:offset + METADATA_IO_SIZE],
+                              offset)
             self.fs.fsync(fd, 0)
+            version = self._metadata_version(fd)
+        except Exception:
+            with self._metadata_cache_lock:
+                self._metadata_cache.pop(path, None)
+            raise
         finally:
             self.fs.close(fd)
 
+        with self._metadata_cache_lock:
+            self._metadata_cache[path] = (version, serialized)
+
+    def _metadata_unlink(self, path):
+        with self._metadata_cache_lock:
+            self._metadata_cache.pop(path, None)
+        self.fs.unlink(path)
+
     def _lock(self, path):
         @contextmanager
         def fn():
@@ -1198,7 +1405,7 @@ class CephFSVolumeClient(object):
                     auth_id=auth_id, volume=volume_path.volume_id
                 ))
                 # Clean up the auth meta file of an auth ID
-                self.fs.unlink(self._auth_metadata_path(auth_id))
+                self._metadata_unlink(self._auth_metadata_path(auth_id))
                 return
 
             if volume_path_str not in auth_meta['volumes']:
@@ -1222,7 +1429,7 @@ class CephFSVolumeClient(object):
 
             # Clean up auth meta file
             if not auth_meta['volumes']:
-                self.fs.unlink(self._auth_metadata_path(auth_id))
+                self._metadata_unlink(self._auth_metadata_path(auth_id))
                 return
 
             auth_meta['dirty'] = False
@@ -1430,15 +1637,130 @@ class CephFSVolumeClient(object):
 
         return self._snapshot_destroy(self._get_group_path(group_id), snapshot_name)
 
-    def _cp_r(self, src, dst):
-        # TODO
-        raise NotImplementedError()
+    def _copy_attrs(self, src_path, dst_path, src_stat):
+        self.fs.chmod(dst_path, stat.S_IMODE(src_stat.st_mode))
+        self.fs.chown(dst_path, src_stat.st_uid, src_stat.st_gid)
+        for name in self.fs.listxattr(src_path):
+            # skip the virtual ceph.* attributes (layouts, quotas...)
+            if name.startswith(b"ceph."):
+                continue
+            self.fs.setxattr(dst_path, name,
+                             self.fs.getxattr(src_path, name, XATTR_MAX_SIZE),
+                             0)
 
-    def clone_volume_to_existing(self, dest_volume_path, src_volume_path, src_snapshot_name):
+    def _copy_file(self, src_path, dst_path, src_stat, copied):
+        src_fd = self.fs.open(src_path, os.O_RDONLY)
+        try:
+            dst_fd = self.fs.open(dst_path,
+                                  os.O_WRONLY | os.O_CREAT | os.O_TRUNC,
+                                  stat.S_IMODE(src_stat.st_mode))
+            try:
+                offset = 0
+                while True:
+                    buf = self.fs.read(src_fd, offset, COPY_BLOCK_SIZE)
+                    if not buf:
+                        break
+                    self.fs.write(dst_fd, buf, offset)
+                    offset += len(buf)
+                    copied(len(buf), 0)
+            finally:
+                self.fs.close(dst_fd)
+        finally:
+            self.fs.close(src_fd)
+
+    def _cp_r(self, src, dst, workers=4, progress=None):
+        """
+        Copy the contents of the directory src into the existing directory
+        dst, up to `workers` directories at a time, preserving modes,
+        ownership, extended attributes and symbolic links.  Hard links are
+        copied as separate files, and special files are skipped.
+
+        :param progress: optional callable, passed the number of bytes and
+                         of files copied so far after each block
+        :return: dict with the bytes and files copied, and the seconds it took
+        """
+        log.info("cp_r {0} -> {1} ({2} workers)".format(src, dst, workers))
+        start = time.time()
+
+        lock = threading.Lock()
+        # [bytes, files]
+        totals = [0, 0]
+
+        def copied(nbytes, nfiles):
+            with lock:
+                totals[0] += nbytes
+                totals[1] += nfiles
+                copied_bytes, copied_files = totals
+            if progress:
+                progress(copied_bytes, copied_files)
+
+        def copy_dir(item, push):
+            src_dir, dst_dir = item
+            dir_handle = self.fs.opendir(src_dir)
+            try:
+                entry = self.fs.readdir(dir_handle)
+                while entry:
+                    if entry.d_name not in [b".", b".."]:
+                        src_path = src_dir + b"/" + entry.d_name
+                        dst_path = dst_dir + b"/" + entry.d_name
+                        src_stat = self.fs.lstat(src_path)
+                        mode = src_stat.st_mode
+                        if stat.S_ISDIR(mode):
+                            try:
+                                self.fs.mkdir(dst_path, stat.S_IMODE(mode))
+                            except cephfs.ObjectExists:
+                                pass
+                            self._copy_attrs(src_path, dst_path, src_stat)
+                            push((src_path, dst_path))
+                        elif stat.S_ISLNK(mode):
+                            target = self.fs.readlink(src_path,
+                                                      src_stat.st_size)
+                            try:
+                                self.fs.symlink(target, dst_path)
+                            except cephfs.ObjectExists:
+                                pass
+                            self.fs.lchown(dst_path, src_stat.st_uid,
+                                           src_stat.st_gid)
+                        elif stat.S_ISREG(mode):
+                            self._copy_file(src_path, dst_path, src_stat,
+                                            copied)
+                            self._copy_attrs(src_path, dst_path, src_stat)
+                            copied(0, 1)
+                        else:
+                            log.warning("cp_r: skipping special file {0}".format(
+                                src_path))
+                    entry = self.fs.readdir(dir_handle)
+            finally:
+                self.fs.closedir(dir_handle)
+
+        src = to_bytes(src)
+        dst = to_bytes(dst)
+        self._copy_attrs(src, dst, self.fs.stat(src))
+        self._walk_parallel((src, dst), copy_dir, workers)
+
+        seconds = time.time() - start
+        log.info("cp_r {0} -> {1}: {2} files, {3} bytes in {4:.1f}s "
+                 "({5:.1f} MB/s)".format(src, dst, totals[1], totals[0],
+                                         seconds,
+                                         totals[0] / (seconds or 1) / 2**20))
+        return {
+            'bytes': totals[0],
+            'files': totals[1],
+            'seconds': seconds,
+        }
+
+    def clone_volume_to_existing(self, dest_volume_path, src_volume_path,
+                                 src_snapshot_name, workers=4, progress=None):
+        """
+        Copy the contents of a volume snapshot into another volume.  See
+        _cp_r for workers and progress.
+
+        :return: dict with the bytes and files copied, and the seconds it took
+        """
         dest_fs_path = self._get_path(dest_volume_path)
         src_snapshot_path = self._snapshot_path(self._get_path(src_volume_path), src_snapshot_name)
 
-        self._cp_r(src_snapshot_path, dest_fs_path)
+        return self._cp_r(src_snapshot_path, dest_fs_path, workers, progress)
 
     def put_object(self, pool_name, object_name, data):
         """
@@ -147,6 +147,9 @@ cdef extern from "cephfs/libcephfs.h" nogil:
     int ceph_fsync(ceph_mount_info *cmount, int fd, int syncdataonly)
     int ceph_conf_parse_argv(ceph_mount_info *cmount, int argc, const char **argv)
     int ceph_chmod(ceph_mount_info *cmount, const char *path, mode_t mode)
+    int ceph_chown(ceph_mount_info *cmount, const char *path, int uid, int gid)
+    int ceph_lchown(ceph_mount_info *cmount, const char *path, int uid, int gid)
+    int ceph_listxattr(ceph_mount_info *cmount, const char *path, char *list, size_t size)
     int64_t ceph_lseek(ceph_mount_info *cmount, int fd, int64_t offset, int whence)
     void ceph_buffer_free(char *buf)
     mode_t ceph_umask(ceph_mount_info *cmount, mode_t mode)
@@ -782,6 +785,49 @@ cdef class LibCephFS(object):
         if ret < 0:
             raise make_ex(ret, "error in chmod '%s'" % path)
 
+    def chown(self, path, uid, gid):
+        """
+        Change the owner and group of a file, following symbolic links.
+
+        :param path: the path of the file.
+        :param uid: the new owner, -1 to leave it unchanged.
+        :param gid: the new group, -1 to leave it unchanged.
+        """
+        self.require_state("mounted")
+        path = cstr(path, 'path')
+        if not isinstance(uid, int) or not isinstance(gid, int):
+            raise TypeError('uid and gid must be ints')
+        cdef:
+            char* _path = path
+            int _uid = uid
+            int _gid = gid
+        with nogil:
+            ret = ceph_chown(self.cluster, _path, _uid, _gid)
+        if ret < 0:
+            raise make_ex(ret, "error in chown '%s'" % path)
+
+    def lchown(self, path, uid, gid):
+        """
+        Change the owner and group of a file, without following symbolic
+        links.
+
+        :param path: the path of the file.
+        :param uid: the new owner, -1 to leave it unchanged.
+        :param gid: the new group, -1 to leave it unchanged.
+        """
+        self.require_state("mounted")
+        path = cstr(path, 'path')
+        if not isinstance(uid, int) or not isinstance(gid, int):
+            raise TypeError('uid and gid must be ints')
+        cdef:
+            char* _path = path
+            int _uid = uid
+            int _gid = gid
+        with nogil:
+            ret = ceph_lchown(self.cluster, _path, _uid, _gid)
+        if ret < 0:
+            raise make_ex(ret, "error in lchown '%s'" % path)
+
     def mkdirs(self, path, mode):
         """
         Create multiple directories at once.
@@ -1019,6 +1065,36 @@ cdef class LibCephFS(object):
         finally:
             free(ret_buf)
 
+    def listxattr(self, path, size=65536):
+        """
+        List the names of the extended attributes of a file.
+
+        :param path: the path to the file
+        :param size: the size of the pre-allocated buffer
+        :rtype list: the attribute names, as bytes
+        """
+        self.require_state("mounted")
+
+        path = cstr(path, 'path')
+
+        cdef:
+            char* _path = path
+
+            size_t ret_length = size
+            char *ret_buf = NULL
+
+        try:
+            ret_buf = <char *>realloc_chk(ret_buf, ret_length)
+            with nogil:
+                ret = ceph_listxattr(self.cluster, _path, ret_buf, ret_length)
+
+            if ret < 0:
+                raise make_ex(ret, "error in listxattr")
+
+            return [name for name in ret_buf[:ret].split(b'\0') if name]
+        finally:
+            free(ret_buf)
+
     def setxattr(self, path, name, value, flags):
         """
         Set an extended attribute on a file.
@@ -1078,6 +1154,37 @@ cdef class LibCephFS(object):
                           st_mtime=datetime.fromtimestamp(stx.stx_mtime.tv_sec),
                           st_ctime=datetime.fromtimestamp(stx.stx_ctime.tv_sec))
 
+    def lstat(self, path):
+        """
+        Get a file's extended statistics and attributes, without following
+        symbolic links.
+
+        :param path: the file, directory or symbolic link to get the
+                     statistics of.
+        """
+        self.require_state("mounted")
+        path = cstr(path, 'path')
+
+        cdef:
+            char* _path = path
+            statx stx
+
+        with nogil:
+            # FIXME: replace magic numbers with CEPH_STATX_BASIC_STATS and
+            # AT_SYMLINK_NOFOLLOW
+            ret = ceph_statx(self.cluster, _path, &stx, 0x7ffu, 0x100)
+        if ret < 0:
+            raise make_ex(ret, "error in lstat: %s" % path)
+        return StatResult(st_dev=stx.stx_dev, st_ino=stx.stx_ino,
+                          st_mode=stx.stx_mode, st_nlink=stx.stx_nlink,
+                          st_uid=stx.stx_uid, st_gid=stx.stx_gid,
+                          st_rdev=stx.stx_rdev, st_size=stx.stx_size,
+                          st_blksize=stx.stx_blksize,
+                          st_blocks=stx.stx_blocks,
+                          st_atime=datetime.fromtimestamp(stx.stx_atime.tv_sec),
+                          st_mtime=datetime.fromtimestamp(stx.stx_mtime.tv_sec),
+                          st_ctime=datetime.fromtimestamp(stx.stx_ctime.tv_sec))
+
     def fstat(self, fd):
         """
         Get an open file's extended statistics and attributes.
@@ -1107,6 +1214,28 @@ cdef class LibCephFS(object):
                           st_mtime=datetime.fromtimestamp(stx.stx_mtime.tv_sec),
                           st_ctime=datetime.fromtimestamp(stx.stx_ctime.tv_sec))
 
+    def fchange_attr(self, fd):
+        """
+        Get an open file's change attribute, which the MDS bumps on every
+        data or metadata change to the file.
+
+        :param fd: the file descriptor of the file.
+        """
+        self.require_state("mounted")
+        if not isinstance(fd, int):
+            raise TypeError('fd must be an int')
+
+        cdef:
+            int _fd = fd
+            statx stx
+
+        with nogil:
+            # FIXME: replace magic number with CEPH_STATX_VERSION
+            ret = ceph_fstatx(self.cluster, _fd, &stx, 0x1000u, 0)
+        if ret < 0:
+            raise make_ex(ret, "error in fchange_attr")
+        return stx.stx_version
+
     def symlink(self, existing, newname):
         """
         Creates a symbolic link.
@@ -1168,7 +1297,8 @@ cdef class LibCephFS(object):
                 ret = ceph_readlink(self.cluster, _path, buf, _size)
             if ret < 0:
                 raise make_ex(ret, "error in readlink")
-            return buf
+            # the link target is not NUL terminated
+            return buf[:ret]
         finally:
             free(buf)
 
@@ -3,7 +3,6 @@
 Balance PG distribution across OSDs.
 """
 
-import copy
 import errno
 import json
 import math
@@ -11,37 +10,131 @@ import random
 import six
 import time
 from mgr_module import MgrModule, CommandResult
-from threading import Event
+from threading import Event, Lock, Thread
+from six.moves.queue import Queue, Empty
 from mgr_module import CRUSHMap
 
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
 TIME_FORMAT = '%Y-%m-%d_%H:%M:%S'
 
 class MappingState:
-    def __init__(self, osdmap, pg_dump, desc=''):
+    def __init__(self, osdmap, pg_dump, desc='', parent=None, pools=None):
+        """
+        If parent is given, the state is derived from it: only the PGs of the
+        pools in pools are re-mapped against osdmap, everything else (and the
+        osdmap dump) is shared with the parent.  This is only valid when the
+        two osdmaps differ by crush weights.
+        """
         self.desc = desc
         self.osdmap = osdmap
-        self.osdmap_dump = self.osdmap.dump()
         self.crush = osdmap.get_crush()
         self.crush_dump = self.crush.dump()
         self.pg_dump = pg_dump
-        self.pg_stat = {
-            i['pgid']: i['stat_sum'] for i in pg_dump.get('pg_stats', [])
-        }
-        osd_poolids = [p['pool'] for p in self.osdmap_dump.get('pools', [])]
-        pg_poolids = [p['poolid'] for p in pg_dump.get('pool_stats', [])]
-        self.poolids = set(osd_poolids) & set(pg_poolids)
-        self.pg_up = {}
-        self.pg_up_by_poolid = {}
-        for poolid in self.poolids:
+        self.parent = parent
+        self._pg_arrays = {}
+        self._pool_osd_totals = {}
+        if parent is None:
+            self.osdmap_dump = self.osdmap.dump()
+            self.pg_stat = {
+                i['pgid']: i['stat_sum'] for i in pg_dump.get('pg_stats', [])
+            }
+            osd_poolids = [p['pool'] for p in self.osdmap_dump.get('pools', [])]
+            pg_poolids = [p['poolid'] for p in pg_dump.get('pool_stats', [])]
+            self.poolids = set(osd_poolids) & set(pg_poolids)
+            self.remapped_poolids = set(self.poolids)
+            self.pg_up = {}
+            self.pg_up_by_poolid = {}
+        else:
+            self.osdmap_dump = parent.osdmap_dump
+            self.pg_stat = parent.pg_stat
+            self.poolids = parent.poolids
+            self.remapped_poolids = set(pools) & self.poolids
+            self.pg_up = dict(parent.pg_up)
+            self.pg_up_by_poolid = dict(parent.pg_up_by_poolid)
+            for poolid in self.poolids - self.remapped_poolids:
+                if poolid in parent._pg_arrays:
+                    self._pg_arrays[poolid] = parent._pg_arrays[poolid]
+                if poolid in parent._pool_osd_totals:
+                    self._pool_osd_totals[poolid] = \
+                        parent._pool_osd_totals[poolid]
+        for poolid in self.remapped_poolids:
             self.pg_up_by_poolid[poolid] = osdmap.map_pool_pgs_up(poolid)
             for a,b in six.iteritems(self.pg_up_by_poolid[poolid]):
                 self.pg_up[a] = b
 
+    def remap(self, osdmap, changed_osds, desc=''):
+        """
+        Return the MappingState for osdmap, which differs from ours only by
+        the crush (weight-set) weights of changed_osds.  Only the pools
+        whose crush rule takes a subtree containing one of those osds are
+        re-mapped.
+        """
+        changed_osds = set(changed_osds)
+        pools = set()
+        for rootid in self.crush.find_takes():
+            if changed_osds & set(self.crush.get_osds_under(rootid)):
+                pools.update(self.osdmap.get_pools_by_take(rootid))
+        return MappingState(osdmap, self.pg_dump, desc, parent=self,
+                            pools=pools)
+
+    def pool_pg_arrays(self, poolid):
+        """
+        Return (up, objects, bytes) numpy arrays for a pool: the PG -> OSD
+        up matrix (padded with ITEM_NONE) and per-PG object and byte counts.
+        """
+        if poolid not in self._pg_arrays:
+            pm = self.pg_up_by_poolid[poolid]
+            pgids = list(pm.keys())
+            width = max([len(pm[pgid]) for pgid in pgids] + [0])
+            up = np.full((len(pgids), width), CRUSHMap.ITEM_NONE,
+                         dtype=np.int64)
+            for i, pgid in enumerate(pgids):
+                up[i, :len(pm[pgid])] = pm[pgid]
+            stats = [self.pg_stat[pgid] for pgid in pgids]
+            self._pg_arrays[poolid] = (
+                up,
+                np.array([s['num_objects'] for s in stats], dtype=np.int64),
+                np.array([s['num_bytes'] for s in stats], dtype=np.int64),
+            )
+        return self._pg_arrays[poolid]
+
+    def pool_osd_totals(self, poolid):
+        """
+        Return the pool's pg instances as (osds, objects, bytes) arrays, one
+        entry per (pg, up osd), and the per-osd pgs/objects/bytes totals.
+        """
+        if poolid not in self._pool_osd_totals:
+            up, pg_objects, pg_bytes = self.pool_pg_arrays(poolid)
+            valid = up != CRUSHMap.ITEM_NONE
+            osds = up[valid]
+            objects = np.broadcast_to(pg_objects[:, None], up.shape)[valid]
+            bytes = np.broadcast_to(pg_bytes[:, None], up.shape)[valid]
+            by_osd = {
+                'pgs': np.bincount(osds),
+                'objects': np.zeros(len(osds) and int(osds.max()) + 1,
+                                    dtype=np.int64),
+            }
+            by_osd['bytes'] = np.zeros_like(by_osd['objects'])
+            np.add.at(by_osd['objects'], osds, objects)
+            np.add.at(by_osd['bytes'], osds, bytes)
+            self._pool_osd_totals[poolid] = ((osds, objects, bytes), by_osd)
+        return self._pool_osd_totals[poolid]
+
     def calc_misplaced_from(self, other_ms):
         num = len(other_ms.pg_up)
+        if self.parent is other_ms:
+            # pools which were not re-mapped are unchanged
+            pgids = [pgid for poolid in self.remapped_poolids
+                     for pgid in other_ms.pg_up_by_poolid.get(poolid, {})]
+        else:
+            pgids = other_ms.pg_up
         misplaced = 0
-        for pgid, before in six.iteritems(other_ms.pg_up):
-            if before != self.pg_up.get(pgid, []):
+        for pgid in pgids:
+            if other_ms.pg_up[pgid] != self.pg_up.get(pgid, []):
                 misplaced += 1
         if num > 0:
             return float(misplaced) / float(num)
@@ -56,14 +149,22 @@ class Plan:
 
         self.osd_weights = {}
         self.compat_ws = {}
+        self.upmap_timing = []
         self.inc = ms.osdmap.new_incremental()
 
-    def final_state(self):
+    def final_state(self, changed_osds=None):
+        """
+        If changed_osds is given, the plan must only change the compat
+        weight-set weights of those osds, and only the affected pools are
+        re-mapped.
+        """
         self.inc.set_osd_reweights(self.osd_weights)
         self.inc.set_crush_compat_weight_set_weights(self.compat_ws)
-        return MappingState(self.initial.osdmap.apply_incremental(self.inc),
-                            self.initial.pg_dump,
-                            'plan %s final' % self.name)
+        osdmap = self.initial.osdmap.apply_incremental(self.inc)
+        desc = 'plan %s final' % self.name
+        if changed_osds is not None and not self.osd_weights:
+            return self.initial.remap(osdmap, changed_osds, desc)
+        return MappingState(osdmap, self.initial.pg_dump, desc)
 
     def dump(self):
         return json.dumps(self.inc.dump(), indent=4)
@@ -74,6 +175,10 @@ class Plan:
         ls.append('# starting crush version %d' %
                   self.initial.osdmap.get_crush_version())
         ls.append('# mode %s' % self.mode)
+        for t in self.upmap_timing:
+            ls.append('# crush_rule %s pools %s: %d/%d changes in %.3fs' %
+                      (t['crush_rule'], ','.join(t['pools']), t['changes'],
+                       t['max_iterations'], t['seconds']))
         if len(self.compat_ws) and \
            not CRUSHMap.have_default_choose_args(self.initial.crush_dump):
             ls.append('ceph osd crush weight-set create-compat')
@@ -196,6 +301,45 @@ class Eval:
             }
         return r
 
+    def calc_stats_vectorized(self, count, target, total):
+        """
+        numpy version of calc_stats().
+        """
+        num = max(len(target), 1)
+        r = {}
+        for t in ('pgs', 'objects', 'bytes'):
+            if total[t] == 0:
+                r[t] = {
+                    'avg': 0,
+                    'stddev': 0,
+                    'sum_weight': 0,
+                    'score': 0,
+                }
+                continue
+
+            avg = float(total[t]) / float(num)
+            keys = list(count[t].keys())
+            v = np.array([count[t][k] for k in keys], dtype=np.float64)
+            w = np.array([target[k] for k in keys], dtype=np.float64)
+            adjusted = np.zeros(len(keys))
+            np.divide(v, w, out=adjusted, where=w != 0)
+            adjusted /= float(num)
+            over = adjusted > avg
+            x = (adjusted[over] - avg) / avg / math.sqrt(2.0)
+            erf = np.array([math.erf(i) for i in x.tolist()])
+            score = float(np.dot(w[over], erf)) if len(erf) else 0.0
+            sum_weight = float(w[over].sum())
+            dev = float(np.square(avg - adjusted).sum())
+            stddev = math.sqrt(dev / float(max(num - 1, 1)))
+            score = score / max(sum_weight, 1)
+            r[t] = {
+                'avg': avg,
+                'stddev': stddev,
+                'sum_weight': sum_weight,
+                'score': score,
+            }
+        return r
+
 class Module(MgrModule):
     MODULE_OPTIONS = [
         {
@@ -306,6 +450,22 @@ class Module(MgrModule):
             'long_desc': 'If the ratio between the fullest and least-full OSD is below this value then we stop trying to optimize placement.',
             'runtime': True,
         },
+        {
+            'name': 'upmap_max_workers',
+            'type': 'uint',
+            'default': 4,
+            'min': 1,
+            'desc': 'maximum number of crush rule groups to optimize concurrently',
+            'runtime': True,
+        },
+        {
+            'name': 'upmap_max_time',
+            'type': 'secs',
+            'default': 0,
+            'desc': 'time budget of an upmap optimization',
+            'long_desc': 'Crush rule groups which have not been started when the budget is exhausted are skipped until the next optimization. 0 means no limit.',
+            'runtime': True,
+        },
         {
             'name': 'pool_ids',
             'type': 'str',
@@ -363,6 +523,11 @@ class Module(MgrModule):
             "desc": "Evaluate data distribution for the current cluster or specific pool or specific plan (verbosely)",
             "perm": "r",
         },
+        {
+            "cmd": "balancer eval-bench name=option,type=CephString,req=false",
+            "desc": "Compare the python and vectorized evaluation of data distribution (time and score)",
+            "perm": "r",
+        },
         {
             "cmd": "balancer optimize name=plan,type=CephString name=pools,type=CephString,n=N,req=false",
             "desc": "Run optimizer to create a new plan",
@@ -487,7 +652,8 @@ class Module(MgrModule):
             final = set(final) - set(to_delete)
             self.set_module_option('pool_ids', ','.join(final))
             return (0, '', '')
-        elif command['prefix'] == 'balancer eval' or command['prefix'] == 'balancer eval-verbose':
+        elif command['prefix'] in ['balancer eval', 'balancer eval-verbose',
+                                   'balancer eval-bench']:
             verbose = command['prefix'] == 'balancer eval-verbose'
             pools = []
             if 'option' in command:
@@ -508,6 +674,8 @@ class Module(MgrModule):
                 ms = MappingState(self.get_osdmap(),
                                   self.get("pg_dump"),
                                   'current cluster')
+            if command['prefix'] == 'balancer eval-bench':
+                return self.bench_eval(ms, pools)
             return (0, self.evaluate(ms, pools, verbose=verbose), '')
         elif command['prefix'] == 'balancer optimize':
             pools = []
@@ -603,19 +771,19 @@ class Module(MgrModule):
             if self.active and self.time_permit():
                 self.log.debug('Running')
                 name = 'auto_%s' % time.strftime(TIME_FORMAT, time.gmtime())
-                osdmap = self.get_osdmap()
+                plan = self.plan_create(name, self.get_osdmap(), [])
+                # reuse the plan's osdmap dump for the rest of this cycle
+                osdmap_dump = plan.initial.osdmap_dump
                 allow = self.get_module_option('pool_ids')
-                final = []
                 if allow is not '':
                     allow = allow.split(',')
-                    valid = [str(p['pool']) for p in osdmap.dump().get('pools', [])]
+                    valid = [str(p['pool']) for p in osdmap_dump.get('pools', [])]
                     final = set(allow) & set(valid)
                     if set(allow) - set(valid): # some pools were gone, prune
                         self.set_module_option('pool_ids', ','.join(final))
-                    pool_name_by_id = dict((p['pool'], p['pool_name']) for p in osdmap.dump().get('pools', []))
+                    pool_name_by_id = dict((p['pool'], p['pool_name']) for p in osdmap_dump.get('pools', []))
                     final = [int(p) for p in final]
-                    final = [pool_name_by_id[p] for p in final if p in pool_name_by_id]
-                plan = self.plan_create(name, osdmap, final)
+                    plan.pools = [pool_name_by_id[p] for p in final if p in pool_name_by_id]
                 r, detail = self.optimize(plan)
                 if r == 0:
                     self.execute(plan)
@@ -637,7 +805,7 @@ class Module(MgrModule):
         if name in self.plans:
             del self.plans[name]
 
-    def calc_eval(self, ms, pools):
+    def calc_eval(self, ms, pools, vectorize=None):
         pe = Eval(ms)
         pool_rule = {}
         pool_info = {}
@@ -663,7 +831,6 @@ class Module(MgrModule):
                        for a in ms.osdmap_dump.get('osds',[]) if a['weight'] > 0 }
 
         # get expected distributions by root
-        actual_by_root = {}
         rootids = ms.crush.find_takes()
         roots = []
         for rootid in rootids:
@@ -691,15 +858,6 @@ class Module(MgrModule):
             assert len(adjusted_map) == 0 or sum_w > 0
             pe.target_by_root[root] = { osd: w / sum_w
                                         for osd,w in six.iteritems(adjusted_map) }
-            actual_by_root[root] = {
-                'pgs': {},
-                'objects': {},
-                'bytes': {},
-            }
-            for osd in pe.target_by_root[root]:
-                actual_by_root[root]['pgs'][osd] = 0
-                actual_by_root[root]['objects'][osd] = 0
-                actual_by_root[root]['bytes'][osd] = 0
             pe.total_by_root[root] = {
                 'pgs': 0,
                 'objects': 0,
@@ -710,6 +868,60 @@ class Module(MgrModule):
         self.log.debug('target_by_root %s' % pe.target_by_root)
 
         # pool and root actual
+        if vectorize is None:
+            vectorize = np is not None
+        if vectorize:
+            self.calc_actual_vectorized(pe, ms, pool_info)
+        else:
+            self.calc_actual(pe, ms, pool_info)
+        self.log.debug('actual_by_pool %s' % pe.actual_by_pool)
+        self.log.debug('actual_by_root %s' % pe.actual_by_root)
+
+        # average and stddev and score
+        calc_stats = pe.calc_stats_vectorized if vectorize else pe.calc_stats
+        pe.stats_by_root = {
+            a: calc_stats(
+                b,
+                pe.target_by_root[a],
+                pe.total_by_root[a]
+            ) for a, b in six.iteritems(pe.count_by_root)
+        }
+        self.log.debug('stats_by_root %s' % pe.stats_by_root)
+
+	# the scores are already normalized
+        pe.score_by_root = {
+            r: {
+                'pgs': pe.stats_by_root[r]['pgs']['score'],
+                'objects': pe.stats_by_root[r]['objects']['score'],
+                'bytes': pe.stats_by_root[r]['bytes']['score'],
+            } for r in pe.total_by_root.keys()
+        }
+        self.log.debug('score_by_root %s' % pe.score_by_root)
+
+        # get the list of score metrics, comma separated
+        metrics = self.get_module_option('crush_compat_metrics').split(',')
+
+        # total score is just average of normalized stddevs
+        pe.score = 0.0
+        for r, vs in six.iteritems(pe.score_by_root):
+            for k, v in six.iteritems(vs):
+                if k in metrics:
+                    pe.score += v
+        pe.score /= len(metrics) * len(roots)
+        return pe
+
+    def calc_actual(self, pe, ms, pool_info):
+        actual_by_root = {}
+        for root in pe.total_by_root:
+            actual_by_root[root] = {
+                'pgs': {},
+                'objects': {},
+                'bytes': {},
+            }
+            for osd in pe.target_by_root[root]:
+                actual_by_root[root]['pgs'][osd] = 0
+                actual_by_root[root]['objects'][osd] = 0
+                actual_by_root[root]['bytes'][osd] = 0
         for pool, pi in six.iteritems(pool_info):
             poolid = pi['pool']
             pm = ms.pg_up_by_poolid[poolid]
@@ -809,45 +1021,112 @@ class Module(MgrModule):
                     for k, v in six.iteritems(actual_by_root[root]['bytes'])
                 },
             }
-        self.log.debug('actual_by_pool %s' % pe.actual_by_pool)
-        self.log.debug('actual_by_root %s' % pe.actual_by_root)
 
-        # average and stddev and score
-        pe.stats_by_root = {
-            a: pe.calc_stats(
-                b,
-                pe.target_by_root[a],
-                pe.total_by_root[a]
-            ) for a, b in six.iteritems(pe.count_by_root)
-        }
-        self.log.debug('stats_by_root %s' % pe.stats_by_root)
-
-	# the scores are already normalized
-        pe.score_by_root = {
-            r: {
-                'pgs': pe.stats_by_root[r]['pgs']['score'],
-                'objects': pe.stats_by_root[r]['objects']['score'],
-                'bytes': pe.stats_by_root[r]['bytes']['score'],
-            } for r in pe.total_by_root.keys()
+    def calc_actual_vectorized(self, pe, ms, pool_info):
+        """
+        Same aggregation as calc_actual(), but done over the PG -> OSD
+        matrix of each pool with numpy instead of per-PG python loops.
+        """
+        roots = list(pe.total_by_root.keys())
+        root_index = {root: i for i, root in enumerate(roots)}
+        size = max([ms.osdmap_dump.get('max_osd', 0)] +
+                   [osd + 1 for wm in six.itervalues(pe.target_by_root)
+                    for osd in wm])
+        root_totals = {
+            t: np.zeros((len(roots), size), dtype=np.int64)
+            for t in ('pgs', 'objects', 'bytes')
         }
-        self.log.debug('score_by_root %s' % pe.score_by_root)
-
-        # get the list of score metrics, comma separated
-        metrics = self.get_module_option('crush_compat_metrics').split(',')
-
-        # total score is just average of normalized stddevs
-        pe.score = 0.0
-        for r, vs in six.iteritems(pe.score_by_root):
-            for k, v in six.iteritems(vs):
-                if k in metrics:
-                    pe.score += v
-        pe.score /= len(metrics) * len(roots)
-        return pe
-
+        for pool, pi in six.iteritems(pool_info):
+            (osds, objects, bytes), by_osd = ms.pool_osd_totals(pi['pool'])
+            width = max(size, len(by_osd['pgs']))
+
+            # pick a root to associate each pg instance with: the first
+            # root of the pool containing the osd.  note that this is
+            # imprecise if the roots have overlapping children.
+            # FIXME: divide bytes by k for EC pools.
+            root_of = np.full(width, -1, dtype=np.int64)
+            wanted = set()
+            for root in reversed(pe.pool_roots[pool]):
+                ids = list(pe.target_by_root[root])
+                root_of[ids] = root_index[root]
+                wanted.update(ids)
+            instance_root = root_of[osds]
+            in_root = instance_root >= 0
+
+            keys = sorted(wanted | set(np.flatnonzero(by_osd['pgs']).tolist()))
+
+            total = {
+                'pgs': int(in_root.sum()),
+                'objects': int(objects[in_root].sum()),
+                'bytes': int(bytes[in_root].sum()),
+            }
+            flat = instance_root[in_root] * size + osds[in_root]
+            per_instance = {
+                'pgs': None,
+                'objects': objects[in_root],
+                'bytes': bytes[in_root],
+            }
+            for t in ('pgs', 'objects', 'bytes'):
+                counts = by_osd[t].tolist()
+                counts += [0] * (width - len(counts))
+                if per_instance[t] is None:
+                    acc = np.bincount(flat, minlength=len(roots) * size)
+                else:
+                    acc = np.zeros(len(roots) * size, dtype=np.int64)
+                    np.add.at(acc, flat, per_instance[t])
+                root_totals[t] += acc.reshape(len(roots), size)
+                pe.count_by_pool.setdefault(pool, {})[t] = {
+                    k: counts[k] for k in keys
+                }
+                pe.actual_by_pool.setdefault(pool, {})[t] = {
+                    k: float(counts[k]) / float(max(total[t], 1)) for k in keys
+                }
+            pe.total_by_pool[pool] = total
+
+        for root, i in six.iteritems(root_index):
+            osds = list(pe.target_by_root[root])
+            pe.count_by_root[root] = {}
+            pe.actual_by_root[root] = {}
+            for t in ('pgs', 'objects', 'bytes'):
+                counts = root_totals[t][i]
+                total = int(counts.sum())
+                pe.total_by_root[root][t] = total
+                counts = counts[osds].tolist()
+                pe.count_by_root[root][t] = {
+                    osd: float(v) for osd, v in zip(osds, counts)
+                }
+                pe.actual_by_root[root][t] = {
+                    osd: float(v) / float(max(total, 1))
+                    for osd, v in zip(osds, counts)
+                }
     def evaluate(self, ms, pools, verbose=False):
         pe = self.calc_eval(ms, pools)
         return pe.show(verbose=verbose)
 
+    def bench_eval(self, ms, pools):
+        if np is None:
+            return (-errno.EOPNOTSUPP, '', 'numpy python module not found')
+        r = {}
+        evals = {}
+        for name, vectorize in [('python', False), ('vectorized', True)]:
+            start = time.time()
+            evals[name] = self.calc_eval(ms, pools, vectorize=vectorize)
+            r[name] = {
+                'seconds': time.time() - start,
+                'score': evals[name].score,
+            }
+        a = evals['python']
+        b = evals['vectorized']
+        max_diff = abs(a.score - b.score)
+        for root, scores in six.iteritems(a.score_by_root):
+            for k, v in six.iteritems(scores):
+                max_diff = max(max_diff, abs(v - b.score_by_root[root][k]))
+        r['max_score_difference'] = max_diff
+        r['identical'] = max_diff <= 1e-9 and \
+            a.count_by_pool == b.count_by_pool and \
+            a.total_by_root == b.total_by_root
+        return (0, json.dumps(r, indent=4, sort_keys=True), '')
+
     def optimize(self, plan):
         self.log.info('Optimize plan %s' % plan.name)
         plan.mode = self.get_module_option('mode')
@@ -898,6 +1177,8 @@ class Module(MgrModule):
         self.log.info('do_upmap')
         max_iterations = self.get_module_option('upmap_max_iterations')
         max_deviation = self.get_module_option('upmap_max_deviation')
+        max_workers = self.get_module_option('upmap_max_workers')
+        max_time = self.get_module_option('upmap_max_time')
 
         ms = plan.initial
         if len(plan.pools):
@@ -909,10 +1190,7 @@ class Module(MgrModule):
             self.log.info(detail)
             return -errno.ENOENT, detail
 
-        inc = plan.inc
-        total_did = 0
-        left = max_iterations
-        osdmap_dump = self.get_osdmap().dump()
+        osdmap_dump = ms.osdmap_dump
         pools_with_pg_merge = [p['pool_name'] for p in osdmap_dump.get('pools', [])
                                if p['pg_num'] > p['pg_num_target']]
         crush_rule_by_pool_name = dict((p['pool_name'], p['crush_rule']) for p in osdmap_dump.get('pools', []))
@@ -928,15 +1206,84 @@ class Module(MgrModule):
             if crush_rule not in pools_by_crush_rule:
                 pools_by_crush_rule[crush_rule] = []
             pools_by_crush_rule[crush_rule].append(pool)
-        classified_pools = list(pools_by_crush_rule.values())
+
+        budgets = self.upmap_budgets(ms, pools_by_crush_rule, max_iterations)
+        groups = []
+        for rule, it in six.iteritems(pools_by_crush_rule):
+            if budgets[rule] > 0:
+                groups.append((rule, it))
+            else:
+                self.log.info('no upmap iterations left for crush_rule %s, '
+                              'skipping pools %s' % (rule, it))
         # shuffle so all pools get equal (in)attention
-        random.shuffle(classified_pools)
-        for it in classified_pools:
-            did = ms.osdmap.calc_pg_upmaps(inc, max_deviation, left, it)
+        random.shuffle(groups)
+
+        # each rule group is calculated into its own incremental (the
+        # groups have disjoint pools), so they can run concurrently
+        deadline = time.time() + max_time if max_time else None
+        work = Queue()
+        for group in groups:
+            work.put(group)
+        results = {}
+        failed = {}
+        lock = Lock()
+
+        def worker(osdmap):
+            while True:
+                try:
+                    rule, it = work.get_nowait()
+                except Empty:
+                    return
+                if deadline and time.time() > deadline:
+                    self.log.info('upmap time budget exhausted, skipping '
+                                  'pools %s' % it)
+                    continue
+                try:
+                    inc = osdmap.new_incremental()
+                    start = time.time()
+                    did = osdmap.calc_pg_upmaps(inc, max_deviation,
+                                                budgets[rule], it)
+                except Exception as e:
+                    # keep draining the queue, the plan fails below
+                    self.log.exception('failed to calculate upmaps for '
+                                       'crush_rule %s pools %s' % (rule, it))
+                    with lock:
+                        failed[rule] = (it, e)
+                    continue
+                with lock:
+                    results[rule] = (it, inc, did, time.time() - start)
+
+        # calc_pg_upmaps runs without the GIL, and is not known to be safe
+        # on an osdmap (and crush map) shared between threads: every thread
+        # works on a copy of its own
+        threads = [Thread(target=worker,
+                          args=(ms.osdmap.apply_incremental(
+                              ms.osdmap.new_incremental()),))
+                   for i in range(min(max(max_workers, 1), len(groups)))]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        if failed:
+            return -errno.EIO, '; '.join(
+                'failed to calculate upmaps for pools %s: %s' % (it, e)
+                for it, e in six.itervalues(failed))
+
+        total_did = 0
+        plan.upmap_timing = []
+        for rule, (it, inc, did, elapsed) in six.iteritems(results):
+            self.log.info('crush_rule %s pools %s: %d/%d changes in %.3fs' %
+                          (rule, it, did, budgets[rule], elapsed))
+            plan.upmap_timing.append({
+                'crush_rule': rule,
+                'pools': it,
+                'changes': did,
+                'max_iterations': budgets[rule],
+                'seconds': elapsed,
+            })
+            plan.inc.merge_pg_upmaps(inc)
             total_did += did
-            left -= did
-            if left <= 0:
-                break
         self.log.info('prepared %d/%d changes' % (total_did, max_iterations))
         if total_did == 0:
             return -errno.EALREADY, 'Unable to find further optimization, ' \
@@ -944,6 +1291,54 @@ class Module(MgrModule):
                                     'or distribution is already perfect'
         return 0, ''
 
+    def upmap_budgets(self, ms, pools_by_crush_rule, max_iterations):
+        """
+        Split max_iterations between the crush rule groups, proportionally
+        to how far each group's PG distribution is from its crush weights.
+        """
+        pool_id = dict((p['pool_name'], p['pool'])
+                       for p in ms.osdmap_dump.get('pools', []))
+        weights_by_pool = {}
+        for rootid in ms.crush.find_takes():
+            weight_map = ms.crush.get_take_weight_osd_map(rootid)
+            for poolid in ms.osdmap.get_pools_by_take(rootid):
+                weights_by_pool.setdefault(poolid, {}).update(weight_map)
+
+        deviation = {}
+        for rule, it in six.iteritems(pools_by_crush_rule):
+            target = {}
+            pgs_by_osd = {}
+            for pool in it:
+                target.update(weights_by_pool.get(pool_id[pool], {}))
+                for up in six.itervalues(ms.pg_up_by_poolid.get(pool_id[pool], {})):
+                    for osd in up:
+                        if osd != CRUSHMap.ITEM_NONE:
+                            pgs_by_osd[osd] = pgs_by_osd.get(osd, 0) + 1
+            total_pgs = sum(pgs_by_osd.values())
+            total_weight = sum(target.values())
+            if total_pgs == 0 or total_weight <= 0:
+                deviation[rule] = 0.0
+                continue
+            deviation[rule] = sum(
+                abs(pgs_by_osd.get(osd, 0) - total_pgs * w / total_weight)
+                for osd, w in six.iteritems(target)) / total_pgs
+        self.log.debug('upmap deviation by crush_rule %s' % deviation)
+
+        total = sum(deviation.values())
+        if total <= 0:
+            # nothing to go on; split evenly
+            deviation = dict((rule, 1.0) for rule in pools_by_crush_rule)
+            total = float(len(deviation))
+        shares = dict((rule, max_iterations * d / total)
+                      for rule, d in six.iteritems(deviation))
+        budgets = dict((rule, int(s)) for rule, s in six.iteritems(shares))
+        # hand out what is left to the largest remainders
+        left = max_iterations - sum(budgets.values())
+        for rule in sorted(shares, key=lambda r: budgets[r] - shares[r])[:left]:
+            budgets[rule] += 1
+        self.log.debug('upmap iterations by crush_rule %s' % budgets)
+        return budgets
+
     def do_crush_compat(self, plan):
         self.log.info('do_crush_compat')
         max_iterations = self.get_module_option('crush_compat_max_iterations')
@@ -1009,13 +1404,13 @@ class Module(MgrModule):
             key = 'pgs'
 
         # go
-        best_ws = copy.deepcopy(orig_ws)
-        best_ow = copy.deepcopy(orig_osd_weight)
+        best_ws = dict(orig_ws)
+        best_ow = dict(orig_osd_weight)
         best_pe = pe
         left = max_iterations
         bad_steps = 0
-        next_ws = copy.deepcopy(best_ws)
-        next_ow = copy.deepcopy(best_ow)
+        next_ws = dict(best_ws)
+        next_ow = dict(best_ow)
         while left > 0:
             # adjust
             self.log.debug('best_ws %s' % best_ws)
@@ -1077,8 +1472,9 @@ class Module(MgrModule):
                         next_ws[osd] = next_ws[osd] / factor
 
             # recalc
-            plan.compat_ws = copy.deepcopy(next_ws)
-            next_ms = plan.final_state()
+            plan.compat_ws = dict(next_ws)
+            next_ms = plan.final_state(
+                [osd for osd, w in six.iteritems(next_ws) if orig_ws[osd] != w])
             next_pe = self.calc_eval(next_ms, plan.pools)
             next_misplaced = next_ms.calc_misplaced_from(ms)
             self.log.debug('Step result score %f -> %f, misplacing %f',
@@ -1090,8 +1486,8 @@ class Module(MgrModule):
                                    next_misplaced, max_misplaced)
                     break
                 step /= 2.0
-                next_ws = copy.deepcopy(best_ws)
-                next_ow = copy.deepcopy(best_ow)
+                next_ws = dict(best_ws)
+                next_ow = dict(best_ow)
                 self.log.debug('Step misplaced %f > max %f, reducing step to %f',
                                next_misplaced, max_misplaced, step)
             else:
@@ -1101,15 +1497,15 @@ class Module(MgrModule):
                         self.log.debug('Score got worse, taking another step')
                     else:
                         step /= 2.0
-                        next_ws = copy.deepcopy(best_ws)
-                        next_ow = copy.deepcopy(best_ow)
+                        next_ws = dict(best_ws)
+                        next_ow = dict(best_ow)
                         self.log.debug('Score got worse, trying smaller step %f',
                                        step)
                 else:
                     bad_steps = 0
                     best_pe = next_pe
-                    best_ws = copy.deepcopy(next_ws)
-                    best_ow = copy.deepcopy(next_ow)
+                    best_ws = dict(next_ws)
+                    best_ow = dict(next_ow)
                     if best_pe.score == 0:
                         break
             left -= 1
@@ -1,18 +1,36 @@
 from mgr_module import MgrModule
+import bisect
 import datetime
 import errno
 import json
 import six
+import threading
+import zlib
 from collections import defaultdict
 
 
 DATEFMT = '%Y-%m-%d %H:%M:%S.%f'
 
+# crash id -> summary of every stored crash/ report, kept outside of the
+# crash/ prefix. It is split by a hash of the crash id into INDEX_SHARDS
+# keys, so that each stays well under mon_config_key_max_entry_size and
+# only the changed ones are written.
+INDEX_PREFIX = 'crash_index/'
+INDEX_SHARDS = 256
+
+# report fields kept in the index
+SUMMARY_FIELDS = ['timestamp', 'entity_name', 'process_name']
+
 
 class Module(MgrModule):
 
     def __init__(self, *args, **kwargs):
         super(Module, self).__init__(*args, **kwargs)
+        self.index_lock = threading.Lock()
+        self.index = None       # crash id -> summary
+        self.by_time = None     # sorted [(timestamp, crash id)]
+        self.shards = None      # shard key -> {crash id: summary}
+        self.dirty_shards = set()
 
     def handle_command(self, inbuf, command):
         for cmd in self.COMMANDS:
@@ -28,8 +46,11 @@ class Module(MgrModule):
     def validate_crash_metadata(inbuf):
         # raise any exceptions to caller
         metadata = json.loads(inbuf)
-        if 'crash_id' not in metadata:
-            raise AttributeError("missing 'crash_id' field")
+        for f in ['crash_id', 'timestamp']:
+            if f not in metadata:
+                raise AttributeError("missing '%s' field" % f)
+        # the index is sorted by time
+        Module.time_from_string(metadata['timestamp'])
         return metadata
 
     @staticmethod
@@ -38,21 +59,118 @@ class Module(MgrModule):
         timestr = timestr.rstrip('Z')
         return datetime.datetime.strptime(timestr, DATEFMT)
 
+    @staticmethod
+    def summarize(meta):
+        return dict((k, meta[k]) for k in SUMMARY_FIELDS if k in meta)
+
+    @staticmethod
+    def index_shard(crashid):
+        return '%s%02x' % (INDEX_PREFIX,
+                           zlib.crc32(crashid.encode('utf-8')) % INDEX_SHARDS)
+
+    def load_index(self):
+        """
+        Load the crash index, building it from the stored reports if it
+        has never been persisted (e.g. after an upgrade).
+        """
+        if self.index is not None:
+            return
+        stored = self.get_store_prefix(INDEX_PREFIX)
+        index = {}
+        if stored:
+            for raw in six.itervalues(stored):
+                index.update(json.loads(raw))
+        else:
+            for key, meta in six.iteritems(self.get_store_prefix('crash/')):
+                crashid = key[len('crash/'):]
+                index[crashid] = self.summarize(json.loads(meta))
+                self.dirty_shards.add(self.index_shard(crashid))
+            self.log.info('built crash index of %d reports' % len(index))
+        shards = defaultdict(dict)
+        by_time = []
+        for crashid, summary in list(six.iteritems(index)):
+            try:
+                by_time.append((self.time_from_string(summary['timestamp']),
+                                crashid))
+            except (KeyError, ValueError) as e:
+                # reports posted before the timestamp was validated
+                self.log.warning('ignoring crash %s without a valid timestamp: %s'
+                                 % (crashid, e))
+                del index[crashid]
+                self.dirty_shards.add(self.index_shard(crashid))
+                continue
+            shards[self.index_shard(crashid)][crashid] = summary
+        self.index = index
+        self.by_time = sorted(by_time)
+        self.shards = shards
+        self.save_index()
+
+    def index_add(self, crashid, meta):
+        self.load_index()
+        summary = self.summarize(meta)
+        self.index[crashid] = summary
+        bisect.insort(self.by_time,
+                      (self.time_from_string(meta['timestamp']), crashid))
+        shard = self.index_shard(crashid)
+        self.shards[shard][crashid] = summary
+        self.dirty_shards.add(shard)
+
+    def index_remove(self, crashid):
+        """
+        :returns: True if the crash report was indexed
+        """
+        self.load_index()
+        summary = self.index.pop(crashid, None)
+        if summary is None:
+            return False
+        entry = (self.time_from_string(summary['timestamp']), crashid)
+        del self.by_time[bisect.bisect_left(self.by_time, entry)]
+        shard = self.index_shard(crashid)
+        del self.shards[shard][crashid]
+        self.dirty_shards.add(shard)
+        return True
+
+    def index_prune(self, cutoff):
+        """
+        Remove the crash reports with timestamp <= cutoff from the index
+
+        :returns: ids of the removed crash reports
+        """
+        self.load_index()
+        end = bisect.bisect_right(self.by_time, (cutoff, u'\uffff'))
+        crashids = [crashid for _, crashid in self.by_time[:end]]
+        del self.by_time[:end]
+        for crashid in crashids:
+            del self.index[crashid]
+            shard = self.index_shard(crashid)
+            del self.shards[shard][crashid]
+            self.dirty_shards.add(shard)
+        return crashids
+
+    def save_index(self):
+        """
+        Write the shards of the index changed since the last save
+        """
+        for shard in self.dirty_shards:
+            summaries = self.shards.get(shard)
+            if summaries:
+                self.set_store(shard, json.dumps(summaries))
+            else:
+                self.shards.pop(shard, None)
+                self.set_store(shard, None)
+        self.dirty_shards = set()
+
     def timestamp_filter(self, f):
         """
         Filter crash reports by timestamp.
 
         :param f: f(time) return true to keep crash report
-        :returns: crash reports for which f(time) returns true
+        :returns: (crash id, summary) of the crash reports for which
+                  f(time) returns true, oldest first
         """
-        def inner(pair):
-            _, meta = pair
-            meta = json.loads(meta)
-            time = self.time_from_string(meta["timestamp"])
-            return f(time)
-        matches = filter(inner, six.iteritems(
-            self.get_store_prefix("crash/")))
-        return [(k, json.loads(m)) for k, m in matches]
+        self.load_index()
+        return [(crashid, self.index[crashid])
+                for ts, crashid in self.by_time if f(ts)]
 
     # command handlers
 
@@ -73,22 +191,29 @@ class Module(MgrModule):
         crashid = metadata['crash_id']
         key = 'crash/%s' % crashid
         # repeated stores of same item are ignored silently
-        if not self.get_store(key):
-            self.set_store(key, inbuf)
+        with self.index_lock:
+            if not self.get_store(key):
+                self.set_store(key, inbuf)
+                self.index_add(crashid, metadata)
+                self.save_index()
         return 0, '', ''
 
     def do_ls(self, cmd, inbuf):
         keys = []
-        for k, meta in self.timestamp_filter(lambda ts: True):
-            entity_name = meta.get('entity_name', 'unknown')
-            keys.append("%s %s" % (k.replace('crash/', ''), entity_name))
+        with self.index_lock:
+            for crashid, meta in self.timestamp_filter(lambda ts: True):
+                entity_name = meta.get('entity_name', 'unknown')
+                keys.append("%s %s" % (crashid, entity_name))
         keys.sort()
         return 0, '\n'.join(keys), ''
 
     def do_rm(self, cmd, inbuf):
         crashid = cmd['id']
         key = 'crash/%s' % crashid
-        self.set_store(key, None)       # removes key
+        with self.index_lock:
+            self.set_store(key, None)       # removes key
+            if self.index_remove(crashid):
+                self.save_index()
         return 0, '', ''
 
     def do_prune(self, cmd, inbuf):
@@ -102,8 +227,11 @@ class Module(MgrModule):
 
         cutoff = now - datetime.timedelta(days=keep)
 
-        for key, _ in self.timestamp_filter(lambda ts: ts <= cutoff):
-            self.set_store(key, None)
+        with self.index_lock:
+            crashids = self.index_prune(cutoff)
+            for crashid in crashids:
+                self.set_store('crash/%s' % crashid, None)
+            self.save_index()
 
         return 0, '', ''
 
@@ -133,11 +261,11 @@ class Module(MgrModule):
                 'idlist': list()
             }
 
-        for key, meta in six.iteritems(self.get_store_prefix('crash/')):
+        with self.index_lock:
+            self.load_index()
+            by_time = list(self.by_time)
+        for stamp, crashid in by_time:
             total += 1
-            meta = json.loads(meta)
-            stamp = self.time_from_string(meta['timestamp'])
-            crashid = meta['crash_id']
             for i, bindict in enumerate(bins):
                 if stamp <= bindict['agelimit']:
                     bindict['idlist'].append(crashid)
@@ -161,7 +289,9 @@ class Module(MgrModule):
 
         report = defaultdict(lambda: 0)
         cutoff = datetime.datetime.utcnow() - datetime.timedelta(hours=hours)
-        for _, meta in self.timestamp_filter(lambda ts: ts >= cutoff):
+        with self.index_lock:
+            matches = self.timestamp_filter(lambda ts: ts >= cutoff)
+        for _, meta in matches:
             pname = meta.get("process_name", "unknown")
             if not pname:
                 pname = "unknown"
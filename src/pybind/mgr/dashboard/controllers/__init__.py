@@ -20,7 +20,8 @@ import cherrypy
 
 from .. import logger
 from ..security import Scope, Permission
-from ..tools import wraps, getargspec, TaskManager, get_request_body_params
+from ..tools import wraps, getargspec, TaskManager, get_request_body_params, \
+    json_dumps, json_etag, etag_matches, PayloadStats
 from ..exceptions import ScopeNotValid, PermissionNotValid
 from ..services.auth import AuthManager, JwtManager
 from ..plugins import PLUGIN_MANAGER
@@ -490,7 +491,7 @@ class BaseController(object):
         def function(self):
             return self.ctrl._request_wrapper(self.func, self.method,
                                               self.config['json_response'],
-                                              self.config['xml'])
+                                              self.config['xml'], self.url)
 
         @property
         def method(self):
@@ -633,7 +634,8 @@ class BaseController(object):
         return result
 
     @staticmethod
-    def _request_wrapper(func, method, json_response, xml):  # pylint: disable=unused-argument
+    def _request_wrapper(func, method, json_response, xml,  # pylint: disable=unused-argument
+                         url=None):
         @wraps(func)
         def inner(*args, **kwargs):
             for key, value in kwargs.items():
@@ -654,7 +656,22 @@ class BaseController(object):
                 return ret.encode('utf8')
             if json_response:
                 cherrypy.response.headers['Content-Type'] = 'application/json'
-                ret = json.dumps(ret).encode('utf8')
+                ret = json_dumps(ret).encode('utf8')
+                not_modified = False
+                # only a successful response can be revalidated
+                if cherrypy.request.method in ('GET', 'HEAD') and \
+                        str(cherrypy.response.status or 200).startswith('200'):
+                    etag = json_etag(ret)
+                    cherrypy.response.headers['ETag'] = etag
+                    # let the clients cache the response, but revalidate it
+                    cherrypy.response.headers['Cache-Control'] = 'no-cache'
+                    if etag_matches(etag, cherrypy.request.headers.get('If-None-Match')):
+                        cherrypy.response.status = 304
+                        del cherrypy.response.headers['Content-Type']
+                        not_modified = True
+                        ret = b''
+                PayloadStats.record('{} {}'.format(cherrypy.request.method, url),
+                                    len(ret), not_modified)
             return ret
         return inner
 
@@ -1,11 +1,16 @@
 # -*- coding: utf-8 -*-
 from __future__ import absolute_import
+
+import cherrypy
+
 from . import ApiController, RESTController, UpdatePermission
 from .. import mgr, logger
+from ..exceptions import DashboardException
 from ..security import Scope
 from ..services.ceph_service import CephService, SendCommandError
 from ..services.exception import handle_send_command_error
-from ..tools import str_to_bool
+from ..services.osd import OsdService
+from ..tools import str_to_bool, parse_page
 try:
     from typing import Dict, List, Any, Union  # pylint: disable=unused-import
 except ImportError:
@@ -14,42 +19,24 @@ except ImportError:
 
 @ApiController('/osd', Scope.OSD)
 class Osd(RESTController):
-    def list(self):
-        osds = self.get_osd_map()
-
-        # Extending by osd stats information
-        for stat in mgr.get('osd_stats')['osd_stats']:
-            if stat['osd'] in osds:
-                osds[stat['osd']]['osd_stats'] = stat
-
-        # Extending by osd node information
-        nodes = mgr.get('osd_map_tree')['nodes']
-        for node in nodes:
-            if node['type'] == 'osd' and node['id'] in osds:
-                osds[node['id']]['tree'] = node
-
-        # Extending by osd parent node information
-        for host in [n for n in nodes if n['type'] == 'host']:
-            for osd_id in host['children']:
-                if osd_id >= 0 and osd_id in osds:
-                    osds[osd_id]['host'] = host
-
-        # Extending by osd histogram data
-        for osd_id, osd in osds.items():
-            osd['stats'] = {}
-            osd['stats_history'] = {}
-            osd_spec = str(osd_id)
-            if 'osd' not in osd:
-                continue
-            for stat in ['osd.op_w', 'osd.op_in_bytes', 'osd.op_r', 'osd.op_out_bytes']:
-                prop = stat.split('.')[1]
-                osd['stats'][prop] = CephService.get_rate('osd', osd_spec, stat)
-                osd['stats_history'][prop] = CephService.get_rates('osd', osd_spec, stat)
-            # Gauge stats
-            for stat in ['osd.numpg', 'osd.stat_bytes', 'osd.stat_bytes_used']:
-                osd['stats'][stat.split('.')[1]] = mgr.get_latest('osd', osd_spec, stat)
-
-        return list(osds.values())
+    def list(self, offset=None, limit=None, sort=None, fields=None):
+        """
+        Lists the OSDs.
+
+        The OSDs can be sorted by any (dotted) key of a number or string
+        with `sort`, e.g. `-stats.op_w`, paged with `offset` and `limit`,
+        and reduced to the comma separated top level `fields`. The total
+        number of OSDs is returned in the X-Total-Count header.
+        """
+        offset, limit = parse_page(offset, limit)
+        osds = OsdService.list_osds()
+        try:
+            osds_page = OsdService.select(osds, offset, limit, sort,
+                                          fields.split(',') if fields else None)
+        except ValueError as e:
+            raise DashboardException(msg=str(e), code='invalid_sort', component='osd')
+        cherrypy.response.headers['X-Total-Count'] = str(len(osds))
+        return osds_page
 
     @staticmethod
     def get_osd_map(svc_id=None):
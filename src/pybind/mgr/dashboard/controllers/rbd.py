@@ -4,8 +4,11 @@
 from __future__ import absolute_import
 
 import math
+import threading
+from collections import OrderedDict
 from functools import partial
 from datetime import datetime
+from multiprocessing.pool import ThreadPool
 
 import cherrypy
 
@@ -17,7 +20,7 @@ from .. import mgr
 from ..security import Scope
 from ..services.ceph_service import CephService
 from ..services.rbd import RbdConfiguration, format_bitmask, format_features
-from ..tools import ViewCache, str_to_bool
+from ..tools import ViewCache, str_to_bool, parse_page
 from ..services.exception import handle_rados_error, handle_rbd_error, \
                                  serialize_dashboard_exception
 
@@ -76,8 +79,21 @@ class Rbd(RESTController):
     ALLOW_DISABLE_FEATURES = {"exclusive-lock", "object-map", "fast-diff", "deep-flatten",
                               "journaling"}
 
+    # number of images whose details are fetched concurrently when listing
+    LIST_WORKERS = 10
+
+    # image fields that can be sorted on without opening the image
+    LIST_SORT_KEYS = ('name', 'pool_name')
+
+    # The disk usage of a snapshot only depends on the snapshot and the one
+    # preceding it, so it is computed once per (pool, image id, snapshot id,
+    # previous snapshot id) and kept in this LRU
+    SNAP_DISK_USAGE_CACHE_SIZE = 10000
+    _snap_disk_usage = OrderedDict()
+    _snap_disk_usage_lock = threading.Lock()
+
     @classmethod
-    def _rbd_disk_usage(cls, image, snaps, whole_object=True):
+    def _rbd_disk_usage(cls, pool_name, image, snaps, whole_object=True):
         class DUCallback(object):
             def __init__(self):
                 self.used_size = 0
@@ -86,17 +102,35 @@ class Rbd(RESTController):
                 if exists:
                     self.used_size += length
 
+        image_id = image.id()
         snap_map = {}
         prev_snap = None
+        prev_snap_id = None
         total_used_size = 0
-        for _, size, name in snaps:
-            image.set_snap(name)
-            du_callb = DUCallback()
-            image.diff_iterate(0, size, prev_snap, du_callb,
-                               whole_object=whole_object)
-            snap_map[name] = du_callb.used_size
-            total_used_size += du_callb.used_size
+        for snap_id, size, name in snaps:
+            # image ids are only unique within a pool
+            key = (pool_name, image_id, snap_id, prev_snap_id, whole_object)
+            used_size = None
+            if name is not None:
+                with cls._snap_disk_usage_lock:
+                    used_size = cls._snap_disk_usage.pop(key, None)
+                    if used_size is not None:
+                        cls._snap_disk_usage[key] = used_size
+            if used_size is None:
+                image.set_snap(name)
+                du_callb = DUCallback()
+                image.diff_iterate(0, size, prev_snap, du_callb,
+                                   whole_object=whole_object)
+                used_size = du_callb.used_size
+                if name is not None:
+                    with cls._snap_disk_usage_lock:
+                        cls._snap_disk_usage[key] = used_size
+                        if len(cls._snap_disk_usage) > cls.SNAP_DISK_USAGE_CACHE_SIZE:
+                            cls._snap_disk_usage.popitem(last=False)
+            snap_map[name] = used_size
+            total_used_size += used_size
             prev_snap = name
+            prev_snap_id = snap_id
 
         return total_used_size, snap_map
 
@@ -163,7 +197,7 @@ class Rbd(RESTController):
                 snaps.sort(key=lambda s: s[0])
                 snaps += [(snaps[-1][0]+1 if snaps else 0, stat['size'], None)]
                 total_prov_bytes, snaps_prov_bytes = cls._rbd_disk_usage(
-                    img, snaps, True)
+                    pool_name, img, snaps, True)
                 stat['total_disk_usage'] = total_prov_bytes
                 for snap, prov_bytes in snaps_prov_bytes.items():
                     if snap is None:
@@ -181,21 +215,44 @@ class Rbd(RESTController):
 
             return stat
 
+    @classmethod
+    def _rbd_images(cls, pool_name, names):
+        """
+        Fetches the details of the given images, LIST_WORKERS at a time.
+        Images removed in the meanwhile are skipped.
+        """
+        if not names:
+            return []
+
+        with mgr.rados.open_ioctx(pool_name) as ioctx:
+            def _image(name):
+                try:
+                    return cls._rbd_image(ioctx, pool_name, name)
+                except rbd.ImageNotFound:
+                    # may have been removed in the meanwhile
+                    return None
+
+            workers = ThreadPool(min(cls.LIST_WORKERS, len(names)))
+            try:
+                result = workers.map(_image, names)
+            finally:
+                workers.terminate()
+            return [stat for stat in result if stat is not None]
+
     @classmethod
     @ViewCache()
     def _rbd_pool_list(cls, pool_name):
         rbd_inst = rbd.RBD()
         with mgr.rados.open_ioctx(pool_name) as ioctx:
             names = rbd_inst.list(ioctx)
-            result = []
-            for name in names:
-                try:
-                    stat = cls._rbd_image(ioctx, pool_name, name)
-                except rbd.ImageNotFound:
-                    # may have been removed in the meanwhile
-                    continue
-                result.append(stat)
-            return result
+        return cls._rbd_images(pool_name, names)
+
+    @classmethod
+    @ViewCache()
+    def _rbd_pool_names(cls, pool_name):
+        rbd_inst = rbd.RBD()
+        with mgr.rados.open_ioctx(pool_name) as ioctx:
+            return rbd_inst.list(ioctx)
 
     def _rbd_list(self, pool_name=None):
         if pool_name:
@@ -207,15 +264,77 @@ class Rbd(RESTController):
         for pool in pools:
             # pylint: disable=unbalanced-tuple-unpacking
             status, value = self._rbd_pool_list(pool)
-            for i, image in enumerate(value):
-                value[i]['configuration'] = RbdConfiguration(pool, image['name']).list()
             result.append({'status': status, 'value': value, 'pool_name': pool})
         return result
 
+    def _rbd_list_page(self, pool_name, offset, limit, sort, search):
+        """
+        Only fetches the details of the images on the requested page. Images
+        are sorted and filtered on fields known without opening them, and
+        the number of matching images is returned in the X-Total-Count
+        header.
+        """
+        reverse = sort.startswith('-')
+        sort_key = sort.lstrip('-')
+        if sort_key not in self.LIST_SORT_KEYS:
+            raise cherrypy.HTTPError(400, 'Cannot sort images by {}'.format(sort_key))
+
+        if pool_name:
+            pools = [pool_name]
+        else:
+            pools = [p['pool_name'] for p in CephService.get_pool_list('rbd')]
+
+        statuses = {}
+        images = []
+        for pool in pools:
+            # pylint: disable=unbalanced-tuple-unpacking
+            status, names = self._rbd_pool_names(pool)
+            statuses[pool] = status
+            images.extend({'pool_name': pool, 'name': name} for name in names or []
+                          if not search or search in name)
+
+        images.sort(key=lambda image: (image[sort_key], image['pool_name'], image['name']),
+                    reverse=reverse)
+        cherrypy.response.headers['X-Total-Count'] = str(len(images))
+        page = images[offset:offset + limit] if limit is not None else images[offset:]
+
+        details = {}
+        for pool in pools:
+            names = [image['name'] for image in page if image['pool_name'] == pool]
+            details[pool] = {image['name']: image for image in self._rbd_images(pool, names)}
+
+        # consecutive images of the same pool are grouped, so that the
+        # groups keep the order of the page
+        result = []
+        for image in page:
+            pool = image['pool_name']
+            if image['name'] not in details[pool]:
+                continue
+            if not result or result[-1]['pool_name'] != pool:
+                result.append({'status': statuses[pool], 'value': [], 'pool_name': pool})
+            result[-1]['value'].append(details[pool][image['name']])
+        # the pools without images on the page, for their status
+        listed = {group['pool_name'] for group in result}
+        result.extend({'status': statuses[pool], 'value': [], 'pool_name': pool}
+                      for pool in pools if pool not in listed)
+        return result
+
     @handle_rbd_error()
     @handle_rados_error('pool')
-    def list(self, pool_name=None):
-        return self._rbd_list(pool_name)
+    def list(self, pool_name=None, offset=None, limit=None, sort='name', search=None):
+        """
+        Lists the images of the given pool, or of all RBD pools.
+
+        When `offset` or `limit` is given, only that page of the images,
+        sorted by `sort` (`name` or `pool_name`, prefixed with `-` for
+        descending order) and optionally filtered by `search`, is returned.
+        Consecutive images of the same pool on the page are grouped, so that
+        the groups are in the order of the page.
+        """
+        if offset is None and limit is None:
+            return self._rbd_list(pool_name)
+        offset, limit = parse_page(offset, limit)
+        return self._rbd_list_page(pool_name, offset, limit, sort, search)
 
     @handle_rbd_error()
     @handle_rados_error('pool')
@@ -9,7 +9,7 @@ from . import ApiController, BaseController, RESTController, Endpoint, \
     ReadPermission
 from .. import logger
 from ..exceptions import DashboardException
-from ..rest_client import RequestException
+from ..rest_client import RequestException, fan_out
 from ..security import Scope
 from ..services.ceph_service import CephService
 from ..services.rgw_client import RgwClient
@@ -193,12 +193,9 @@ class RgwUser(RgwRESTController):
     @Endpoint()
     @ReadPermission
     def get_emails(self):
-        emails = []
-        for uid in json.loads(self.list()):
-            user = json.loads(self.get(uid))
-            if user["email"]:
-                emails.append(user["email"])
-        return emails
+        users = fan_out(lambda uid: self.proxy('GET', 'user', {'uid': uid}),
+                        json.loads(self.list()))
+        return [user["email"] for user in users if user["email"]]
 
     def create(self, uid, display_name, email=None, max_buckets=None,
                suspended=None, generate_key=None, access_key=None,
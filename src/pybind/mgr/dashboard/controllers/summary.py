@@ -3,11 +3,14 @@ from __future__ import absolute_import
 
 import json
 
+import cherrypy
+
 from . import ApiController, Endpoint, BaseController
 from .. import mgr
 from ..security import Permission, Scope
 from ..controllers.rbd_mirroring import get_daemons_and_pools
 from ..exceptions import ViewCacheNoDataException
+from ..services.summary import SummaryFeed
 from ..tools import TaskManager
 
 
@@ -85,3 +88,26 @@ class Summary(BaseController):
         if self._has_permissions(Permission.READ, Scope.RBD_MIRRORING):
             result['rbd_mirroring'] = self._rbd_mirroring()
         return result
+
+    @Endpoint()
+    def updates(self, version=0, timeout=25):
+        """
+        Long polls for the parts of the summary that changed after `version`:
+        waits up to `timeout` seconds for a change, if there was none since.
+        Returns the new version, and the changed parts of the summary, which
+        are empty if the wait timed out.
+
+        Responds with 503 and a Retry-After header, and `retry_after` in the
+        body, if too many clients are already waiting.
+        """
+        version, changes = SummaryFeed.get_changes(int(version), float(timeout))
+        if changes is None:
+            cherrypy.response.status = 503
+            cherrypy.response.headers['Retry-After'] = str(SummaryFeed.RETRY_AFTER)
+            return {'version': version, 'changes': {},
+                    'retry_after': SummaryFeed.RETRY_AFTER}
+        for key in ['executing_tasks', 'finished_tasks']:
+            if key in changes:
+                changes[key] = [task for task in changes[key]
+                                if self._task_permissions(task['name'])]
+        return {'version': version, 'changes': changes}
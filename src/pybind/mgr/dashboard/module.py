@@ -71,12 +71,13 @@ if 'COVERAGE_ENABLED' in os.environ:
 # pylint: disable=wrong-import-position
 from . import logger, mgr
 from .controllers import generate_routes, json_error_page
-from .tools import NotificationQueue, RequestLoggingTool, TaskManager, \
-                   prepare_url_prefix
+from .tools import NotificationQueue, RequestLoggingTool, TaskManager, ViewCache, \
+                   gzip_large_responses, prepare_url_prefix
 from .services.auth import AuthManager, AuthManagerTool, JwtManager
 from .services.sso import SSO_COMMANDS, \
                           handle_sso_command
 from .services.exception import dashboard_exception_handler
+from .services.summary import SummaryFeed
 from .settings import options_command_list, options_schema_list, \
                       handle_option_command
 
@@ -147,6 +148,8 @@ class CherryPyConfig(object):
             lambda: PLUGIN_MANAGER.hook.filter_request_before_handler(request=cherrypy.request),
             priority=10)
         cherrypy.tools.request_logging = RequestLoggingTool()
+        cherrypy.tools.dashboard_gzip = cherrypy.Tool('before_finalize', gzip_large_responses,
+                                                      priority=80)
         cherrypy.tools.dashboard_exception_handler = HandlerWrapperTool(dashboard_exception_handler,
                                                                         priority=31)
 
@@ -157,8 +160,10 @@ class CherryPyConfig(object):
             'server.socket_port': int(server_port),
             'error_page.default': json_error_page,
             'tools.request_logging.on': True,
-            'tools.gzip.on': True,
-            'tools.gzip.mime_types': [
+            'tools.dashboard_gzip.on': True,
+            # Not worth compressing
+            'tools.dashboard_gzip.min_size': 1024,
+            'tools.dashboard_gzip.mime_types': [
                 # text/html and text/plain are the default types to compress
                 'text/html', 'text/plain',
                 # We also want JSON and JavaScript to be compressed
@@ -373,11 +378,14 @@ class Module(MgrModule, CherryPyConfig):
         cherrypy.engine.start()
         NotificationQueue.start_queue()
         TaskManager.init()
+        SummaryFeed.init()
         logger.info('Engine started.')
         # wait for the shutdown event
         self.shutdown_event.wait()
         self.shutdown_event.clear()
         NotificationQueue.stop()
+        ViewCache.stop()
+        SummaryFeed.stop()
         cherrypy.engine.stop()
         logger.info('Engine stopped')
 
@@ -3,45 +3,110 @@
 This is a minimal implementation of lru_cache function.
 
 Based on Python 3 functools and backports.functools_lru_cache.
+
+Unlike functools, the cached function is not called with a lock held:
+concurrent misses on the same key wait for a single call to complete, while
+calls for other keys proceed independently.
 """
 from __future__ import absolute_import
 
 from functools import wraps
 from collections import OrderedDict
-from threading import RLock
+from threading import Event, Lock
+from time import time
 
 
-def lru_cache(maxsize=128, typed=False):
-    if typed is not False:
-        raise NotImplementedError("typed caching not supported")
+class _Call(object):
+    """
+    A call of the cached function in progress, shared by the callers that
+    missed the cache for the same key.
+    """
+
+    def __init__(self):
+        self.event = Event()
+        self.value = None
+        self.exception = None
 
+
+def single_flight_cache(maxsize=128, ttl=None, stale=0):
+    """
+    Caches up to `maxsize` results of the decorated function, evicting the
+    least recently used ones. Results expire after `ttl` seconds, if given.
+
+    An expired result is still returned for `stale` more seconds to the
+    callers arriving while another caller refreshes it, instead of making
+    them wait.
+    """
     def decorating_function(function):
         cache = OrderedDict()
-        stats = [0, 0]
-        rlock = RLock()
-        setattr(
-            function,
-            'cache_info',
-            lambda:
-            "hits={}, misses={}, maxsize={}, currsize={}".format(
-                stats[0], stats[1], maxsize, len(cache)))
+        calls = {}
+        stats = {'hits': 0, 'misses': 0, 'expired': 0, 'waits': 0, 'stale': 0}
+        lock = Lock()
+
+        def cache_info():
+            lookups = stats['hits'] + stats['stale'] + stats['misses'] + stats['waits']
+            hit_rate = float(stats['hits'] + stats['stale']) / lookups if lookups else 0.0
+            return ("hits={}, misses={}, expired={}, waits={}, stale={}, hit_rate={:.2f}, "
+                    "maxsize={}, currsize={}".format(
+                        stats['hits'], stats['misses'], stats['expired'], stats['waits'],
+                        stats['stale'], hit_rate, maxsize, len(cache)))
+
+        setattr(function, 'cache_info', cache_info)
 
         @wraps(function)
         def wrapper(*args, **kwargs):
             key = args + tuple(kwargs.items())
-            with rlock:
+            owner = False
+            with lock:
                 if key in cache:
-                    ret = cache[key]
-                    del cache[key]
-                    cache[key] = ret
-                    stats[0] += 1
+                    ret, ts = cache[key]
+                    age = time() - ts
+                    if ttl is None or age < ttl:
+                        del cache[key]
+                        cache[key] = (ret, ts)
+                        stats['hits'] += 1
+                        return ret
+                    if key in calls and age < ttl + stale:
+                        stats['stale'] += 1
+                        return ret
+                    stats['expired'] += 1
+
+                call = calls.get(key)
+                if call is not None:
+                    stats['waits'] += 1
                 else:
-                    ret = function(*args, **kwargs)
-                    if len(cache) == maxsize:
-                        cache.popitem(last=False)
-                    cache[key] = ret
-                    stats[1] += 1
-            return ret
+                    call = calls[key] = _Call()
+                    stats['misses'] += 1
+                    owner = True
+
+            if not owner:
+                call.event.wait()
+                if call.exception is not None:
+                    raise call.exception
+                return call.value
+
+            try:
+                call.value = function(*args, **kwargs)
+            except BaseException as e:
+                call.exception = e
+                raise
+            finally:
+                with lock:
+                    del calls[key]
+                    if call.exception is None:
+                        cache.pop(key, None)
+                        if len(cache) >= maxsize:
+                            cache.popitem(last=False)
+                        cache[key] = (call.value, time())
+                call.event.set()
+            return call.value
 
         return wrapper
     return decorating_function
+
+
+def lru_cache(maxsize=128, typed=False):
+    if typed is not False:
+        raise NotImplementedError("typed caching not supported")
+
+    return single_flight_cache(maxsize)
@@ -16,15 +16,21 @@ from __future__ import absolute_import
 from .settings import Settings
 from .tools import build_url
 import inspect
+from multiprocessing.pool import ThreadPool
 import re
+import threading
 import requests
+from requests.adapters import HTTPAdapter
 from requests.exceptions import ConnectionError, InvalidURL, Timeout
+from six.moves import http_cookiejar
 from . import logger
 
 try:
     from requests.packages.urllib3.exceptions import SSLError
+    from requests.packages.urllib3.util.retry import Retry
 except ImportError:
     from urllib3.exceptions import SSLError
+    from urllib3.util.retry import Retry
 
 
 class TimeoutRequestsSession(requests.Session):
@@ -317,7 +323,68 @@ class _Request(object):
         return resp
 
 
+def _retry(total, backoff_factor):
+    """
+    Retries the connection errors of any request, as it was not sent then, and
+    the 502/503/504 responses to the requests that have no side effects.
+    """
+    kwargs = dict(total=total, connect=total, read=0, status=total,
+                  backoff_factor=backoff_factor, status_forcelist=[502, 503, 504],
+                  raise_on_status=False)
+    try:
+        return Retry(allowed_methods=['GET', 'HEAD'], **kwargs)
+    except TypeError:
+        # urllib3 < 1.26
+        return Retry(method_whitelist=['GET', 'HEAD'], **kwargs)
+
+
+def fan_out(func, items, workers=None):
+    """
+    Calls `func` with each of the `items` on up to `workers` threads (by
+    default as many as the pooled connections of a REST client), and returns
+    the results in the order of the items.
+    """
+    items = list(items)
+    workers = min(workers or RestClient.POOL_MAXSIZE, len(items))
+    if workers <= 1:
+        return [func(item) for item in items]
+    pool = ThreadPool(workers)
+    try:
+        return pool.map(func, items)
+    finally:
+        pool.close()
+        pool.join()
+
+
 class RestClient(object):
+    # connections kept open to each REST API endpoint; the requests
+    # exceeding it wait for a connection to be released
+    POOL_MAXSIZE = 10
+    RETRIES = 3
+    RETRY_BACKOFF_FACTOR = 0.2
+
+    # the sessions shared by the clients of the same endpoint
+    _sessions = {}
+    _sessions_lock = threading.Lock()
+
+    @classmethod
+    def _session(cls, base_url, ssl_verify):
+        with cls._sessions_lock:
+            session = cls._sessions.get((base_url, ssl_verify))
+            if session is None:
+                session = TimeoutRequestsSession()
+                session.verify = ssl_verify
+                # the clients of an endpoint may authenticate as different
+                # users, so the cookies one of them gets are not kept
+                session.cookies.set_policy(http_cookiejar.DefaultCookiePolicy(allowed_domains=[]))
+                adapter = HTTPAdapter(pool_connections=1, pool_maxsize=cls.POOL_MAXSIZE,
+                                      pool_block=True,
+                                      max_retries=_retry(cls.RETRIES, cls.RETRY_BACKOFF_FACTOR))
+                session.mount('http://', adapter)
+                session.mount('https://', adapter)
+                cls._sessions[(base_url, ssl_verify)] = session
+            return session
+
     def __init__(self, host, port, client_name=None, ssl=False, auth=None, ssl_verify=True):
         super(RestClient, self).__init__()
         self.client_name = client_name if client_name else ''
@@ -328,8 +395,7 @@ class RestClient(object):
         logger.debug("REST service base URL: %s", self.base_url)
         self.headers = {'Accept': 'application/json'}
         self.auth = auth
-        self.session = TimeoutRequestsSession()
-        self.session.verify = ssl_verify
+        self.session = self._session(self.base_url, ssl_verify)
 
     def _login(self, request=None):
         pass
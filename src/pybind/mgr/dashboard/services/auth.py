@@ -2,6 +2,7 @@
 from __future__ import absolute_import
 
 from base64 import b64encode
+import heapq
 import json
 import os
 import threading
@@ -23,6 +24,13 @@ class JwtManager(object):
 
     LOCAL_USER = threading.local()
 
+    # In-memory copy of the blacklist stored under JWT_TOKEN_BLACKLIST_KEY,
+    # mapping token ids to their expiration time, loaded on first use. The
+    # heap orders the ids by expiration time for pruning.
+    _blacklist = None
+    _blacklist_expiry = []
+    _blacklist_lock = threading.Lock()
+
     @staticmethod
     def _gen_secret():
         secret = os.urandom(16)
@@ -36,6 +44,8 @@ class JwtManager(object):
             secret = cls._gen_secret()
             mgr.set_store('jwt_secret', secret)
         cls._secret = secret
+        with cls._blacklist_lock:
+            cls._blacklist = None
 
     @classmethod
     def gen_token(cls, username):
@@ -80,33 +90,49 @@ class JwtManager(object):
     def get_username(cls):
         return getattr(cls.LOCAL_USER, 'username', None)
 
+    @classmethod
+    def _load_blacklist(cls):
+        # must be called with _blacklist_lock held
+        if cls._blacklist is None:
+            blacklist_json = mgr.get_store(cls.JWT_TOKEN_BLACKLIST_KEY)
+            cls._blacklist = json.loads(blacklist_json) if blacklist_json else {}
+            cls._blacklist_expiry = [(exp, jti) for jti, exp in cls._blacklist.items()]
+            heapq.heapify(cls._blacklist_expiry)
+
+    @classmethod
+    def _prune_blacklist(cls, now):
+        """
+        Removes the expired tokens, returns whether any was removed.
+        Must be called with _blacklist_lock held.
+        """
+        pruned = False
+        while cls._blacklist_expiry and cls._blacklist_expiry[0][0] < now:
+            exp, jti = heapq.heappop(cls._blacklist_expiry)
+            if cls._blacklist.get(jti) == exp:
+                del cls._blacklist[jti]
+                pruned = True
+        return pruned
+
     @classmethod
     def blacklist_token(cls, token):
         token = jwt.decode(token, verify=False)
-        blacklist_json = mgr.get_store(cls.JWT_TOKEN_BLACKLIST_KEY)
-        if not blacklist_json:
-            blacklist_json = "{}"
-        bl_dict = json.loads(blacklist_json)
-        now = time.time()
-
-        # remove expired tokens
-        to_delete = []
-        for jti, exp in bl_dict.items():
-            if exp < now:
-                to_delete.append(jti)
-        for jti in to_delete:
-            del bl_dict[jti]
-
-        bl_dict[token['jti']] = token['exp']
-        mgr.set_store(cls.JWT_TOKEN_BLACKLIST_KEY, json.dumps(bl_dict))
+        with cls._blacklist_lock:
+            cls._load_blacklist()
+            changed = cls._prune_blacklist(time.time())
+            if cls._blacklist.get(token['jti']) != token['exp']:
+                cls._blacklist[token['jti']] = token['exp']
+                heapq.heappush(cls._blacklist_expiry, (token['exp'], token['jti']))
+                changed = True
+            if changed:
+                mgr.set_store(cls.JWT_TOKEN_BLACKLIST_KEY, json.dumps(cls._blacklist))
 
     @classmethod
     def is_blacklisted(cls, jti):
-        blacklist_json = mgr.get_store(cls.JWT_TOKEN_BLACKLIST_KEY)
-        if not blacklist_json:
-            blacklist_json = "{}"
-        bl_dict = json.loads(blacklist_json)
-        return jti in bl_dict
+        with cls._blacklist_lock:
+            cls._load_blacklist()
+            # the expired tokens are dropped from the store on the next change
+            cls._prune_blacklist(time.time())
+            return jti in cls._blacklist
 
 
 class AuthManager(object):
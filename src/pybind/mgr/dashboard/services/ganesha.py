@@ -1,7 +1,9 @@
 # -*- coding: utf-8 -*-
 from __future__ import absolute_import
 
+from functools import partial
 import re
+import threading
 
 from .cephfs import CephFS
 from .cephx import CephX
@@ -742,6 +744,18 @@ class Export(object):
 class GaneshaConf(object):
     # pylint: disable=R0902
 
+    # Number of asynchronous rados operations in flight when reading the
+    # configuration objects
+    AIO_BATCH_SIZE = 128
+
+    # The parsed configuration objects, read-only, shared by all instances:
+    # {(pool, namespace): {object name: ((size, mtime), conf blocks)}}
+    _conf_cache = {}
+    _conf_cache_lock = threading.Lock()
+    # Incremented on every write, so that a read overlapping a write, whose
+    # result may be stale, is not cached
+    _conf_cache_writes = 0
+
     def __init__(self, cluster_id, rados_pool, rados_namespace):
         self.cluster_id = cluster_id
         self.rados_pool = rados_pool
@@ -780,38 +794,98 @@ class GaneshaConf(object):
         pool, ns = Ganesha.get_pool_and_namespace(cluster_id)
         return cls(cluster_id, pool, ns)
 
+    @classmethod
+    def _aio_gather(cls, keys, submit):
+        """
+        Calls ``submit(key, oncomplete)`` for every key, with at most
+        AIO_BATCH_SIZE operations in flight, and returns the arguments
+        each operation passed to ``oncomplete`` after the completion.
+        """
+        results = {}
+
+        def _oncomplete(key, _, *result):
+            results[key] = result
+
+        for i in range(0, len(keys), cls.AIO_BATCH_SIZE):
+            completions = [submit(key, partial(_oncomplete, key))
+                           for key in keys[i:i + cls.AIO_BATCH_SIZE]]
+            for completion in completions:
+                completion.wait_for_complete_and_cb()
+        return results
+
     def _read_raw_config(self):
+        """
+        Only the objects whose size or modification time changed since they
+        were last read are read and parsed again. The modification time has a
+        one second resolution: the writes of the dashboard forget the cached
+        objects, and the reads overlapping a write are not cached.
+        """
         with mgr.rados.open_ioctx(self.rados_pool) as ioctx:
             if self.rados_namespace:
                 ioctx.set_namespace(self.rados_namespace)
-            objs = ioctx.list_objects()
-            for obj in objs:
-                if obj.key.startswith("export-"):
-                    size, _ = obj.stat()
-                    raw_config = obj.read(size)
-                    raw_config = raw_config.decode("utf-8")
-                    logger.debug("[NFS] read export configuration from rados "
-                                 "object %s/%s/%s:\n%s", self.rados_pool,
-                                 self.rados_namespace, obj.key, raw_config)
-                    self.export_conf_blocks.extend(
-                        GaneshaConfParser(raw_config).parse())
-                elif obj.key.startswith("conf-"):
-                    size, _ = obj.stat()
-                    raw_config = obj.read(size)
-                    raw_config = raw_config.decode("utf-8")
-                    logger.debug("[NFS] read daemon configuration from rados "
-                                 "object %s/%s/%s:\n%s", self.rados_pool,
-                                 self.rados_namespace, obj.key, raw_config)
-                    idx = obj.key.find('-')
-                    self.daemons_conf_blocks[obj.key[idx+1:]] = \
-                        GaneshaConfParser(raw_config).parse()
+            keys = [obj.key for obj in ioctx.list_objects()
+                    if obj.key.startswith("export-") or obj.key.startswith("conf-")]
+
+            with self._conf_cache_lock:
+                cached = dict(self._conf_cache.get(
+                    (self.rados_pool, self.rados_namespace), {}))
+                writes = GaneshaConf._conf_cache_writes
+
+            stats = self._aio_gather(keys, ioctx.aio_stat)
+            # objects removed since they were listed have no size
+            versions = {key: stat for key, stat in stats.items() if stat[0] is not None}
+            changed = [key for key in keys
+                       if key in versions and
+                       (key not in cached or cached[key][0] != versions[key])]
+            changed_set = set(changed)
+            raw_configs = self._aio_gather(
+                changed,
+                lambda key, oncomplete: ioctx.aio_read(key, versions[key][0], 0,
+                                                       oncomplete))
+
+        conf = {}
+        for key in keys:
+            if key in changed_set:
+                raw_config = raw_configs.get(key, (None,))[0]
+                if raw_config is None:
+                    continue
+                raw_config = raw_config.decode("utf-8")
+                logger.debug("[NFS] read configuration from rados object "
+                             "%s/%s/%s:\n%s", self.rados_pool,
+                             self.rados_namespace, key, raw_config)
+                conf[key] = (versions[key], GaneshaConfParser(raw_config).parse())
+            elif key in versions:
+                conf[key] = cached[key]
+
+        with self._conf_cache_lock:
+            if GaneshaConf._conf_cache_writes == writes:
+                self._conf_cache[(self.rados_pool, self.rados_namespace)] = conf
+
+        for key in sorted(conf):
+            blocks = conf[key][1]
+            if key.startswith("export-"):
+                self.export_conf_blocks.extend(blocks)
+            else:
+                idx = key.find('-')
+                self.daemons_conf_blocks[key[idx+1:]] = blocks
+
+    def _forget_raw_config(self, obj):
+        with self._conf_cache_lock:
+            GaneshaConf._conf_cache_writes += 1
+            self._conf_cache.get((self.rados_pool, self.rados_namespace),
+                                 {}).pop(obj, None)
 
     def _write_raw_config(self, conf_block, obj):
         raw_config = GaneshaConfParser.write_conf(conf_block)
+        self._forget_raw_config(obj)
         with mgr.rados.open_ioctx(self.rados_pool) as ioctx:
             if self.rados_namespace:
                 ioctx.set_namespace(self.rados_namespace)
-            ioctx.write_full(obj, raw_config.encode('utf-8'))
+            try:
+                ioctx.write_full(obj, raw_config.encode('utf-8'))
+            finally:
+                # a read may have cached the object again meanwhile
+                self._forget_raw_config(obj)
             logger.debug(
                 "[NFS] write configuration into rados object %s/%s/%s:\n%s",
                 self.rados_pool, self.rados_namespace, obj, raw_config)
@@ -940,6 +1014,7 @@ class GaneshaConf(object):
 
     def _delete_export(self, export_id):
         self._persist_daemon_configuration()
+        self._forget_raw_config("export-{}".format(export_id))
         with mgr.rados.open_ioctx(self.rados_pool) as ioctx:
             if self.rados_namespace:
                 ioctx.set_namespace(self.rados_namespace)
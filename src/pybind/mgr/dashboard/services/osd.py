@@ -0,0 +1,190 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import
+
+from collections import deque
+import threading
+
+from .ceph_service import CephService, differentiate
+from .. import mgr
+
+try:
+    from typing import Dict, List, Any, Tuple  # pylint: disable=unused-import
+except ImportError:
+    pass  # For typing only
+
+
+class OsdService(object):
+    """
+    Builds the OSD table from one bulk fetch of the OSD perf counters,
+    instead of fetching every counter of every OSD on its own.
+    """
+
+    RATE_COUNTERS = ['osd.op_w', 'osd.op_in_bytes', 'osd.op_r', 'osd.op_out_bytes']
+    GAUGE_COUNTERS = ['osd.numpg', 'osd.stat_bytes', 'osd.stat_bytes_used']
+
+    # as many rates as the mgr keeps data points per counter
+    HISTORY_SIZE = 20
+
+    _lock = threading.Lock()
+
+    # CRUSH tree nodes of the OSDs and of their hosts, by OSD id, for the
+    # OSD map epoch they were built at
+    _tree_epoch = None
+    _tree_nodes = {}  # type: Dict[int, Dict[str, Any]]
+    _tree_hosts = {}  # type: Dict[int, Dict[str, Any]]
+
+    # rates of the RATE_COUNTERS, by OSD id and counter name
+    _history = {}  # type: Dict[int, Dict[str, deque]]
+
+    @classmethod
+    def _tree_index(cls, epoch):
+        # type: (int) -> Tuple[Dict[int, Dict[str, Any]], Dict[int, Dict[str, Any]]]
+        with cls._lock:
+            if epoch is not None and epoch == cls._tree_epoch:
+                return cls._tree_nodes, cls._tree_hosts
+
+        nodes = mgr.get('osd_map_tree')['nodes']
+        tree_nodes = {node['id']: node for node in nodes if node['type'] == 'osd'}
+        tree_hosts = {}
+        for host in [n for n in nodes if n['type'] == 'host']:
+            for osd_id in host['children']:
+                if osd_id >= 0:
+                    tree_hosts[osd_id] = host
+
+        with cls._lock:
+            cls._tree_epoch = epoch
+            cls._tree_nodes = tree_nodes
+            cls._tree_hosts = tree_hosts
+        return tree_nodes, tree_hosts
+
+    @classmethod
+    def _is_stale(cls, osd_history, osd_counters):
+        # type: (Dict[str, deque], Dict[str, List]) -> bool
+        """
+        Whether the newest rate of the history is older than the data points
+        the mgr keeps, i.e. the OSDs were not listed for that long.
+        """
+        for stat in cls.RATE_COUNTERS:
+            points = osd_counters.get(stat, [])
+            rates = osd_history[stat.split('.')[1]]
+            if len(points) < 2 or not rates:
+                continue
+            window = (points[-1][0] - points[-2][0]) * cls.HISTORY_SIZE
+            if rates[-1][0] < points[-1][0] - window:
+                return True
+        return False
+
+    @classmethod
+    def _update_history(cls, osd_ids, counters):
+        # type: (List[int], Dict[str, Dict[str, List]]) -> Dict[int, Dict[str, List]]
+        """
+        Appends the current rates to the history of each OSD, and returns
+        the histories. The history of an OSD seen for the first time, or not
+        updated within the data points the mgr keeps, is filled from them.
+        """
+        with cls._lock:
+            new_ids = [osd_id for osd_id in osd_ids
+                       if osd_id not in cls._history or
+                       cls._is_stale(cls._history[osd_id], counters.get(str(osd_id), {}))]
+        seeded = {}
+        for osd_id in new_ids:
+            seeded[osd_id] = {
+                stat.split('.')[1]: deque(CephService.get_rates('osd', str(osd_id), stat),
+                                          maxlen=cls.HISTORY_SIZE)
+                for stat in cls.RATE_COUNTERS
+            }
+
+        result = {}
+        with cls._lock:
+            history = {}
+            for osd_id in osd_ids:
+                osd_history = seeded.get(osd_id) or cls._history.get(osd_id)
+                if osd_id not in seeded:
+                    for stat in cls.RATE_COUNTERS:
+                        points = counters.get(str(osd_id), {}).get(stat, [])
+                        if len(points) < 2 or points[-1][0] <= points[-2][0]:
+                            continue
+                        rates = osd_history[stat.split('.')[1]]
+                        if rates and rates[-1][0] >= points[-1][0]:
+                            continue
+                        rates.append((points[-1][0], differentiate(*points[-2:])))
+                history[osd_id] = osd_history
+                result[osd_id] = {prop: list(rates) for prop, rates in osd_history.items()}
+            # forget the OSDs that are gone
+            cls._history = history
+        return result
+
+    @classmethod
+    def list_osds(cls):
+        # type: () -> List[Dict[str, Any]]
+        osd_map = mgr.get('osd_map')
+        osds = {}
+        for osd in osd_map['osds']:
+            osd['id'] = osd['osd']
+            osds[osd['osd']] = osd
+
+        for stat in mgr.get('osd_stats')['osd_stats']:
+            if stat['osd'] in osds:
+                osds[stat['osd']]['osd_stats'] = stat
+
+        tree_nodes, tree_hosts = cls._tree_index(osd_map.get('epoch'))
+        for osd_id, osd in osds.items():
+            if osd_id in tree_nodes:
+                osd['tree'] = tree_nodes[osd_id]
+            if osd_id in tree_hosts:
+                osd['host'] = tree_hosts[osd_id]
+
+        counters = mgr.get_latest_counters('osd', cls.RATE_COUNTERS + cls.GAUGE_COUNTERS)
+        history = cls._update_history(list(osds), counters)
+        for osd_id, osd in osds.items():
+            osd_counters = counters.get(str(osd_id), {})
+            osd['stats'] = {}
+            osd['stats_history'] = history[osd_id]
+            for stat in cls.RATE_COUNTERS:
+                points = osd_counters.get(stat, [])
+                rate = 0.0
+                if len(points) > 1 and points[-1][0] > points[-2][0]:
+                    rate = differentiate(*points[-2:])
+                osd['stats'][stat.split('.')[1]] = rate
+            # Gauge stats
+            for stat in cls.GAUGE_COUNTERS:
+                points = osd_counters.get(stat, [])
+                osd['stats'][stat.split('.')[1]] = points[-1][1] if points else 0
+
+        return list(osds.values())
+
+    @staticmethod
+    def _lookup(osd, path):
+        # type: (Dict[str, Any], List[str]) -> Any
+        value = osd
+        for key in path:
+            if not isinstance(value, dict) or key not in value:
+                return None
+            value = value[key]
+        return value
+
+    @classmethod
+    def select(cls, osds, offset=0, limit=None, sort=None, fields=None):
+        # type: (List[Dict[str, Any]], int, int, str, List[str]) -> List[Dict[str, Any]]
+        """
+        Sorts the OSDs by the (dotted) key `sort`, prefixed with `-` for
+        descending order, returns the page starting at `offset` and only
+        keeps the given top level `fields` of each OSD.
+
+        Raises a ValueError if `sort` is not the key of a scalar value.
+        """
+        if sort:
+            path = sort.lstrip('-').split('.')
+            for osd in osds:
+                if isinstance(cls._lookup(osd, path), (dict, list)):
+                    raise ValueError('cannot sort by {}'.format(sort.lstrip('-')))
+            osds = sorted(osds,
+                          key=lambda osd: (cls._lookup(osd, path) is not None,
+                                           cls._lookup(osd, path), osd['id']),
+                          reverse=sort.startswith('-'))
+        osds = osds[offset:offset + limit] if limit is not None else osds[offset:]
+        if fields:
+            fields = set(fields) | {'id'}
+            osds = [{key: value for key, value in osd.items() if key in fields}
+                    for osd in osds]
+        return osds
@@ -0,0 +1,165 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import
+
+import json
+import threading
+import time
+
+from .. import mgr
+from ..tools import NotificationQueue, TaskManager
+
+try:
+    from typing import Dict, Any, Callable, List, Tuple  # pylint: disable=unused-import
+except ImportError:
+    pass  # For typing only
+
+
+def _health():
+    return {
+        'health_status': json.loads(mgr.get('health')['json'])['status'],
+        'have_mon_connection': mgr.have_mon_connection(),
+    }
+
+
+def _mgr():
+    return {
+        'mgr_host': mgr.get('mgr_map')['services'].get('dashboard'),
+    }
+
+
+def _tasks():
+    executing_tasks, finished_tasks = TaskManager.list_serializable()
+    return {
+        'executing_tasks': executing_tasks,
+        'finished_tasks': finished_tasks,
+    }
+
+
+class SummaryFeed(object):
+    """
+    The parts of the summary that change on notifications, versioned so that
+    the clients can wait for a change, and then fetch only the parts that
+    changed since the version they have, instead of polling for all of them.
+    """
+
+    # source of the values: notification types it is refreshed on
+    SOURCES = {
+        _health: ['health', 'mon_map'],
+        _mgr: ['mgr_map'],
+        _tasks: ['cd_task_started', 'cd_task_progress', 'cd_task_finished'],
+    }
+
+    # every waiting client holds one of the CherryPy worker threads; the
+    # clients that cannot wait are told to retry after RETRY_AFTER seconds
+    MAX_WAITERS = 4
+    MAX_WAIT = 30.0
+    RETRY_AFTER = 5
+
+    _cond = threading.Condition()
+    _state = None  # type: Dict[str, Any]
+    _changed = {}  # type: Dict[str, int]
+    # starts at the time of the first change, so that the versions the
+    # clients got from a previous instance are older than the current ones
+    _version = 0
+    _waiters = 0
+    _stopped = False
+    # number of changes notified while there was no state
+    _missed = 0
+    _listeners = []  # type: List[Callable]
+
+    @classmethod
+    def init(cls):
+        with cls._cond:
+            cls._stopped = False
+        for source, n_types in cls.SOURCES.items():
+            listener = cls._listener(source)
+            cls._listeners.append(listener)
+            # after the handler of TaskManager, which has priority 1
+            NotificationQueue.register(listener, n_types, priority=2)
+
+    @classmethod
+    def stop(cls):
+        for listener in cls._listeners:
+            NotificationQueue.deregister(listener)
+        cls._listeners = []
+        with cls._cond:
+            cls._stopped = True
+            cls._state = None
+            cls._cond.notify_all()
+
+    @classmethod
+    def _listener(cls, source):
+        def _refresh(_):
+            cls._update(source())
+        return _refresh
+
+    @classmethod
+    def _update(cls, values):
+        with cls._cond:
+            if cls._state is None:
+                cls._missed += 1
+                return
+            changed = [key for key, value in values.items() if cls._state.get(key) != value]
+            if not changed:
+                return
+            cls._version = max(cls._version + 1, int(time.time() * 1000))
+            for key in changed:
+                cls._state[key] = values[key]
+                cls._changed[key] = cls._version
+            cls._cond.notify_all()
+
+    @classmethod
+    def _init_state(cls):
+        while True:
+            with cls._cond:
+                if cls._state is not None:
+                    return
+                missed = cls._missed
+            # the sources are read without holding the lock
+            state = {}
+            for source in cls.SOURCES:
+                state.update(source())
+            with cls._cond:
+                if cls._state is not None:
+                    return
+                if cls._missed != missed:
+                    # a source changed meanwhile, the state may be stale
+                    continue
+                cls._version = max(cls._version + 1, int(time.time() * 1000))
+                cls._state = state
+                cls._changed = {key: cls._version for key in state}
+                return
+
+    @classmethod
+    def get_changes(cls, since=0, timeout=0.0):
+        # type: (int, float) -> Tuple[int, Dict[str, Any]]
+        """
+        Returns the current version and the values that changed after version
+        `since`, all of them if `since` is not a version of this feed.
+
+        Waits up to `timeout` seconds for a change if there is none yet. If
+        too many clients are already waiting, returns None instead of the
+        values: the client should retry after RETRY_AFTER seconds.
+        """
+        cls._init_state()
+        deadline = time.time() + min(timeout, cls.MAX_WAIT)
+        with cls._cond:
+            if since > cls._version:
+                since = 0
+            if cls._version == since and timeout > 0 and cls._waiters >= cls.MAX_WAITERS:
+                return since, None
+            if cls._version == since:
+                cls._waiters += 1
+                try:
+                    while cls._version == since and not cls._stopped:
+                        remaining = deadline - time.time()
+                        if remaining <= 0:
+                            break
+                        cls._cond.wait(remaining)
+                finally:
+                    cls._waiters -= 1
+            if cls._state is None:
+                # stopped while waiting
+                return since, {}
+            return cls._version, {key: value for key, value in cls._state.items()
+                                  if cls._changed[key] > since}
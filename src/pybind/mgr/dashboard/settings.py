@@ -25,6 +25,14 @@ class Options(object):
     AUDIT_API_ENABLED = (False, bool)
     AUDIT_API_LOG_PAYLOAD = (True, bool)
 
+    # Serialize the REST API responses with ujson, if it is installed
+    JSON_FAST_ENCODER = (False, bool)
+
+    # Background tasks: size of the worker pool running them, and how many
+    # tasks of the same name run at once. Applied when the dashboard starts.
+    TASK_WORKERS = (10, int)
+    TASK_MAX_CONCURRENT_PER_NAME = (4, int)
+
     # RGW settings
     RGW_API_HOST = ('', str)
     RGW_API_PORT = (80, int)
@@ -0,0 +1,623 @@
+# -*- coding: utf-8 -*-
+# pylint: disable=too-many-instance-attributes,too-many-arguments
+"""
+Load benchmark of the dashboard REST API.
+
+Serves the dashboard controllers backed by a synthetic cluster of the given
+size, instead of a real mgr, sends concurrent requests to the given
+endpoints and reports, for each of them, the latency percentiles and the
+CPU time spent handling a request.
+
+Run it from ``src/pybind/mgr`` in the dashboard virtualenv::
+
+  $ UNITTEST=true python -m dashboard.tests.benchmark --osds 1000 --pools 50 \\
+        --images 200 --clients 8 --requests 50
+"""
+from __future__ import absolute_import, division, print_function
+
+import argparse
+import datetime
+import json
+import logging
+import socket
+import threading
+import time
+from collections import defaultdict, deque
+
+import cherrypy
+from cherrypy._cptools import HandlerWrapperTool
+from cheroot import wsgi
+import mock
+import rados
+import rbd
+import requests
+
+from .. import mgr
+from ..controllers import json_error_page, generate_controller_routes
+from ..controllers.health import Health
+from ..controllers.osd import Osd
+from ..controllers.pool import Pool
+from ..controllers.rbd import Rbd
+from ..controllers.summary import Summary
+from ..services.auth import AuthManager, JwtManager
+from ..services.exception import dashboard_exception_handler
+from ..tools import gzip_large_responses
+
+try:
+    from typing import Dict, List, Any  # pylint: disable=unused-import
+except ImportError:
+    pass  # For typing only
+
+try:
+    _thread_time = time.thread_time
+except AttributeError:
+    try:
+        import resource
+
+        def _thread_time():
+            usage = resource.getrusage(resource.RUSAGE_THREAD)
+            return usage.ru_utime + usage.ru_stime
+    except (ImportError, AttributeError):
+        _thread_time = None
+
+
+CONTROLLERS = [Health, Osd, Pool, Rbd, Summary]
+
+ENDPOINTS = [
+    '/api/summary',
+    '/api/health/minimal',
+    '/api/health/full',
+    '/api/osd',
+    '/api/osd?offset=0&limit=20&sort=-stats.op_w',
+    '/api/pool?stats=true',
+    '/api/block/image',
+    '/api/block/image?offset=0&limit=20',
+]
+
+GiB = 1 << 30
+
+
+class FakeCluster(object):
+    """
+    The maps, stats and perf counters of a healthy cluster of the given size,
+    as the mgr would return them.
+    """
+
+    COUNTER_INTERVAL = 5.0
+
+    def __init__(self, osds=100, osds_per_host=10, pools=10, pgs_per_pool=128,
+                 images=100, snaps=2, counter_points=20):
+        self.num_osds = osds
+        self.osds_per_host = osds_per_host
+        self.num_pools = pools
+        self.pgs_per_pool = pgs_per_pool
+        self.images_per_pool = images
+        self.snaps_per_image = snaps
+        self.counter_points = counter_points
+        self.start = time.time()
+        self.hosts = ['host{}'.format(i)
+                      for i in range((osds + osds_per_host - 1) // osds_per_host)]
+        self.pool_names = ['pool{}'.format(i) for i in range(pools)]
+        self.images = {pool: ['image{}'.format(i) for i in range(images)]
+                       for pool in self.pool_names}
+        # mgr.get() returns new objects on every call, which the controllers
+        # are free to modify
+        self._maps = {key: json.dumps(value) for key, value in self._build_maps().items()}
+        self._pool_stats = defaultdict(lambda: defaultdict(lambda: deque(maxlen=10)))
+
+    def _host(self, osd_id):
+        return self.hosts[osd_id // self.osds_per_host]
+
+    def _build_maps(self):
+        osds = range(self.num_osds)
+        pools = [{
+            'pool': pool_id,
+            'pool_name': name,
+            'type': 1,
+            'size': 3,
+            'min_size': 2,
+            'crush_rule': 0,
+            'pg_num': self.pgs_per_pool,
+            'pg_placement_num': self.pgs_per_pool,
+            'flags_names': 'hashpspool',
+            'application_metadata': {'rbd': {}},
+            'options': {},
+        } for pool_id, name in enumerate(self.pool_names, 1)]
+        pgs_per_osd = self.num_pools * self.pgs_per_pool * 3 // max(self.num_osds, 1)
+        num_pgs = self.num_pools * self.pgs_per_pool
+
+        nodes = [{'id': -1, 'name': 'default', 'type': 'root', 'type_id': 10,
+                  'children': [-2 - i for i in range(len(self.hosts))]}]
+        for i, host in enumerate(self.hosts):
+            nodes.append({'id': -2 - i, 'name': host, 'type': 'host', 'type_id': 1,
+                          'pool_weights': {},
+                          'children': [osd_id for osd_id in osds
+                                       if self._host(osd_id) == host]})
+        for osd_id in osds:
+            nodes.append({'id': osd_id, 'name': 'osd.{}'.format(osd_id), 'type': 'osd',
+                          'type_id': 0, 'device_class': 'hdd', 'crush_weight': 1.0,
+                          'depth': 2, 'pool_weights': {}, 'exists': 1, 'status': 'up',
+                          'reweight': 1.0, 'primary_affinity': 1.0})
+
+        return {
+            'osd_map': {
+                'epoch': 1,
+                'flags_set': ['sortbitwise'],
+                'pg_temp': [],
+                'pools': pools,
+                'osds': [{
+                    'osd': osd_id,
+                    'uuid': '00000000-0000-0000-0000-{:012d}'.format(osd_id),
+                    'up': 1,
+                    'in': 1,
+                    'weight': 1.0,
+                    'primary_affinity': 1.0,
+                    'up_from': 1,
+                    'up_thru': 1,
+                    'down_at': 0,
+                    'state': ['exists', 'up'],
+                    'public_addr': '10.0.0.{}:6800/1'.format(osd_id % 250),
+                    'cluster_addr': '10.1.0.{}:6800/1'.format(osd_id % 250),
+                } for osd_id in osds],
+            },
+            'osd_map_tree': {'nodes': nodes, 'stray': []},
+            'osd_map_crush': {'rules': [{'rule_id': 0, 'rule_name': 'replicated_rule',
+                                         'type': 1, 'min_size': 1, 'max_size': 10}]},
+            'osd_map_crush_map_text': '# crush map\n' * 100,
+            'osd_metadata': {str(osd_id): {'hostname': self._host(osd_id),
+                                           'osd_objectstore': 'bluestore',
+                                           'ceph_version': 'ceph version 15.0.0'}
+                             for osd_id in osds},
+            'osd_stats': {'osd_stats': [{'osd': osd_id, 'num_pgs': pgs_per_osd,
+                                         'kb': 1 << 30, 'kb_used': 1 << 28,
+                                         'kb_avail': 3 << 28}
+                                        for osd_id in osds]},
+            'pg_summary': {
+                'all': {'active+clean': num_pgs},
+                'by_osd': {str(osd_id): {'active+clean': pgs_per_osd} for osd_id in osds},
+                'by_pool': {str(pool['pool']): {'active+clean': self.pgs_per_pool}
+                            for pool in pools},
+            },
+            'osd_pool_stats': {'pool_stats': [{
+                'pool_id': pool['pool'],
+                'pool_name': pool['pool_name'],
+                'client_io_rate': {'read_bytes_sec': 1000, 'read_op_per_sec': 10,
+                                   'write_bytes_sec': 2000, 'write_op_per_sec': 20},
+                'recovery_rate': {},
+            } for pool in pools]},
+            'df': {
+                'stats': {'total_bytes': self.num_osds * GiB,
+                          'total_avail_bytes': self.num_osds * GiB * 3 // 4,
+                          'total_used_bytes': self.num_osds * GiB // 4,
+                          'total_used_raw_bytes': self.num_osds * GiB // 4},
+                'stats_by_class': {'hdd': {'total_bytes': self.num_osds * GiB}},
+                'pools': [{'name': pool['pool_name'], 'id': pool['pool'],
+                           'stats': {'stored': GiB, 'objects': 1024, 'kb_used': 3 << 20,
+                                     'bytes_used': 3 * GiB, 'percent_used': 0.01,
+                                     'max_avail': 100 * GiB, 'rd': 1, 'rd_bytes': 1,
+                                     'wr': 1, 'wr_bytes': 1}}
+                          for pool in pools],
+            },
+            'health': {'json': json.dumps({'status': 'HEALTH_OK', 'checks': {}})},
+            'mon_status': {'json': json.dumps({
+                'monmap': {'mons': [{'rank': i, 'name': 'mon{}'.format(i)} for i in range(3)]},
+                'quorum': [0, 1, 2],
+            })},
+            'fs_map': {'filesystems': [], 'standbys': []},
+            'mgr_map': {'active_name': 'x', 'standbys': [],
+                        'services': {'dashboard': 'https://host0:8443/'}},
+            'config': {'rbd_default_features': '61'},
+        }
+
+    def get(self, data_name):
+        return json.loads(self._maps[data_name])
+
+    def _counter(self, svc_name, path, points):
+        now = time.time()
+        rate = 1 + (hash((svc_name, path)) % 100)
+        steps = int((now - self.start) / self.COUNTER_INTERVAL)
+        return [(now - (points - 1 - i) * self.COUNTER_INTERVAL,
+                 float(rate * (steps + i) * self.COUNTER_INTERVAL))
+                for i in range(points)]
+
+    def get_counter(self, svc_type, svc_name, path):  # pylint: disable=unused-argument
+        return {path: self._counter(svc_name, path, self.counter_points)}
+
+    def get_latest_counters(self, svc_type, paths):
+        assert svc_type == 'osd'
+        return {str(osd_id): {path: self._counter(str(osd_id), path, 2) for path in paths}
+                for osd_id in range(self.num_osds)}
+
+    def get_updated_pool_stats(self):
+        now = time.time()
+        for pool in self.get('df')['pools']:
+            for stat_name, stat_val in pool['stats'].items():
+                self._pool_stats[pool['id']][stat_name].append((now, stat_val))
+        return self._pool_stats
+
+    def list_servers(self):
+        return [{'hostname': host, 'ceph_version': 'ceph version 15.0.0',
+                 'services': [{'type': 'osd', 'id': str(osd_id)}
+                              for osd_id in range(self.num_osds)
+                              if self._host(osd_id) == host]}
+                for host in self.hosts]
+
+    def get_metadata(self, svc_type, svc_id):
+        if svc_type == 'osd':
+            return self.get('osd_metadata').get(str(svc_id))
+        return None
+
+    def open_ioctx(self, pool_name):
+        if pool_name not in self.images:
+            raise rados.ObjectNotFound(pool_name)
+        return FakeIoctx(self, pool_name)
+
+
+class FakeIoctx(object):
+    def __init__(self, cluster, pool_name):
+        self.cluster = cluster
+        self.pool_name = pool_name
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        pass
+
+
+class FakeRBD(object):
+    def list(self, ioctx):
+        return list(ioctx.cluster.images[ioctx.pool_name])
+
+    def config_list(self, ioctx):  # pylint: disable=unused-argument
+        return []
+
+    def mirror_mode_get(self, ioctx):  # pylint: disable=unused-argument
+        return rbd.RBD_MIRROR_MODE_DISABLED
+
+    def mirror_peer_list(self, ioctx):  # pylint: disable=unused-argument
+        return []
+
+
+class FakeImage(object):
+    SIZE = 10 * GiB
+    ORDER = 22
+
+    def __init__(self, ioctx, name, *args, **kwargs):  # pylint: disable=unused-argument
+        if name not in ioctx.cluster.images[ioctx.pool_name]:
+            raise rbd.ImageNotFound(name)
+        self.ioctx = ioctx
+        self.name = name
+        self.snaps = ioctx.cluster.snaps_per_image
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        pass
+
+    def stat(self):
+        return {'size': self.SIZE, 'obj_size': 1 << self.ORDER,
+                'num_objs': self.SIZE >> self.ORDER, 'order': self.ORDER,
+                'block_name_prefix': 'rbd_data.{}'.format(self.id()),
+                'parent_pool': -1, 'parent_name': ''}
+
+    def id(self):
+        return '{}.{}'.format(self.ioctx.pool_name, self.name)
+
+    def features(self):
+        return (rbd.RBD_FEATURE_LAYERING | rbd.RBD_FEATURE_EXCLUSIVE_LOCK |
+                rbd.RBD_FEATURE_OBJECT_MAP | rbd.RBD_FEATURE_FAST_DIFF |
+                rbd.RBD_FEATURE_DEEP_FLATTEN)
+
+    def flags(self):
+        return 0
+
+    def create_timestamp(self):
+        return datetime.datetime(2019, 1, 1)
+
+    def stripe_count(self):
+        return 1
+
+    def stripe_unit(self):
+        return 1 << self.ORDER
+
+    def data_pool_id(self):
+        return self.ioctx.cluster.pool_names.index(self.ioctx.pool_name) + 1
+
+    def parent_info(self):
+        raise rbd.ImageNotFound(self.name)
+
+    def list_snaps(self):
+        return [{'id': snap_id, 'size': self.SIZE, 'name': 'snap{}'.format(snap_id)}
+                for snap_id in range(1, self.snaps + 1)]
+
+    def get_snap_timestamp(self, snap_id):  # pylint: disable=unused-argument
+        return datetime.datetime(2019, 1, 2)
+
+    def is_protected_snap(self, snap_name):  # pylint: disable=unused-argument
+        return False
+
+    def set_snap(self, snap_name):
+        pass
+
+    def list_children(self):
+        return []
+
+    def diff_iterate(self, offset, length, from_snapshot, iterate_cb,
+                     **kwargs):  # pylint: disable=unused-argument
+        # a tenth of the objects was written
+        obj_size = 1 << self.ORDER
+        for obj in range(0, length // obj_size, 10):
+            iterate_cb(offset + obj * obj_size, obj_size, True)
+
+    def config_list(self):
+        return []
+
+
+def percentile(values, percent):
+    """
+    >>> percentile([3, 1, 2, 4], 50)
+    2
+    >>> percentile([3, 1, 2, 4], 99)
+    4
+    """
+    values = sorted(values)
+    return values[max(0, min(len(values) - 1,
+                              int(round(percent / 100.0 * len(values) + 0.5)) - 1))]
+
+
+class _CpuTimer(object):
+    """
+    WSGI middleware measuring the CPU time spent by the server thread on
+    each request, including sending the response body.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self.lock = threading.Lock()
+        self.cpu = defaultdict(list)
+
+    def __call__(self, environ, start_response):
+        start = _thread_time() if _thread_time else None
+        body = list(self.app(environ, start_response))
+        if start is not None:
+            endpoint = environ['PATH_INFO']
+            if environ.get('QUERY_STRING'):
+                endpoint += '?' + environ['QUERY_STRING']
+            with self.lock:
+                self.cpu[endpoint].append(_thread_time() - start)
+        return body
+
+
+class BenchmarkServer(object):
+    """
+    Serves the dashboard controllers on localhost, with a FakeCluster in
+    place of the mgr, and without authentication.
+    """
+
+    def __init__(self, cluster, threads=10):
+        self.cluster = cluster
+        self.threads = threads
+        self.server = None
+        self.thread = None
+        self.timer = None
+        self.port = None
+        self._patches = []
+
+    def _app(self):
+        mapper = cherrypy.dispatch.RoutesDispatcher()
+        # endpoints() wraps the handlers of the controller classes, this can
+        # only be done once per process
+        for ctrl in CONTROLLERS:
+            inst = ctrl()
+            for endpoint in ctrl.endpoints():
+                endpoint.inst = inst
+                generate_controller_routes(endpoint, mapper, '')
+        return cherrypy.Application(None, config={'/': {
+            'request.dispatch': mapper,
+            'error_page.default': json_error_page,
+            'tools.dashboard_gzip.on': True,
+            'tools.dashboard_gzip.min_size': 1024,
+            'tools.dashboard_gzip.mime_types': ['application/json'],
+            'tools.json_in.on': True,
+            'tools.json_in.force': False,
+        }})
+
+    def start(self):
+        cluster = self.cluster
+        self._patches = [
+            mock.patch.multiple(
+                mgr, get=cluster.get, get_counter=cluster.get_counter,
+                get_latest_counters=cluster.get_latest_counters,
+                get_updated_pool_stats=cluster.get_updated_pool_stats,
+                list_servers=cluster.list_servers, get_metadata=cluster.get_metadata,
+                get_daemon_status=lambda svc_type, svc_id: None,
+                get_mgr_id=lambda: 'x', have_mon_connection=lambda: True,
+                version='15.0.0',
+                get_module_option=lambda key, default=None: default,
+                get_module_option_ex=lambda module, key, default=None: default,
+                get_store=lambda key, default=None: default,
+                set_store=lambda key, value: None,
+                rados=mock.Mock(open_ioctx=cluster.open_ioctx)),
+            mock.patch.object(rbd, 'RBD', FakeRBD),
+            mock.patch.object(rbd, 'Image', FakeImage),
+            mock.patch.object(AuthManager, 'authorize', return_value=True),
+            mock.patch.object(cherrypy.tools, 'authenticate', cherrypy.Tool(
+                'before_handler', lambda: JwtManager.set_user({'username': 'benchmark'}),
+                priority=20), create=True),
+            mock.patch.object(cherrypy.tools, 'dashboard_exception_handler',
+                              HandlerWrapperTool(dashboard_exception_handler, priority=31),
+                              create=True),
+            mock.patch.object(cherrypy.tools, 'dashboard_gzip', cherrypy.Tool(
+                'before_finalize', gzip_large_responses, priority=80), create=True),
+        ]
+        for patch in self._patches:
+            patch.start()
+
+        sock = socket.socket()
+        sock.bind(('127.0.0.1', 0))
+        self.port = sock.getsockname()[1]
+        sock.close()
+        self.timer = _CpuTimer(self._app())
+        self.server = wsgi.Server(('127.0.0.1', self.port), self.timer,
+                                  numthreads=self.threads)
+        # the engine runs the request hooks, but the server is ours
+        cherrypy.server.unsubscribe()
+        cherrypy.engine.start()
+        self.thread = threading.Thread(target=self.server.start)
+        self.thread.daemon = True
+        self.thread.start()
+        while not self.server.ready and self.thread.is_alive():
+            time.sleep(0.01)
+
+    def stop(self):
+        self.server.stop()
+        self.thread.join()
+        cherrypy.engine.stop()
+        cherrypy.server.subscribe()
+        for patch in reversed(self._patches):
+            patch.stop()
+
+    def url(self, endpoint):
+        return 'http://127.0.0.1:{}{}'.format(self.port, endpoint)
+
+
+def _load(server, endpoint, clients, requests_per_client):
+    latencies = []
+    errors = []
+    lock = threading.Lock()
+
+    def _client():
+        session = requests.Session()
+        for _ in range(requests_per_client):
+            start = time.time()
+            resp = session.get(server.url(endpoint), timeout=60)
+            latency = time.time() - start
+            with lock:
+                latencies.append(latency)
+                if resp.status_code >= 400:
+                    errors.append(resp.status_code)
+        session.close()
+
+    threads = [threading.Thread(target=_client) for _ in range(clients)]
+    start = time.time()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return latencies, errors, time.time() - start
+
+
+def run_benchmark(cluster, endpoints=None, clients=4, requests_per_client=20, warmup=2,
+                  threads=10):
+    # type: (FakeCluster, List[str], int, int, int, int) -> Dict[str, Dict[str, Any]]
+    """
+    Sends `clients` x `requests_per_client` concurrent requests to each of
+    the endpoints in turn, after `warmup` requests to fill the caches, and
+    returns the statistics of each endpoint.
+    """
+    server = BenchmarkServer(cluster, threads)
+    server.start()
+    results = {}
+    try:
+        for endpoint in endpoints or ENDPOINTS:
+            for _ in range(warmup):
+                requests.get(server.url(endpoint), timeout=60)
+                # let the view caches fill
+                time.sleep(0.1)
+            server.timer.cpu.pop(endpoint, None)
+            process_cpu = _process_time()
+            latencies, errors, duration = _load(server, endpoint, clients,
+                                                   requests_per_client)
+            process_cpu = _process_time() - process_cpu
+            cpu = server.timer.cpu.pop(endpoint, [])
+            results[endpoint] = {
+                'requests': len(latencies),
+                'errors': len(errors),
+                'rps': len(latencies) / duration,
+                'p50_ms': percentile(latencies, 50) * 1000,
+                'p90_ms': percentile(latencies, 90) * 1000,
+                'p99_ms': percentile(latencies, 99) * 1000,
+                'max_ms': max(latencies) * 1000,
+                'cpu_ms': sum(cpu) / len(cpu) * 1000 if cpu else None,
+                'process_cpu_s': process_cpu,
+            }
+    finally:
+        server.stop()
+    return results
+
+
+def _process_time():
+    try:
+        return time.process_time()
+    except AttributeError:
+        # Python 2
+        return time.clock()
+
+
+def _format(results):
+    header = ('endpoint', 'reqs', 'errs', 'req/s', 'p50 ms', 'p90 ms', 'p99 ms', 'max ms',
+              'cpu ms/req', 'cpu s')
+    width = max([len(header[0])] + [len(endpoint) for endpoint in results])
+    lines = ['{:<{w}} {:>5} {:>5} {:>8} {:>8} {:>8} {:>8} {:>8} {:>10} {:>7}'.format(
+        *header, w=width)]
+    for endpoint, r in sorted(results.items()):
+        lines.append(
+            '{:<{w}} {:>5} {:>5} {:>8.1f} {:>8.1f} {:>8.1f} {:>8.1f} {:>8.1f} {:>10} {:>7.2f}'
+            .format(endpoint, r['requests'], r['errors'], r['rps'], r['p50_ms'], r['p90_ms'],
+                    r['p99_ms'], r['max_ms'],
+                    '{:.2f}'.format(r['cpu_ms']) if r['cpu_ms'] is not None else 'n/a',
+                    r['process_cpu_s'], w=width))
+    return '\n'.join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--osds', type=int, default=100)
+    parser.add_argument('--osds-per-host', type=int, default=10)
+    parser.add_argument('--pools', type=int, default=10)
+    parser.add_argument('--pgs-per-pool', type=int, default=128)
+    parser.add_argument('--images', type=int, default=100, help='RBD images per pool')
+    parser.add_argument('--snaps', type=int, default=2, help='snapshots per RBD image')
+    parser.add_argument('--clients', type=int, default=4, help='concurrent clients')
+    parser.add_argument('--requests', type=int, default=20,
+                        help='requests per client and endpoint')
+    parser.add_argument('--warmup', type=int, default=2,
+                        help='requests per endpoint before measuring')
+    parser.add_argument('--threads', type=int, default=10, help='server threads')
+    parser.add_argument('--endpoint', action='append', dest='endpoints',
+                        help='endpoint to benchmark, may be repeated (default: {})'
+                        .format(', '.join(ENDPOINTS)))
+    parser.add_argument('--json', action='store_true', help='print the results as JSON')
+    args = parser.parse_args(argv)
+
+    # the dashboard logs every request at debug level in unit test mode
+    logging.getLogger().setLevel(logging.WARNING)
+    for handler in logging.getLogger().handlers:
+        handler.setLevel(logging.WARNING)
+
+    cherrypy.config.update({'engine.autoreload.on': False, 'log.screen': False})
+
+    cluster = FakeCluster(osds=args.osds, osds_per_host=args.osds_per_host, pools=args.pools,
+                          pgs_per_pool=args.pgs_per_pool, images=args.images,
+                          snaps=args.snaps)
+    results = run_benchmark(cluster, args.endpoints, args.clients, args.requests,
+                            args.warmup, args.threads)
+    cherrypy.engine.exit()
+    if args.json:
+        print(json.dumps(results, indent=2, sort_keys=True))
+    else:
+        print(_format(results))
+    return 0 if not any(r['errors'] for r in results.values()) else 1
+
+
+if __name__ == '__main__':
+    import sys
+    sys.exit(main())
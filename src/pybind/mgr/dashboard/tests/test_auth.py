@@ -0,0 +1,58 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import
+
+import json
+import time
+import unittest
+
+from mock import patch
+
+from . import KVStoreMockMixin
+from .. import mgr
+from ..services.auth import JwtManager
+
+
+class JwtBlacklistTest(unittest.TestCase, KVStoreMockMixin):
+
+    def setUp(self):
+        self.mock_kv_store()
+        mgr.get_store.reset_mock()
+        mgr.set_store.reset_mock()
+        JwtManager._blacklist = None  # pylint: disable=protected-access
+
+    @staticmethod
+    def _blacklist(jti, exp):
+        with patch('dashboard.services.auth.jwt.decode',
+                   return_value={'jti': jti, 'exp': exp}):
+            JwtManager.blacklist_token('token')
+
+    def test_blacklist(self):
+        now = int(time.time())
+        self._blacklist('a', now + 100)
+        self.assertTrue(JwtManager.is_blacklisted('a'))
+        self.assertFalse(JwtManager.is_blacklisted('b'))
+        self.assertEqual(json.loads(self.get_key(JwtManager.JWT_TOKEN_BLACKLIST_KEY)),
+                         {'a': now + 100})
+        # the store is only read once
+        self.assertEqual(mgr.get_store.call_count, 1)
+
+    def test_load(self):
+        now = int(time.time())
+        self.CONFIG_KEY_DICT[JwtManager.JWT_TOKEN_BLACKLIST_KEY] = json.dumps(
+            {'a': now + 100, 'b': now - 100})
+        self.assertTrue(JwtManager.is_blacklisted('a'))
+        self.assertFalse(JwtManager.is_blacklisted('b'))
+        self.assertEqual(mgr.set_store.call_count, 0)
+
+    def test_prune(self):
+        now = int(time.time())
+        self._blacklist('a', now - 100)
+        self._blacklist('b', now + 100)
+        self.assertFalse(JwtManager.is_blacklisted('a'))
+        self.assertEqual(json.loads(self.get_key(JwtManager.JWT_TOKEN_BLACKLIST_KEY)),
+                         {'b': now + 100})
+
+        # blacklisting a token twice does not write to the store again
+        writes = mgr.set_store.call_count
+        self._blacklist('b', now + 100)
+        self.assertEqual(mgr.set_store.call_count, writes)
@@ -0,0 +1,29 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import
+
+import json
+import os
+import subprocess
+import sys
+import unittest
+
+from .benchmark import ENDPOINTS
+
+
+class BenchmarkTest(unittest.TestCase):
+
+    def test_run(self):
+        # in a process of its own, as the benchmark sets up the controller
+        # classes and the CherryPy engine for itself
+        mgr_dir = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+        output = subprocess.check_output(
+            [sys.executable, '-m', 'dashboard.tests.benchmark', '--osds', '4',
+             '--osds-per-host', '2', '--pools', '2', '--pgs-per-pool', '8', '--images', '3',
+             '--clients', '2', '--requests', '2', '--warmup', '1', '--json'],
+            cwd=mgr_dir)
+        results = json.loads(output.decode('utf-8'))
+        self.assertEqual(sorted(results), sorted(ENDPOINTS))
+        for endpoint, result in results.items():
+            self.assertEqual(result['requests'], 4, endpoint)
+            self.assertEqual(result['errors'], 0, endpoint)
+            self.assertLessEqual(result['p50_ms'], result['max_ms'])
@@ -0,0 +1,107 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import
+
+import threading
+import time
+import unittest
+
+from ..plugins.lru_cache import lru_cache
+from ..plugins.ttl_cache import ttl_cache
+
+
+class LruCacheTest(unittest.TestCase):
+
+    def test_evict(self):
+        calls = []
+
+        @lru_cache(maxsize=2)
+        def _double(x):
+            calls.append(x)
+            return 2 * x
+
+        self.assertEqual([_double(1), _double(2), _double(1), _double(3)], [2, 4, 2, 6])
+        # 2 was the least recently used
+        _double(2)
+        _double(1)
+        self.assertEqual(calls, [1, 2, 3, 2, 1])
+
+    def test_single_flight(self):
+        started = threading.Event()
+        release = threading.Event()
+        calls = []
+
+        @lru_cache()
+        def _slow(x):
+            calls.append(x)
+            if x == 'slow':
+                started.set()
+                release.wait(5)
+            return x
+
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(_slow('slow')))
+                   for _ in range(3)]
+        threads[0].start()
+        self.assertTrue(started.wait(5))
+        for thread in threads[1:]:
+            thread.start()
+        # other keys are not blocked by the slow call
+        self.assertEqual(_slow('fast'), 'fast')
+        release.set()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(results, ['slow'] * 3)
+        self.assertEqual(sorted(calls), ['fast', 'slow'])
+
+    def test_exception(self):
+        calls = []
+
+        @lru_cache()
+        def _fail():
+            calls.append(None)
+            raise ValueError()
+
+        self.assertRaises(ValueError, _fail)
+        self.assertRaises(ValueError, _fail)
+        self.assertEqual(len(calls), 2)
+
+
+class TtlCacheTest(unittest.TestCase):
+
+    def test_expire(self):
+        calls = []
+
+        @ttl_cache(ttl=0.05)
+        def _count():
+            calls.append(None)
+            return len(calls)
+
+        self.assertEqual(_count(), 1)
+        self.assertEqual(_count(), 1)
+        time.sleep(0.1)
+        self.assertEqual(_count(), 2)
+        self.assertIn('hits=1, misses=2, expired=1', _count.cache_info())
+
+    def test_stale(self):
+        started = threading.Event()
+        release = threading.Event()
+        calls = []
+
+        @ttl_cache(ttl=0.05, stale=60)
+        def _count():
+            calls.append(None)
+            if len(calls) > 1:
+                started.set()
+                release.wait(5)
+            return len(calls)
+
+        self.assertEqual(_count(), 1)
+        time.sleep(0.1)
+        refresh = threading.Thread(target=_count)
+        refresh.start()
+        self.assertTrue(started.wait(5))
+        # the expired value is returned while it is being refreshed
+        self.assertEqual(_count(), 1)
+        release.set()
+        refresh.join()
+        self.assertEqual(_count(), 2)
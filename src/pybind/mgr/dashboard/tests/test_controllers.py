@@ -4,6 +4,7 @@ from __future__ import absolute_import
 from . import ControllerTestCase
 from ..controllers import BaseController, RESTController, Controller, \
                           ApiController, Endpoint
+from ..tools import PayloadStats
 
 
 @Controller("/btest/{key}", base_url="/ui", secure=False)
@@ -181,6 +182,35 @@ class ControllersTest(ControllerTestCase):
         self.assertJsonBody({'key': '300', 'skey': '2', 'ekey': '3',
                              'opt': '4'})
 
+    def test_rest_list_not_modified(self):
+        PayloadStats.reset()
+        self._get('/test/api/rtest/{}?opt=2'.format(300))
+        self.assertStatus(200)
+        etag = self.assertHeader('ETag')
+        self.assertTrue(etag.startswith('W/"'))
+
+        self.getPage('/test/api/rtest/{}?opt=2'.format(300),
+                     headers=[('If-None-Match', etag)])
+        self.assertStatus(304)
+        self.assertBody('')
+        self.assertHeader('ETag', etag)
+
+        # a different response does not match
+        self.getPage('/test/api/rtest/{}?opt=3'.format(300),
+                     headers=[('If-None-Match', etag)])
+        self.assertStatus(200)
+        self.assertJsonBody({'key': '300', 'opt': '3'})
+
+        stats = PayloadStats.get_stats()['GET /api/rtest/{key}']
+        self.assertEqual(stats['count'], 3)
+        self.assertEqual(stats['not_modified'], 1)
+        self.assertEqual(stats['bytes_max'], len('{"key": "300", "opt": "2"}'))
+
+    def test_rest_delete_no_etag(self):
+        self._delete('/test/api/rtest/{}/{}/{}?opt=3'.format(300, 1, 2))
+        self.assertStatus(204)
+        self.assertNoHeader('ETag')
+
 
 class RootControllerTest(ControllerTestCase):
     @classmethod
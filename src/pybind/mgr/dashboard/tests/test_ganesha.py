@@ -3,7 +3,7 @@ from __future__ import absolute_import
 
 import unittest
 
-from mock import MagicMock, Mock
+from mock import MagicMock, Mock, patch
 
 from . import KVStoreMockMixin
 from .. import mgr
@@ -84,6 +84,7 @@ EXPORT
         def __init__(self, key, raw):
             self.key = key
             self.raw = raw
+            self.mtime = 0
 
         def read(self, _):
             return self.raw.encode('utf-8')
@@ -97,6 +98,7 @@ EXPORT
                                                            content.decode('utf-8'))
         else:
             self.temp_store[key].raw = content.decode('utf-8')
+            self.temp_store[key].mtime += 1
 
     def _ioctx_remove_mock(self, key):
         del self.temp_store[key]
@@ -104,6 +106,18 @@ EXPORT
     def _ioctx_list_objects_mock(self):
         return [obj for _, obj in self.temp_store.items()]
 
+    def _ioctx_aio_stat_mock(self, key, oncomplete):
+        obj = self.temp_store.get(key)
+        if obj is None:
+            oncomplete(Mock(), None, None)
+        else:
+            oncomplete(Mock(), len(obj.raw), obj.mtime)
+        return Mock()
+
+    def _ioctx_aio_read_mock(self, key, length, offset, oncomplete):
+        oncomplete(Mock(), self.temp_store[key].raw.encode('utf-8')[offset:offset + length])
+        return Mock()
+
     def setUp(self):
         self.mock_kv_store()
 
@@ -120,6 +134,9 @@ EXPORT
         self.io_mock.list_objects.side_effect = self._ioctx_list_objects_mock
         self.io_mock.write_full.side_effect = self._ioctx_write_full_mock
         self.io_mock.remove_object.side_effect = self._ioctx_remove_mock
+        self.io_mock.aio_stat.side_effect = self._ioctx_aio_stat_mock
+        self.io_mock.aio_read.side_effect = self._ioctx_aio_read_mock
+        GaneshaConf._conf_cache.clear()  # pylint: disable=protected-access
 
         ioctx_mock = MagicMock()
         ioctx_mock.__enter__ = Mock(return_value=(self.io_mock))
@@ -253,6 +270,58 @@ EXPORT
         self.assertEqual(export.fsal.secret_key, "secret_key")
         self.assertEqual(len(export.clients), 0)
 
+    def test_ganesha_conf_cache(self):
+        GaneshaConf.instance('_default_')
+        with patch.object(GaneshaConfParser, 'parse', autospec=True,
+                          side_effect=GaneshaConfParser.parse) as parse_mock:
+            conf = GaneshaConf.instance('_default_')
+            self.assertEqual(parse_mock.call_count, 0)
+            self.assertEqual(sorted(conf.exports), [1, 2])
+
+            # only the modified object is parsed again
+            self._ioctx_write_full_mock('export-2', self.export_2.replace(
+                'Pseudo = "/rgw"', 'Pseudo = "/rgw2"').encode('utf-8'))
+            conf = GaneshaConf.instance('_default_')
+            self.assertEqual(parse_mock.call_count, 1)
+            self.assertEqual(conf.exports[2].pseudo, "/rgw2")
+
+            self._ioctx_write_full_mock('conf-nodea', self.conf_nodeb.encode('utf-8'))
+            self._ioctx_remove_mock('export-2')
+            conf = GaneshaConf.instance('_default_')
+            self.assertEqual(parse_mock.call_count, 2)
+            self.assertEqual(sorted(conf.exports), [1])
+            self.assertEqual(conf.exports[1].daemons, {"nodea", "nodeb"})
+
+    def test_ganesha_conf_cache_write(self):
+        # the write below keeps the size and the modification time
+        self.io_mock.aio_stat.side_effect = \
+            lambda key, oncomplete: oncomplete(Mock(), 1, 0) or Mock()
+        read = self._ioctx_aio_read_mock
+        self.io_mock.aio_read.side_effect = \
+            lambda key, length, offset, oncomplete: read(
+                key, len(self.temp_store[key].raw), offset, oncomplete)
+        writer = GaneshaConf.instance('_default_')
+        export = writer.exports[2]
+        export.pseudo = "/rgw2"
+
+        def _aio_read_during_write(key, length, offset, oncomplete):
+            if key == 'export-2':
+                old_raw = self.temp_store[key].raw
+                writer._write_raw_config(  # pylint: disable=protected-access
+                    export.to_export_block(writer.export_defaults), key)
+                oncomplete(Mock(), old_raw.encode('utf-8'))
+                return Mock()
+            return read(key, len(self.temp_store[key].raw), offset, oncomplete)
+
+        with patch.object(self.io_mock, 'aio_read', side_effect=_aio_read_during_write):
+            GaneshaConf._conf_cache.clear()  # pylint: disable=protected-access
+            conf = GaneshaConf.instance('_default_')
+        self.assertEqual(conf.exports[2].pseudo, "/rgw")
+
+        # the read overlapping the write was not cached
+        conf = GaneshaConf.instance('_default_')
+        self.assertEqual(conf.exports[2].pseudo, "/rgw2")
+
     def test_config_dict(self):
         conf = GaneshaConf.instance('_default_')
         export = conf.exports[1]
@@ -8,6 +8,7 @@ from mock import patch
 
 from . import ControllerTestCase
 from ..controllers.osd import Osd
+from ..services.osd import OsdService
 from .. import mgr
 from .helper import update_dict
 
@@ -203,10 +204,18 @@ class OsdTest(ControllerTestCase):
         Osd._cp_config['tools.authenticate.on'] = False  # pylint: disable=protected-access
         cls.setup_controllers([Osd])
 
+    def setUp(self):
+        # pylint: disable=protected-access
+        OsdService._tree_epoch = None
+        OsdService._history = {}
+
     @contextmanager
     def _mock_osd_list(self, osd_stat_ids, osdmap_tree_node_ids, osdmap_ids):
         def mgr_get_replacement(*args, **kwargs):
             method = args[0] or kwargs['method']
+            if method == 'osd_map':
+                return {'epoch': 10,
+                        'osds': list(OsdHelper.gen_osdmap(osdmap_ids).values())}
             if method == 'osd_stats':
                 return {'osd_stats': OsdHelper.gen_osd_stats(osd_stat_ids)}
             if method == 'osd_map_tree':
@@ -218,11 +227,18 @@ class OsdTest(ControllerTestCase):
                 return {path: OsdHelper.gen_mgr_get_counter()}
             raise NotImplementedError()
 
-        with patch.object(Osd, 'get_osd_map', return_value=OsdHelper.gen_osdmap(osdmap_ids)):
-            with patch.object(mgr, 'get', side_effect=mgr_get_replacement):
-                with patch.object(mgr, 'get_counter', side_effect=mgr_get_counter_replacement):
-                    with patch.object(mgr, 'get_latest', return_value=1146609664):
-                        yield
+        def mgr_get_latest_counters_replacement(svc_type, paths):
+            if svc_type == 'osd':
+                return {str(osd_id): {path: OsdHelper.gen_mgr_get_counter()[-2:]
+                                      for path in paths}
+                        for osd_id in osdmap_ids or OsdHelper.DEFAULT_OSD_IDS}
+            raise NotImplementedError()
+
+        with patch.object(mgr, 'get', side_effect=mgr_get_replacement):
+            with patch.object(mgr, 'get_counter', side_effect=mgr_get_counter_replacement):
+                with patch.object(mgr, 'get_latest_counters',
+                                  side_effect=mgr_get_latest_counters_replacement):
+                    yield
 
     def test_osd_list_aggregation(self):
         """
@@ -238,3 +254,43 @@ class OsdTest(ControllerTestCase):
             self._get('/api/osd')
             self.assertEqual(len(self.jsonBody()), 2, 'It should display two OSDs without failure')
             self.assertStatus(200)
+
+    def test_osd_list_stats(self):
+        with self._mock_osd_list(osd_stat_ids=[0, 1, 2], osdmap_tree_node_ids=[0, 1, 2],
+                                 osdmap_ids=[0, 1, 2]):
+            self._get('/api/osd')
+            self.assertStatus(200)
+            osd = self.jsonBody()[0]
+            self.assertEqual(osd['host']['name'], 'ceph-1')
+            self.assertEqual(osd['stats']['op_w'], 0.0)
+            self.assertEqual(osd['stats']['numpg'], 35)
+            self.assertEqual(len(osd['stats_history']['op_w']), 3)
+            self.assertEqual(mgr.get_latest_counters.call_count, 1)
+
+    def test_osd_list_page(self):
+        with self._mock_osd_list(osd_stat_ids=[0, 1, 2], osdmap_tree_node_ids=[0, 1, 2],
+                                 osdmap_ids=[0, 1, 2]):
+            self._get('/api/osd?sort=-id&offset=1&limit=1&fields=host')
+            self.assertStatus(200)
+            self.assertHeader('X-Total-Count', '3')
+            self.assertEqual(self.jsonBody()[0]['id'], 1)
+            self.assertEqual(sorted(self.jsonBody()[0]), ['host', 'id'])
+
+    def test_osd_list_page_invalid(self):
+        with self._mock_osd_list(osd_stat_ids=[0, 1, 2], osdmap_tree_node_ids=[0, 1, 2],
+                                 osdmap_ids=[0, 1, 2]):
+            for query in ['sort=host', 'sort=-osd_stats', 'offset=x', 'offset=-1',
+                          'limit=1.5']:
+                self._get('/api/osd?{}'.format(query))
+                self.assertStatus(400)
+
+    def test_osd_list_stale_history(self):
+        with self._mock_osd_list(osd_stat_ids=[0], osdmap_tree_node_ids=[0], osdmap_ids=[0]):
+            self._get('/api/osd')
+            self.assertEqual(len(self.jsonBody()[0]['stats_history']['op_w']), 3)
+            # not listed for longer than the mgr keeps data points
+            later = [[stamp + 3600, value] for stamp, value in OsdHelper.gen_mgr_get_counter()]
+            with patch.object(OsdHelper, 'gen_mgr_get_counter', return_value=later):
+                self._get('/api/osd')
+            history = self.jsonBody()[0]['stats_history']['op_w']
+            self.assertEqual([rate[0] for rate in history], [stamp for stamp, _ in later[1:]])
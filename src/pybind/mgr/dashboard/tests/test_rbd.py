@@ -0,0 +1,118 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import
+
+import unittest
+
+import mock
+
+from . import ControllerTestCase
+from ..controllers.rbd import Rbd
+from ..tools import ViewCache
+
+
+class RbdListTest(ControllerTestCase):
+
+    POOLS = {
+        'rbd': ['img-c', 'img-a', 'other'],
+        'rbd2': ['img-b'],
+    }
+
+    @classmethod
+    def setup_server(cls):
+        # pylint: disable=protected-access
+        Rbd._cp_config['tools.authenticate.on'] = False
+        # pylint: enable=protected-access
+        cls.setup_controllers([Rbd])
+
+    def setUp(self):
+        def _images(pool_name, names):
+            return [{'pool_name': pool_name, 'name': name} for name in names]
+
+        self.patches = [
+            mock.patch('dashboard.controllers.rbd.CephService.get_pool_list',
+                       return_value=[{'pool_name': pool} for pool in sorted(self.POOLS)]),
+            mock.patch.object(Rbd, '_rbd_pool_names',
+                              side_effect=lambda pool: (ViewCache.VALUE_OK, self.POOLS[pool])),
+        ]
+        for patch in self.patches:
+            patch.start()
+        images_patch = mock.patch.object(Rbd, '_rbd_images', side_effect=_images)
+        self.images_mock = images_patch.start()
+        self.patches.append(images_patch)
+
+    def tearDown(self):
+        for patch in self.patches:
+            patch.stop()
+
+    def test_list_page(self):
+        self._get('/api/block/image?offset=1&limit=2')
+        self.assertStatus(200)
+        self.assertHeader('X-Total-Count', '4')
+        # in the order of the page
+        self.assertJsonBody([
+            {'status': ViewCache.VALUE_OK, 'pool_name': 'rbd2',
+             'value': [{'pool_name': 'rbd2', 'name': 'img-b'}]},
+            {'status': ViewCache.VALUE_OK, 'pool_name': 'rbd',
+             'value': [{'pool_name': 'rbd', 'name': 'img-c'}]},
+        ])
+        # only the images on the page are opened
+        self.images_mock.assert_has_calls([mock.call('rbd', ['img-c']),
+                                           mock.call('rbd2', ['img-b'])])
+
+    def test_list_page_sort_search(self):
+        self._get('/api/block/image?pool_name=rbd&limit=10&sort=-name&search=img')
+        self.assertStatus(200)
+        self.assertHeader('X-Total-Count', '2')
+        self.assertJsonBody([
+            {'status': ViewCache.VALUE_OK, 'pool_name': 'rbd',
+             'value': [{'pool_name': 'rbd', 'name': 'img-c'},
+                       {'pool_name': 'rbd', 'name': 'img-a'}]},
+        ])
+
+    def test_list_page_interleaved(self):
+        self._get('/api/block/image?limit=3&sort=-name')
+        self.assertStatus(200)
+        self.assertJsonBody([
+            {'status': ViewCache.VALUE_OK, 'pool_name': 'rbd',
+             'value': [{'pool_name': 'rbd', 'name': 'other'},
+                       {'pool_name': 'rbd', 'name': 'img-c'}]},
+            {'status': ViewCache.VALUE_OK, 'pool_name': 'rbd2',
+             'value': [{'pool_name': 'rbd2', 'name': 'img-b'}]},
+        ])
+        self._get('/api/block/image?offset=3&limit=1')
+        self.assertJsonBody([
+            {'status': ViewCache.VALUE_OK, 'pool_name': 'rbd',
+             'value': [{'pool_name': 'rbd', 'name': 'other'}]},
+            {'status': ViewCache.VALUE_OK, 'pool_name': 'rbd2', 'value': []},
+        ])
+
+    def test_list_page_bad_sort(self):
+        self._get('/api/block/image?limit=10&sort=size')
+        self.assertStatus(400)
+        self._get('/api/block/image?offset=-1')
+        self.assertStatus(400)
+
+
+class RbdDiskUsageTest(unittest.TestCase):
+
+    def test_snapshot_usage_cached(self):
+        image = mock.Mock()
+        image.id.return_value = 'abc'
+        image.diff_iterate.side_effect = \
+            lambda offset, length, from_snap, cb, whole_object: cb(0, 1024, True)
+        snaps = [(1, 4096, 'snap1'), (2, 4096, 'snap2'), (3, 4096, None)]
+
+        # pylint: disable=protected-access
+        self.assertEqual(Rbd._rbd_disk_usage('rbd', image, snaps),
+                         (3072, {'snap1': 1024, 'snap2': 1024, None: 1024}))
+        self.assertEqual(image.diff_iterate.call_count, 3)
+
+        # only the image head is iterated again
+        self.assertEqual(Rbd._rbd_disk_usage('rbd', image, snaps),
+                         (3072, {'snap1': 1024, 'snap2': 1024, None: 1024}))
+        self.assertEqual(image.diff_iterate.call_count, 4)
+        image.set_snap.assert_called_with(None)
+
+        # the same image id in another pool is another image
+        Rbd._rbd_disk_usage('rbd2', image, snaps)
+        self.assertEqual(image.diff_iterate.call_count, 7)
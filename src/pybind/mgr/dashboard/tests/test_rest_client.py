@@ -5,7 +5,7 @@ import requests.exceptions
 from mock import patch
 from urllib3.exceptions import MaxRetryError, ProtocolError
 from .. import mgr
-from ..rest_client import RequestException, RestClient
+from ..rest_client import RequestException, RestClient, fan_out
 
 
 class RestClientTest(unittest.TestCase):
@@ -46,6 +46,33 @@ class RestClientTest(unittest.TestCase):
                 None, None, 40)
 
 
+class RestClientSessionTest(unittest.TestCase):
+    def test_session_shared(self):
+        session = RestClient('localhost', 8000).session
+        self.assertIs(RestClient('localhost', 8000, 'other').session, session)
+        self.assertIsNot(RestClient('localhost', 8001).session, session)
+        self.assertIsNot(RestClient('localhost', 8000, ssl=True).session, session)
+        self.assertIsNot(RestClient('localhost', 8000, ssl_verify=False).session, session)
+
+    def test_session_pool(self):
+        adapter = RestClient('localhost', 8000).session.get_adapter('http://localhost:8000/')
+        self.assertEqual(adapter.max_retries.total, RestClient.RETRIES)
+        self.assertEqual(adapter.max_retries.read, 0)
+        self.assertTrue(adapter._pool_block)  # pylint: disable=protected-access
+        self.assertEqual(adapter._pool_maxsize,  # pylint: disable=protected-access
+                         RestClient.POOL_MAXSIZE)
+
+    def test_fan_out(self):
+        self.assertEqual(fan_out(lambda x: x * 2, range(20)), list(range(0, 40, 2)))
+        self.assertEqual(fan_out(lambda x: x, []), [])
+
+        def _fail(x):
+            if x == 3:
+                raise RequestException('failed')
+            return x
+        self.assertRaises(RequestException, fan_out, _fail, range(5))
+
+
 class RestClientDoRequestTest(unittest.TestCase):
     @classmethod
     def setUpClass(cls):
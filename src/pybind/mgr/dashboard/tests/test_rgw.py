@@ -83,3 +83,15 @@ class RgwUserControllerTestCase(ControllerTestCase):
         }]
         self._get('/test/api/rgw/user')
         self.assertStatus(500)
+
+    @mock.patch('dashboard.controllers.rgw.RgwRESTController.proxy')
+    def test_user_get_emails(self, mock_proxy):
+        def _proxy(method, path, params=None):
+            if path == 'user?list':
+                return {'keys': ['test1', 'test2', 'test3'], 'truncated': False}
+            return {'user_id': params['uid'],
+                    'email': '' if params['uid'] == 'test2' else params['uid'] + '@x.com'}
+        mock_proxy.side_effect = _proxy
+        self._get('/test/api/rgw/user/get_emails')
+        self.assertStatus(200)
+        self.assertJsonBody(['test1@x.com', 'test3@x.com'])
@@ -0,0 +1,108 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import
+
+import json
+import threading
+import time
+import unittest
+
+from mock import patch
+
+from .. import mgr
+from ..services.summary import SummaryFeed
+from ..tools import NotificationQueue
+
+
+class SummaryFeedTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        NotificationQueue.start_queue()
+
+    @classmethod
+    def tearDownClass(cls):
+        NotificationQueue.stop()
+
+    def setUp(self):
+        self.health = 'HEALTH_OK'
+        mgr.get.side_effect = lambda key: {
+            'health': {'json': json.dumps({'status': self.health})},
+            'mgr_map': {'services': {'dashboard': 'http://host:8080/'}},
+        }[key]
+        mgr.have_mon_connection.return_value = True
+        patcher = patch('dashboard.services.summary.TaskManager.list_serializable',
+                        return_value=([], []))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        SummaryFeed.init()
+
+    def tearDown(self):
+        SummaryFeed.stop()
+        mgr.get.side_effect = None
+
+    def test_get_changes(self):
+        version, changes = SummaryFeed.get_changes()
+        self.assertEqual(changes, {
+            'health_status': 'HEALTH_OK',
+            'have_mon_connection': True,
+            'mgr_host': 'http://host:8080/',
+            'executing_tasks': [],
+            'finished_tasks': [],
+        })
+        self.assertEqual(SummaryFeed.get_changes(version), (version, {}))
+        # an unknown version gets everything
+        self.assertEqual(len(SummaryFeed.get_changes(version + 1)[1]), 5)
+
+    def test_notification(self):
+        version, _ = SummaryFeed.get_changes()
+        # notifications that do not change anything do not make a new version
+        NotificationQueue.new_notification('health', None)
+        self.assertEqual(SummaryFeed.get_changes(version, 0.2), (version, {}))
+
+        self.health = 'HEALTH_WARN'
+        NotificationQueue.new_notification('health', None)
+        new_version, changes = SummaryFeed.get_changes(version, 5)
+        self.assertGreater(new_version, version)
+        self.assertEqual(changes, {'health_status': 'HEALTH_WARN'})
+
+    def test_wait(self):
+        version, _ = SummaryFeed.get_changes()
+        result = []
+        waiter = threading.Thread(
+            target=lambda: result.append(SummaryFeed.get_changes(version, 5)))
+        start = time.time()
+        waiter.start()
+        time.sleep(0.1)
+        self.health = 'HEALTH_ERR'
+        NotificationQueue.new_notification('health', None)
+        waiter.join()
+        self.assertLess(time.time() - start, 5)
+        self.assertEqual(result[0][1], {'health_status': 'HEALTH_ERR'})
+
+    def test_max_waiters(self):
+        version, _ = SummaryFeed.get_changes()
+        with patch.object(SummaryFeed, 'MAX_WAITERS', 0):
+            start = time.time()
+            # told to retry later
+            self.assertEqual(SummaryFeed.get_changes(version, 5), (version, None))
+            self.assertLess(time.time() - start, 1)
+            # not waiting is always possible
+            self.assertEqual(SummaryFeed.get_changes(version), (version, {}))
+
+    def test_change_while_initializing(self):
+        get = mgr.get.side_effect
+        reads = []
+
+        def _get(key):
+            value = get(key)
+            if key == 'health' and not reads:
+                reads.append(key)
+                # changed, and notified, while the state is read
+                self.health = 'HEALTH_WARN'
+                NotificationQueue.new_notification('health', None)
+                time.sleep(0.5)
+            return value
+
+        mgr.get.side_effect = _get
+        _, changes = SummaryFeed.get_changes()
+        self.assertEqual(changes['health_status'], 'HEALTH_WARN')
@@ -8,6 +8,7 @@ import time
 from collections import defaultdict
 from functools import partial
 
+from . import KVStoreMockMixin
 from ..services.exception import serialize_dashboard_exception
 from ..tools import NotificationQueue, TaskManager, TaskExecutor
 
@@ -95,7 +96,7 @@ class MyTask(object):
         }
 
 
-class TaskTest(unittest.TestCase):
+class TaskTest(unittest.TestCase, KVStoreMockMixin):
 
     TASK_FINISHED_MAP = defaultdict(threading.Event)
 
@@ -109,6 +110,7 @@ class TaskTest(unittest.TestCase):
 
     @classmethod
     def setUpClass(cls):
+        cls.mock_kv_store()
         NotificationQueue.start_queue()
         TaskManager.init()
         NotificationQueue.register(cls._handle_task, 'cd_task_finished',
@@ -122,6 +124,8 @@ class TaskTest(unittest.TestCase):
     def setUp(self):
         TaskManager.FINISHED_TASK_SIZE = 10
         TaskManager.FINISHED_TASK_TTL = 60.0
+        TaskManager.FINISHED_TASK_MAX_SIZE = 100
+        TaskManager.MAX_CONCURRENT_PER_NAME = 4
 
     def assertTaskResult(self, result):
         self.assertEqual(result,
@@ -252,18 +256,71 @@ class TaskTest(unittest.TestCase):
         self.assertEqual(state, TaskManager.VALUE_DONE)
         self.assertTaskResult(result)
         self.wait_for_task('test7/task3')
-        time.sleep(1)
-        _, fn_t = TaskManager.list('test7/*')
-        self.assertEqual(len(fn_t), 3)
-        for idx, task in enumerate(fn_t):
-            self.assertEqual(task.name,
-                             "test7/task{}".format(len(fn_t)-idx))
         _, fn_t = TaskManager.list('test7/*')
         self.assertEqual(len(fn_t), 2)
         for idx, task in enumerate(fn_t):
             self.assertEqual(task.name,
                              "test7/task{}".format(len(fn_t)-idx+1))
 
+    def test_finished_max_size(self):
+        TaskManager.FINISHED_TASK_SIZE = 2
+        TaskManager.FINISHED_TASK_MAX_SIZE = 3
+        for i in range(5):
+            state, _ = MyTask(0).run('test11/task{}'.format(i))
+            self.assertEqual(state, TaskManager.VALUE_DONE)
+            self.wait_for_task('test11/task{}'.format(i))
+        _, fn_t = TaskManager.list()
+        self.assertEqual([t.name for t in fn_t],
+                         ['test11/task4', 'test11/task3', 'test11/task2'])
+
+    def _wait_for_finished(self, name_glob, count):
+        for _ in range(50):
+            _, fn_t = TaskManager.list(name_glob)
+            if len(fn_t) == count:
+                return fn_t
+            time.sleep(0.1)
+        self.fail('{} tasks {} not finished'.format(count, name_glob))
+        return None
+
+    def test_concurrency_limit(self):
+        TaskManager.MAX_CONCURRENT_PER_NAME = 1
+        task1 = MyTask(0, wait=True)
+        task2 = MyTask(0, progress=60)
+        other = MyTask(0, progress=70)
+        state, _ = task1.run('test12/task', 0.5)
+        self.assertEqual(state, TaskManager.VALUE_EXECUTING)
+        # waits for the running task of the same name
+        state, _ = task2.run('test12/task', 0.5)
+        self.assertEqual(state, TaskManager.VALUE_EXECUTING)
+        ex_t, _ = TaskManager.list('test12/*')
+        self.assertEqual(len(ex_t), 2)
+        # the queued task has not begun yet
+        ex_t, _ = TaskManager.list_serializable('test12/*')
+        self.assertIsNotNone(ex_t[0]['begin_time'])
+        self.assertIsNone(ex_t[1]['begin_time'])
+        # but not for the ones of other names
+        state, _ = other.run('test12/other', 0.5)
+        self.assertEqual(state, TaskManager.VALUE_DONE)
+
+        task1.resume()
+        fn_t = self._wait_for_finished('test12/task', 2)
+        self.assertEqual([t.metadata['progress'] for t in fn_t], [60, 50])
+        self.assertLessEqual(fn_t[1].end_time, fn_t[0].end_time)
+
+    def test_settings(self):
+        self.CONFIG_KEY_DICT['TASK_WORKERS'] = '3'
+        self.CONFIG_KEY_DICT['TASK_MAX_CONCURRENT_PER_NAME'] = '2'
+        try:
+            TaskManager.init()
+            self.assertEqual(TaskManager.workers.size, 3)
+            self.assertEqual(TaskManager.MAX_CONCURRENT_PER_NAME, 2)
+            state, _ = MyTask(0).run('test16/task', 1)
+            self.assertEqual(state, TaskManager.VALUE_DONE)
+        finally:
+            self.CONFIG_KEY_DICT.clear()
+            TaskManager.init()
+        self.assertEqual(TaskManager.workers.size, 10)
+
     def test_task_serialization_format(self):
         task1 = MyTask(0, wait=True, progress=20)
         task2 = MyTask(1)
@@ -1,6 +1,7 @@
 # -*- coding: utf-8 -*-
 from __future__ import absolute_import
 
+import threading
 import unittest
 
 import cherrypy
@@ -11,7 +12,8 @@ from . import ControllerTestCase
 from ..services.exception import handle_rados_error
 from ..controllers import RESTController, ApiController, Controller, \
                           BaseController, Proxy
-from ..tools import dict_contains_path, RequestLoggingTool
+from ..tools import dict_contains_path, RequestLoggingTool, ViewCache, \
+    WorkerPool, etag_matches, json_etag
 
 
 # pylint: disable=W0613
@@ -178,3 +180,80 @@ class TestFunctions(unittest.TestCase):
         self.assertTrue(dict_contains_path(x, ['a']))
         self.assertFalse(dict_contains_path(x, ['a', 'c']))
         self.assertTrue(dict_contains_path(x, []))
+
+    def test_etag_matches(self):
+        etag = json_etag(b'{}')
+        self.assertEqual(etag, json_etag(b'{}'))
+        self.assertNotEqual(etag, json_etag(b'[]'))
+        self.assertTrue(etag_matches(etag, etag))
+        self.assertTrue(etag_matches(etag, etag[2:]))
+        self.assertTrue(etag_matches(etag, '"foo", {}'.format(etag)))
+        self.assertTrue(etag_matches(etag, '*'))
+        self.assertFalse(etag_matches(etag, json_etag(b'[]')))
+        self.assertFalse(etag_matches(etag, None))
+
+
+class WorkerPoolTest(unittest.TestCase):
+
+    def test_submit(self):
+        pool = WorkerPool('test', 2)
+        done = []
+        for i in range(10):
+            pool.submit(done.append, i)
+        pool.stop()
+        self.assertEqual(sorted(done), list(range(10)))
+
+        # restarted on the next submission
+        event = threading.Event()
+        pool.submit(event.set)
+        self.assertTrue(event.wait(5))
+        pool.stop()
+
+
+class ViewCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.calls = []
+
+        @ViewCache()
+        def _get():
+            self.calls.append(None)
+            return len(self.calls)
+
+        self.get = _get
+
+    def tearDown(self):
+        ViewCache.stop()
+
+    def test_fresh(self):
+        self.assertEqual(self.get(), (ViewCache.VALUE_OK, 1))
+        self.assertEqual(self.get(), (ViewCache.VALUE_OK, 1))
+        self.assertEqual(len(self.calls), 1)
+
+    @patch.object(ViewCache, 'STALE_PERIOD', 0)
+    def test_stale_while_revalidate(self):
+        self.assertEqual(self.get(), (ViewCache.VALUE_OK, 1))
+        # the last value is returned while a refresh is started
+        self.assertEqual(self.get(), (ViewCache.VALUE_OK, 1))
+        ViewCache.workers.stop()
+        self.assertEqual(self.get(), (ViewCache.VALUE_OK, 2))
+
+    @patch.object(ViewCache, 'STALE_PERIOD', 0)
+    @patch.object(ViewCache, 'MAX_STALE_PERIOD', 0)
+    def test_expired(self):
+        self.assertEqual(self.get(), (ViewCache.VALUE_OK, 1))
+        self.assertEqual(self.get(), (ViewCache.VALUE_OK, 2))
+
+    def test_stats(self):
+        @ViewCache()
+        def _get_counted():
+            return 1
+
+        _get_counted()
+        _get_counted()
+        stats = ViewCache.get_stats()['{}._get_counted'.format(__name__)]
+        self.assertEqual(stats['keys'], 1)
+        self.assertEqual(stats['misses'], 1)
+        self.assertEqual(stats['hits'], 1)
+        self.assertEqual(stats['refreshes'], 1)
+        self.assertEqual(stats['errors'], 0)
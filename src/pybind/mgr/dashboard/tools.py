@@ -2,29 +2,38 @@
 from __future__ import absolute_import
 
 import sys
+import hashlib
 import inspect
 import json
 import functools
 import ipaddress
 
 import collections
-from datetime import datetime, timedelta
+from datetime import datetime
 from distutils.util import strtobool
 import fnmatch
 import time
 import threading
 import six
-from six.moves import urllib
+from six.moves import queue, urllib
 import cherrypy
+from cherrypy.lib import encoding
 
 try:
     from urlparse import urljoin
 except ImportError:
     from urllib.parse import urljoin
 
+try:
+    import ujson
+except ImportError:
+    ujson = None
+
+from mgr_module import CLIReadCommand
+
 from . import logger, mgr
-from .exceptions import ViewCacheNoDataException
-from .settings import Settings
+from .exceptions import ViewCacheNoDataException, DashboardException
+from .settings import Settings, Options
 from .services.auth import JwtManager
 
 
@@ -123,15 +132,179 @@ class RequestLoggingTool(cherrypy.Tool):
                       "{0:.3f}s".format(lat), length, req.path_info)
 
 
+def json_dumps(obj):
+    """
+    Serializes `obj` to JSON, with ujson if it is installed and the
+    JSON_FAST_ENCODER option is enabled. Falls back to the json module for
+    the objects ujson cannot serialize.
+    """
+    if ujson is not None and Settings.JSON_FAST_ENCODER:
+        try:
+            return ujson.dumps(obj, escape_forward_slashes=False)
+        except (TypeError, ValueError, OverflowError):
+            pass
+    return json.dumps(obj)
+
+
+def json_etag(body):
+    """
+    Returns the (weak, as the body may be gzipped afterwards) entity tag of a
+    serialized JSON response.
+    """
+    return 'W/"{}"'.format(hashlib.sha1(body).hexdigest())
+
+
+def etag_matches(etag, if_none_match):
+    """
+    Checks the entity tag of a response against the value of the
+    If-None-Match header of the request, using the weak comparison.
+    """
+    if not if_none_match:
+        return False
+    tags = [tag.strip() for tag in if_none_match.split(',')]
+    return '*' in tags or etag[2:] in [tag[2:] if tag.startswith('W/') else tag
+                                       for tag in tags]
+
+
+def gzip_large_responses(min_size=0, **kwargs):
+    """
+    The cherrypy gzip tool, except that it leaves the responses shorter than
+    `min_size` bytes uncompressed: compressing them costs more CPU time than
+    the bytes it saves are worth.
+    """
+    body = cherrypy.serving.response.body
+    if isinstance(body, list) and sum(len(chunk) for chunk in body) < min_size:
+        encoding.set_vary_header(cherrypy.serving.response, 'Accept-Encoding')
+        return
+    encoding.gzip(**kwargs)
+
+
+class PayloadStats(object):
+    """
+    Sizes of the JSON responses of the REST API, by endpoint.
+    """
+
+    _lock = threading.Lock()
+    _stats = {}  # type: dict
+
+    @classmethod
+    def record(cls, endpoint, size, not_modified=False):
+        with cls._lock:
+            stats = cls._stats.get(endpoint)
+            if stats is None:
+                stats = cls._stats[endpoint] = {
+                    'count': 0, 'not_modified': 0, 'bytes': 0, 'bytes_max': 0}
+            stats['count'] += 1
+            if not_modified:
+                stats['not_modified'] += 1
+            stats['bytes'] += size
+            stats['bytes_max'] = max(stats['bytes_max'], size)
+
+    @classmethod
+    def get_stats(cls):
+        """
+        Number of responses, of 304 (Not Modified) responses among them, and
+        total and maximum size in bytes of the JSON payloads (before gzip
+        compression), by endpoint.
+        """
+        with cls._lock:
+            stats = {endpoint: dict(stats) for endpoint, stats in cls._stats.items()}
+        for endpoint_stats in stats.values():
+            endpoint_stats['bytes_avg'] = endpoint_stats['bytes'] // endpoint_stats['count']
+        return stats
+
+    @classmethod
+    def reset(cls):
+        with cls._lock:
+            cls._stats = {}
+
+
+@CLIReadCommand('dashboard payload-stats',
+                desc='Show the sizes of the REST API responses by endpoint')
+def payload_stats_cmd(_):
+    return 0, json.dumps(PayloadStats.get_stats(), indent=4, sort_keys=True), ''
+
+
+class WorkerPool(object):
+    """
+    A fixed number of worker threads, started on first use, executing the
+    functions submitted to it in submission order.
+    """
+
+    def __init__(self, name, size):
+        self.name = name
+        self.size = size
+        self._queue = queue.Queue()
+        self._threads = []
+        self._lock = threading.Lock()
+
+    def submit(self, fn, *args, **kwargs):
+        with self._lock:
+            if not self._threads:
+                for i in range(self.size):
+                    thread = threading.Thread(target=self._run,
+                                              name='{}-{}'.format(self.name, i))
+                    thread.daemon = True
+                    thread.start()
+                    self._threads.append(thread)
+            self._queue.put((fn, args, kwargs))
+
+    def pending(self):
+        return self._queue.qsize()
+
+    # pylint: disable=broad-except
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                break
+            fn, args, kwargs = item
+            try:
+                fn(*args, **kwargs)
+            except Exception:
+                logger.exception("%s: error while calling %s", self.name, fn)
+
+    def stop(self):
+        """
+        Waits for the submitted functions to finish and stops the threads.
+        The pool starts again on the next submission.
+        """
+        with self._lock:
+            threads = self._threads
+            self._threads = []
+            for _ in threads:
+                self._queue.put(None)
+        for thread in threads:
+            thread.join()
+
+
 # pylint: disable=too-many-instance-attributes
 class ViewCache(object):
     VALUE_OK = 0
     VALUE_STALE = 1
     VALUE_NONE = 2
 
-    class GetterThread(threading.Thread):
+    # Refreshes of every view cache run on this pool
+    WORKERS = 8
+    workers = WorkerPool('view-cache', WORKERS)
+
+    # A value older than STALE_PERIOD is returned right away if it is younger
+    # than MAX_STALE_PERIOD, while it is being refreshed in the background
+    STALE_PERIOD = 1.0
+    MAX_STALE_PERIOD = 30.0
+
+    # Keys accessed at regular intervals of up to HOT_PERIOD seconds are
+    # refreshed ahead of their next expected access
+    HOT_PERIOD = 30.0
+    REFRESH_INTERVAL = 0.25
+
+    _instances = []
+    _refresher = None
+    _refresher_stop = threading.Event()
+    _lock = threading.Lock()
+
+    class Getter(object):
         def __init__(self, view, fn, args, kwargs):
-            super(ViewCache.GetterThread, self).__init__()
             self._view = view
             self.event = threading.Event()
             self.fn = fn
@@ -153,33 +326,42 @@ class ViewCache(object):
                                      str(ex))
                     self._view.value = None
                     self._view.value_when = None
-                    self._view.getter_thread = None
+                    self._view.getter = None
                     self._view.exception = ex
+                    self._view.stats['errors'] += 1
             else:
                 with self._view.lock:
                     self._view.latency = t1 - t0
                     self._view.value = val
-                    self._view.value_when = datetime.now()
-                    self._view.getter_thread = None
+                    self._view.value_when = t1
+                    self._view.getter = None
                     self._view.exception = None
+                    self._view.stats['refresh_time'] += t1 - t0
+                    self._view.stats['refresh_time_max'] = max(
+                        self._view.stats['refresh_time_max'], t1 - t0)
 
             logger.debug("VC: execution of %s finished in: %s", self.fn,
                          t1 - t0)
             self.event.set()
 
     class RemoteViewCache(object):
-        # Return stale data if
-        STALE_PERIOD = 1.0
-
-        def __init__(self, timeout):
-            self.getter_thread = None
-            # Consider data within 1s old to be sufficiently fresh
+        def __init__(self, timeout, fn, args, kwargs):
+            self.getter = None
             self.timeout = timeout
-            self.event = threading.Event()
+            self.fn = fn
+            self.args = args
+            self.kwargs = kwargs
             self.value_when = None
             self.value = None
             self.latency = 0
             self.exception = None
+            self.last_access = None
+            # mean time between two accesses
+            self.access_interval = None
+            self.stats = collections.Counter(hits=0, stale_hits=0, misses=0,
+                                             refreshes=0, errors=0,
+                                             refresh_time=0.0,
+                                             refresh_time_max=0.0)
             self.lock = threading.Lock()
 
         def reset(self):
@@ -187,10 +369,31 @@ class ViewCache(object):
                 self.value_when = None
                 self.value = None
 
+        def _refresh(self):
+            # must be called with the lock held
+            if self.getter is None:
+                self.getter = ViewCache.Getter(self, self.fn, self.args,
+                                               self.kwargs)
+                self.stats['refreshes'] += 1
+                ViewCache.workers.submit(self.getter.run)
+            else:
+                logger.debug("VC: getter still running for: %s", self.fn)
+            return self.getter.event
+
+        def _accessed(self, now):
+            if self.last_access is not None:
+                interval = now - self.last_access
+                if self.access_interval is None:
+                    self.access_interval = interval
+                else:
+                    self.access_interval = (3 * self.access_interval + interval) / 4
+            self.last_access = now
+
         def run(self, fn, args, kwargs):
             """
-            If data less than `stale_period` old is available, return it
-            immediately.
+            If data less than `STALE_PERIOD` old is available, return it
+            immediately. Data less than `MAX_STALE_PERIOD` old is returned
+            immediately as well, while it is refreshed in the background.
             If an attempt to fetch data does not complete within `timeout`, then
             return the most recent data available, with a status to indicate that
             it is stale.
@@ -202,19 +405,21 @@ class ViewCache(object):
             :return: 2-tuple of value status code, value
             """
             with self.lock:
-                now = datetime.now()
-                if self.value_when and now - self.value_when < timedelta(
-                        seconds=self.STALE_PERIOD):
-                    return ViewCache.VALUE_OK, self.value
-
-                if self.getter_thread is None:
-                    self.getter_thread = ViewCache.GetterThread(self, fn, args,
-                                                                kwargs)
-                    self.getter_thread.start()
-                else:
-                    logger.debug("VC: getter_thread still alive for: %s", fn)
-
-                ev = self.getter_thread.event
+                now = time.time()
+                self._accessed(now)
+                self.fn, self.args, self.kwargs = fn, args, kwargs
+                if self.value_when is not None:
+                    age = now - self.value_when
+                    if age < ViewCache.STALE_PERIOD:
+                        self.stats['hits'] += 1
+                        return ViewCache.VALUE_OK, self.value
+                    if age < ViewCache.MAX_STALE_PERIOD:
+                        self._refresh()
+                        self.stats['stale_hits'] += 1
+                        return ViewCache.VALUE_OK, self.value
+
+                self.stats['misses'] += 1
+                ev = self._refresh()
 
             success = ev.wait(timeout=self.timeout)
 
@@ -232,16 +437,43 @@ class ViewCache(object):
                 # We have no data, not even stale data
                 raise ViewCacheNoDataException()
 
+        def refresh_ahead(self, now):
+            """
+            Refreshes the data if it is going to be requested again before
+            the refresh would otherwise complete.
+            """
+            with self.lock:
+                if self.getter is not None or self.value_when is None or \
+                        self.access_interval is None:
+                    return
+                if self.access_interval > ViewCache.HOT_PERIOD or \
+                        now - self.last_access > 2 * self.access_interval:
+                    # not accessed regularly
+                    return
+                if self.value_when > self.last_access:
+                    # already refreshed since the last access
+                    return
+                due = max(self.last_access + self.access_interval,
+                          self.value_when + ViewCache.STALE_PERIOD)
+                if now >= due - self.latency - ViewCache.REFRESH_INTERVAL:
+                    self._refresh()
+
     def __init__(self, timeout=5):
         self.timeout = timeout
         self.cache_by_args = {}
+        self.name = None
+        with ViewCache._lock:
+            ViewCache._instances.append(self)
 
     def __call__(self, fn):
+        self.name = '{}.{}'.format(fn.__module__, fn.__name__)
+
         def wrapper(*args, **kwargs):
             rvc = self.cache_by_args.get(args, None)
             if not rvc:
-                rvc = ViewCache.RemoteViewCache(self.timeout)
+                rvc = ViewCache.RemoteViewCache(self.timeout, fn, args, kwargs)
                 self.cache_by_args[args] = rvc
+            ViewCache._start_refresher()
             return rvc.run(fn, args, kwargs)
         wrapper.reset = self.reset
         return wrapper
@@ -250,6 +482,66 @@ class ViewCache(object):
         for _, rvc in self.cache_by_args.items():
             rvc.reset()
 
+    @classmethod
+    def _start_refresher(cls):
+        with cls._lock:
+            if cls._refresher is not None:
+                return
+            cls._refresher_stop.clear()
+            cls._refresher = threading.Thread(target=cls._refresh_ahead,
+                                              name='view-cache-refresher')
+            cls._refresher.daemon = True
+            cls._refresher.start()
+
+    @classmethod
+    def _refresh_ahead(cls):
+        while not cls._refresher_stop.wait(cls.REFRESH_INTERVAL):
+            now = time.time()
+            with cls._lock:
+                instances = list(cls._instances)
+            for view_cache in instances:
+                for rvc in list(view_cache.cache_by_args.values()):
+                    rvc.refresh_ahead(now)
+
+    @classmethod
+    def stop(cls):
+        with cls._lock:
+            refresher = cls._refresher
+            cls._refresher = None
+            cls._refresher_stop.set()
+        if refresher is not None:
+            refresher.join()
+        cls.workers.stop()
+
+    @classmethod
+    def get_stats(cls):
+        """
+        Hit, miss and refresh counters of every view cache, summed over its
+        keys. `stale_hits` counts the values returned while being refreshed.
+        """
+        with cls._lock:
+            instances = list(cls._instances)
+        stats = {}
+        for view_cache in instances:
+            if view_cache.name is None:
+                continue
+            counters = collections.Counter()
+            rvcs = list(view_cache.cache_by_args.values())
+            for rvc in rvcs:
+                with rvc.lock:
+                    counters.update(rvc.stats)
+            view_stats = stats.setdefault(view_cache.name, collections.Counter())
+            view_stats.update(counters)
+            view_stats['keys'] += len(rvcs)
+            view_stats['refresh_time_max'] = max(
+                [rvc.stats['refresh_time_max'] for rvc in rvcs] + [0.0])
+        return {name: dict(view_stats) for name, view_stats in stats.items()}
+
+
+@CLIReadCommand('dashboard view-cache-stats', desc='Show view cache statistics')
+def view_cache_stats_cmd(_):
+    return 0, json.dumps(ViewCache.get_stats(), indent=4, sort_keys=True), ''
+
 
 class NotificationQueue(threading.Thread):
     _ALL_TYPES_ = '__ALL__'
@@ -394,18 +686,35 @@ class NotificationQueue(threading.Thread):
 class TaskManager(object):
     FINISHED_TASK_SIZE = 10
     FINISHED_TASK_TTL = 60.0
+    # Finished tasks kept at most, even if younger than FINISHED_TASK_TTL
+    FINISHED_TASK_MAX_SIZE = 100
+
+    # Tasks run by the PooledExecutor share this pool, and at most
+    # MAX_CONCURRENT_PER_NAME tasks of the same name run at once, the others
+    # wait for them in submission order. Both are set from the TASK_WORKERS
+    # and TASK_MAX_CONCURRENT_PER_NAME settings by init().
+    MAX_CONCURRENT_PER_NAME = Options.TASK_MAX_CONCURRENT_PER_NAME[0]
+    workers = WorkerPool('task', Options.TASK_WORKERS[0])
 
     VALUE_DONE = "done"
     VALUE_EXECUTING = "executing"
 
     _executing_tasks = set()
     _finished_tasks = []
+    _running_by_name = collections.defaultdict(int)
+    _waiting_by_name = collections.defaultdict(collections.deque)
     _lock = threading.Lock()
 
     _task_local_data = threading.local()
 
     @classmethod
     def init(cls):
+        cls.MAX_CONCURRENT_PER_NAME = Settings.TASK_MAX_CONCURRENT_PER_NAME
+        workers = Settings.TASK_WORKERS
+        if workers != cls.workers.size:
+            # the threads are started again with the new size on next use
+            cls.workers.stop()
+            cls.workers.size = workers
         NotificationQueue.register(cls._handle_finished_task, 'cd_task_finished')
 
     @classmethod
@@ -414,6 +723,7 @@ class TaskManager(object):
         with cls._lock:
             cls._executing_tasks.remove(task)
             cls._finished_tasks.append(task)
+            cls._cleanup_old_tasks()
 
     @classmethod
     def run(cls, name, metadata, fn, args=None, kwargs=None, executor=None,
@@ -423,7 +733,7 @@ class TaskManager(object):
         if not kwargs:
             kwargs = {}
         if not executor:
-            executor = ThreadedExecutor()
+            executor = PooledExecutor()
         task = Task(name, metadata, fn, args, kwargs, executor,
                     exception_handler)
         with cls._lock:
@@ -436,8 +746,40 @@ class TaskManager(object):
             cls._executing_tasks.add(task)
         logger.info("TM: running %s", task)
         task._run()
+        NotificationQueue.new_notification('cd_task_started', task)
         return task
 
+    @classmethod
+    def _schedule(cls, executor):
+        name = executor.task.name
+        with cls._lock:
+            if cls._running_by_name[name] >= cls.MAX_CONCURRENT_PER_NAME:
+                logger.debug("TM: queued %s", executor.task)
+                cls._waiting_by_name[name].append(executor)
+                return
+            cls._running_by_name[name] += 1
+        cls.workers.submit(executor._run)
+
+    @classmethod
+    def _unschedule(cls, name):
+        """
+        Starts the next waiting task of the given name, if any, in place of
+        the one that finished.
+        """
+        executor = None
+        with cls._lock:
+            waiting = cls._waiting_by_name.get(name)
+            if waiting:
+                executor = waiting.popleft()
+                if not waiting:
+                    del cls._waiting_by_name[name]
+            else:
+                cls._running_by_name[name] -= 1
+                if cls._running_by_name[name] <= 0:
+                    del cls._running_by_name[name]
+        if executor:
+            cls.workers.submit(executor._run)
+
     @classmethod
     def current_task(cls):
         """
@@ -447,45 +789,50 @@ class TaskManager(object):
         return cls._task_local_data.task
 
     @classmethod
-    def _cleanup_old_tasks(cls, task_list):
+    def _cleanup_old_tasks(cls):
         """
         The cleanup rule is: maintain the FINISHED_TASK_SIZE more recent
         finished tasks, and the rest is maintained up to the FINISHED_TASK_TTL
-        value.
+        value, with no more than FINISHED_TASK_MAX_SIZE tasks in total.
+        Must be called with the lock held.
         """
-        now = datetime.now()
-        for idx, t in enumerate(task_list):
-            if idx < cls.FINISHED_TASK_SIZE:
-                continue
-            if now - datetime.fromtimestamp(t[1].end_time) > \
-                    timedelta(seconds=cls.FINISHED_TASK_TTL):
-                del cls._finished_tasks[t[0]]
+        now = time.time()
+        tasks = sorted(cls._finished_tasks, key=lambda t: t.end_time, reverse=True)
+        cls._finished_tasks = [
+            t for idx, t in enumerate(tasks[:cls.FINISHED_TASK_MAX_SIZE])
+            if idx < cls.FINISHED_TASK_SIZE or now - t.end_time <= cls.FINISHED_TASK_TTL
+        ]
 
     @classmethod
     def list(cls, name_glob=None):
         executing_tasks = []
         finished_tasks = []
         with cls._lock:
+            cls._cleanup_old_tasks()
             for task in cls._executing_tasks:
                 if not name_glob or fnmatch.fnmatch(task.name, name_glob):
                     executing_tasks.append(task)
-            for idx, task in enumerate(cls._finished_tasks):
+            for task in cls._finished_tasks:
                 if not name_glob or fnmatch.fnmatch(task.name, name_glob):
-                    finished_tasks.append((idx, task))
-            finished_tasks.sort(key=lambda t: t[1].end_time, reverse=True)
-            cls._cleanup_old_tasks(finished_tasks)
-        executing_tasks.sort(key=lambda t: t.begin_time, reverse=True)
-        return executing_tasks, [t[1] for t in finished_tasks]
+                    finished_tasks.append(task)
+        # the queued tasks, not begun yet, come last
+        executing_tasks.sort(key=lambda t: t.begin_time or 0, reverse=True)
+        return executing_tasks, finished_tasks
 
     @classmethod
     def list_serializable(cls, ns_glob=None):
+        """
+        The executing tasks include the queued ones, waiting for a worker,
+        with a `begin_time` of None.
+        """
         ex_t, fn_t = cls.list(ns_glob)
         return [{
             'name': t.name,
             'metadata': t.metadata,
-            'begin_time': "{}Z".format(datetime.fromtimestamp(t.begin_time).isoformat()),
+            'begin_time': "{}Z".format(datetime.fromtimestamp(t.begin_time).isoformat())
+                          if t.begin_time else None,
             'progress': t.progress
-        } for t in ex_t if t.begin_time], [{
+        } for t in ex_t], [{
             'name': t.name,
             'metadata': t.metadata,
             'begin_time': "{}Z".format(datetime.fromtimestamp(t.begin_time).isoformat()),
@@ -510,6 +857,7 @@ class TaskExecutor(object):
     # pylint: disable=broad-except
     def start(self):
         logger.debug("EX: executing task %s", self.task)
+        self.task._begin()
         try:
             self.task.fn(*self.task.fn_args, **self.task.fn_kwargs)
         except Exception as ex:
@@ -525,25 +873,29 @@ class TaskExecutor(object):
 
 
 # pylint: disable=protected-access
-class ThreadedExecutor(TaskExecutor):
-    def __init__(self):
-        super(ThreadedExecutor, self).__init__()
-        self._thread = threading.Thread(target=self._run)
+class PooledExecutor(TaskExecutor):
+    """
+    Runs the task on the worker pool of the TaskManager.
+    """
 
     def start(self):
-        self._thread.start()
+        TaskManager._schedule(self)
 
     # pylint: disable=broad-except
     def _run(self):
         TaskManager._task_local_data.task = self.task
         try:
-            logger.debug("TEX: executing task %s", self.task)
+            logger.debug("PEX: executing task %s", self.task)
+            self.task._begin()
             val = self.task.fn(*self.task.fn_args, **self.task.fn_kwargs)
         except Exception as ex:
             logger.exception("Error while calling %s", self.task)
             self.finish(None, ex)
         else:
             self.finish(val, None)
+        finally:
+            TaskManager._task_local_data.task = None
+            TaskManager._unschedule(self.task.name)
 
 
 class Task(object):
@@ -584,10 +936,17 @@ class Task(object):
             assert not self.running
             self.executor.init(self)
             self.set_progress(0, in_lock=True)
-            self.begin_time = time.time()
             self.running = True
         self.executor.start()
 
+    def _begin(self):
+        """
+        Called by the executor when the task actually starts; until then the
+        task is queued and has no begin time.
+        """
+        with self.lock:
+            self.begin_time = time.time()
+
     def _complete(self, ret_value, exception=None):
         now = time.time()
         if exception and self.ex_handler:
@@ -635,6 +994,7 @@ class Task(object):
         self.progress = prog if prog <= 100 else 100
         if not in_lock:
             self.lock.release()
+            NotificationQueue.new_notification('cd_task_progress', self)
 
     def set_progress(self, percentage, in_lock=False):
         if not isinstance(percentage, int) or percentage < 0 or percentage > 100:
@@ -645,6 +1005,7 @@ class Task(object):
         self.progress = percentage
         if not in_lock:
             self.lock.release()
+            NotificationQueue.new_notification('cd_task_progress', self)
 
 
 def build_url(host, scheme=None, port=None):
@@ -761,6 +1122,34 @@ def str_to_bool(val):
     return bool(strtobool(val))
 
 
+def parse_page(offset, limit):
+    """
+    Parse the `offset` and `limit` query parameters of a paged list.
+
+    >>> parse_page('10', None)
+    (10, None)
+
+    >>> parse_page(None, '5')
+    (0, 5)
+
+    Raises a DashboardException (HTTP 400) if either is not a non-negative
+    integer.
+
+    :rtype: tuple[int, int|None]
+    """
+    values = []
+    for name, value in (('offset', offset), ('limit', limit)):
+        try:
+            value = int(value) if value is not None else None
+        except ValueError:
+            value = -1
+        if value is not None and value < 0:
+            raise DashboardException(msg='{} must be a non-negative integer'.format(name),
+                                     code='invalid_page')
+        values.append(value)
+    return values[0] or 0, values[1]
+
+
 def get_request_body_params(request):
     """
     Helper function to get parameters from the request body.
@@ -5,8 +5,10 @@ import datetime
 
 # freq to write cached state to disk
 PERSIST_PERIOD = datetime.timedelta(seconds = 10)
-# on disk key prefix
+# on disk key prefix of the (legacy) per-hour slots
 HEALTH_HISTORY_KEY_PREFIX = "health_history/"
+# on disk key of the rolled up health history
+HEALTH_HISTORY_KEY = "health_history"
 # apply on offset to "now": used for testing
 NOW_OFFSET = None
 
@@ -116,6 +118,10 @@ class HealthHistorySlot(object):
         """Identifier in the persist store"""
         return self._key(self._slot)
 
+    def time(self):
+        """Start time of the slot"""
+        return self._slot
+
     def expired(self):
         """True if this slot is the current slot, False otherwise"""
         return self._slot != self._curr_slot()
@@ -189,3 +195,104 @@ class HealthHistorySlot(object):
             month = dt.month,
             day   = dt.day,
             hour  = dt.hour)
+
+class HealthHistory(object):
+    """
+    Rolled up health history.
+
+    Hourly slots are kept individually while they may be part of a health
+    report, and are then compacted into one deduplicated aggregate per day.
+    The whole history is kept in memory and persisted as a single store entry
+    so that reporting and pruning do not depend on the retention length.
+    """
+    HOUR_FORMAT = "%Y-%m-%d_%H"
+    DAY_FORMAT = "%Y-%m-%d"
+
+    def __init__(self, init_history = dict()):
+        self._hours = {}
+        for hour, checks in six.iteritems(init_history.get("hours", {})):
+            self._hours[self._parse(hour, self.HOUR_FORMAT)] = \
+                HealthCheckAccumulator(checks)
+        self._days = {}
+        for day, checks in six.iteritems(init_history.get("days", {})):
+            self._days[self._parse(day, self.DAY_FORMAT)] = \
+                HealthCheckAccumulator(checks)
+
+    def __str__(self):
+        return "hours {} days {}".format(len(self._hours), len(self._days))
+
+    def dump(self):
+        """Persistent representation (sets need HealthEncoder)"""
+        return dict(
+            hours = dict((k.strftime(self.HOUR_FORMAT), v.checks())
+                         for k, v in six.iteritems(self._hours)),
+            days = dict((k.strftime(self.DAY_FORMAT), v.checks())
+                        for k, v in six.iteritems(self._days)))
+
+    def slot_health(self, slot_time):
+        """Health of an hourly slot, in the HealthHistorySlot format"""
+        checks = self._hours.get(slot_time)
+        return dict(checks = checks.checks()) if checks else dict()
+
+    def set_slot(self, slot):
+        """Replace an hourly slot with the state of a HealthHistorySlot"""
+        assert isinstance(slot, HealthHistorySlot)
+        self.set_slot_checks(slot.time(), slot.health()["checks"])
+
+    def set_slot_checks(self, slot_time, checks):
+        """Replace the checks of the hourly slot starting at slot_time"""
+        if not checks and slot_time not in self._hours:
+            return
+        self._hours[slot_time] = HealthCheckAccumulator(checks)
+
+    def compact(self, hours):
+        """
+        Fold the hourly slots of the days which ended before the past N hours
+        into daily aggregates. The slots of a day overlapping the past N hours
+        are kept, so that a report of up to N hours is exact.
+        """
+        cutoff = HealthHistorySlot._curr_slot() - \
+            datetime.timedelta(hours = hours - 1)
+        one_day = datetime.timedelta(days = 1)
+        for hour in list(self._hours):
+            day = datetime.datetime(year = hour.year, month = hour.month,
+                                    day = hour.day)
+            if day + one_day > cutoff:
+                continue
+            if day not in self._days:
+                self._days[day] = HealthCheckAccumulator()
+            self._days[day].merge(self._hours.pop(hour))
+
+    def prune(self, cutoff):
+        """
+        Remove the slots which started at or before cutoff. A daily aggregate
+        is removed once its last hour is that old.
+        """
+        for hour in [h for h in self._hours if h <= cutoff]:
+            del self._hours[hour]
+        last_hour = datetime.timedelta(hours = 23)
+        for day in [d for d in self._days if d + last_hour <= cutoff]:
+            del self._days[day]
+
+    def report(self, hours):
+        """
+        Merged health of the past N hours. Daily aggregates are only included
+        when the whole day is inside of the window: for a window longer than
+        the compaction one, the compacted day overlapping its start is left
+        out.
+        """
+        collector = HealthHistorySlot()
+        curr = HealthHistorySlot._curr_slot()
+        start = curr - datetime.timedelta(hours = hours - 1)
+        for hour, checks in six.iteritems(self._hours):
+            if start <= hour <= curr:
+                collector._checks.merge(checks)
+        last_hour = datetime.timedelta(hours = 23)
+        for day, checks in six.iteritems(self._days):
+            if start <= day and day + last_hour <= curr:
+                collector._checks.merge(checks)
+        return collector
+
+    @staticmethod
+    def _parse(timestr, fmt):
+        return datetime.datetime.strptime(timestr, fmt)
@@ -8,20 +8,24 @@ from . import health as health_util
 
 # hours of crash history to report
 CRASH_HISTORY_HOURS = 24
-# hours of health history to report
+# hours of health history to report by default, kept in hourly slots;
+# older slots are compacted into daily aggregates
 HEALTH_HISTORY_HOURS = 24
-# how many hours of health history to keep
-HEALTH_RETENTION_HOURS = 30
+# how many days of health history to keep, the longest report window
+HEALTH_RETENTION_DAYS = 7
 # health check name for insights health
 INSIGHTS_HEALTH_CHECK = "MGR_INSIGHTS_WARNING"
 # version tag for persistent data format
-ON_DISK_VERSION = 1
+ON_DISK_VERSION = 2
 
 class Module(MgrModule):
     COMMANDS = [
         {
-            "cmd": "insights",
-            "desc": "Retrieve insights report",
+            "cmd": "insights "
+                   "name=hours,type=CephInt,range=1|{0},req=false".format(
+                       HEALTH_RETENTION_DAYS * 24),
+            "desc": "Retrieve insights report, with the crashes and health "
+                    "checks of the past <hours> hours (default 24)",
             "perm": "r",
             "poll": "false",
         },
@@ -42,6 +46,8 @@ class Module(MgrModule):
         # health history tracking
         self._pending_health = []
         self._health_slot = None
+        self._health_history = None
+        self._health_lock = threading.Lock()
 
     def notify(self, ttype, ident):
         """Queue updates for processing"""
@@ -53,49 +59,83 @@ class Module(MgrModule):
             self._evt.set()
 
     def serve(self):
-        self._health_reset()
+        with self._health_lock:
+            self._health_load()
+            self._health_reset()
         while True:
             self._evt.wait(health_util.PERSIST_PERIOD.total_seconds())
             self._evt.clear()
             if self._shutdown:
                 break
 
-            # when the current health slot expires, finalize it by flushing it to
-            # the store, and initializing a new empty slot.
-            if self._health_slot.expired():
-                self.log.info("Health history slot expired {}".format(
-                    self._health_slot))
+            with self._health_lock:
+                # when the current health slot expires, finalize it into the
+                # history, roll up and prune the history, and initialize a
+                # new empty slot.
+                if self._health_slot.expired():
+                    self.log.info("Health history slot expired {}".format(
+                        self._health_slot))
+                    self._health_history.set_slot(self._health_slot)
+                    self._health_history.compact(HEALTH_HISTORY_HOURS)
+                    self._health_history.prune(
+                        datetime.datetime.utcnow() -
+                        datetime.timedelta(days = HEALTH_RETENTION_DAYS))
+                    self._health_flush()
+                    self._health_reset()
+
+                # fold in pending health snapshots and flush
+                self.log.info("Applying {} health updates to slot {}".format(
+                    len(self._pending_health), self._health_slot))
+                for health in self._pending_health:
+                    self._health_slot.add(health)
+                self._pending_health = []
                 self._health_maybe_flush()
-                self._health_reset()
-                self._health_prune_history(HEALTH_RETENTION_HOURS)
-
-            # fold in pending health snapshots and flush
-            self.log.info("Applying {} health updates to slot {}".format(
-                len(self._pending_health), self._health_slot))
-            for health in self._pending_health:
-                self._health_slot.add(health)
-            self._pending_health = []
-            self._health_maybe_flush()
 
     def shutdown(self):
         self._shutdown = True
         self._evt.set()
 
+    def _health_load(self):
+        """Load the health history, converting legacy per-hour slot keys"""
+        data = self.get_store(health_util.HEALTH_HISTORY_KEY)
+        if data:
+            self._health_history = health_util.HealthHistory(json.loads(data))
+        else:
+            self._health_history = health_util.HealthHistory()
+            legacy = self.get_store_prefix(
+                health_util.HEALTH_HISTORY_KEY_PREFIX)
+            for key, data in six.iteritems(legacy):
+                slot_time = health_util.HealthHistorySlot.key_to_time(key)
+                self._health_history.set_slot_checks(
+                    slot_time, json.loads(data).get("checks"))
+            if legacy:
+                self._health_history.compact(HEALTH_HISTORY_HOURS)
+                self._health_flush()
+                for key in legacy:
+                    self.set_store(key, None)
+        self.log.info("Loaded health history {}".format(self._health_history))
+
     def _health_reset(self):
         """Initialize the current health slot
 
         The slot will be initialized with any state found to have already been
         persisted, otherwise the slot will start empty.
         """
-        key = health_util.HealthHistorySlot.curr_key()
-        data = self.get_store(key)
-        if data:
-            init_health = json.loads(data)
-            self._health_slot = health_util.HealthHistorySlot(init_health)
-        else:
-            self._health_slot = health_util.HealthHistorySlot()
+        curr = health_util.HealthHistorySlot._curr_slot()
+        self._health_slot = health_util.HealthHistorySlot(
+            self._health_history.slot_health(curr))
         self.log.info("Reset curr health slot {}".format(self._health_slot))
 
+    def _health_flush(self):
+        """Store the whole health history"""
+        history = self._health_history.dump()
+        assert "version" not in history
+        history.update(dict(version = ON_DISK_VERSION))
+        data = json.dumps(history, cls=health_util.HealthEncoder)
+        self.log.debug("Storing health history {}".format(
+            self._health_history))
+        self.set_store(health_util.HEALTH_HISTORY_KEY, data)
+
     def _health_maybe_flush(self):
         """Store the health for the current time slot if needed"""
 
@@ -103,51 +143,27 @@ class Module(MgrModule):
             self._health_slot, self._health_slot.need_flush()))
 
         if self._health_slot.need_flush():
-            key = self._health_slot.key()
-
-            # build store data entry
-            slot = self._health_slot.health()
-            assert "version" not in slot
-            slot.update(dict(version = ON_DISK_VERSION))
-            data = json.dumps(slot, cls=health_util.HealthEncoder)
-
-            self.log.debug("Storing health key {} data {}".format(
-                key, json.dumps(slot, indent=2, cls=health_util.HealthEncoder)))
-
-            self.set_store(key, data)
+            self._health_history.set_slot(self._health_slot)
+            self._health_flush()
             self._health_slot.mark_flushed()
 
-    def _health_filter(self, f):
-        """Filter hourly health reports timestamp"""
-        matches = filter(
-            lambda t: f(health_util.HealthHistorySlot.key_to_time(t[0])),
-            six.iteritems(self.get_store_prefix(health_util.HEALTH_HISTORY_KEY_PREFIX)))
-        return map(lambda t: t[0], matches)
-
     def _health_prune_history(self, hours):
         """Prune old health entries"""
         cutoff = datetime.datetime.utcnow() - datetime.timedelta(hours = hours)
-        for key in self._health_filter(lambda ts: ts <= cutoff):
-            self.log.info("Removing old health slot key {}".format(key))
-            self.set_store(key, None)
+        with self._health_lock:
+            self._health_history.prune(cutoff)
+            self._health_flush()
 
     def _health_report(self, hours):
         """
         Report a consolidated health report for the past N hours.
         """
-        # roll up the past N hours of health info
-        collector = health_util.HealthHistorySlot()
-        keys = health_util.HealthHistorySlot.key_range(hours)
-        for key in keys:
-            data = self.get_store(key)
-            self.log.info("Reporting health key {} found {}".format(
-                key, bool(data)))
-            health = json.loads(data) if data else {}
-            slot = health_util.HealthHistorySlot(health)
-            collector.merge(slot)
-
-        # include history that hasn't yet been flushed
-        collector.merge(self._health_slot)
+        with self._health_lock:
+            # roll up the past N hours of health info
+            collector = self._health_history.report(hours)
+
+            # include history that hasn't yet been flushed
+            collector.merge(self._health_slot)
 
         return dict(
            current = json.loads(self.get("health")["json"]),
@@ -248,12 +264,14 @@ class Module(MgrModule):
         })
 
         # crash history
-        crashes, health_details = self._crash_history(CRASH_HISTORY_HOURS)
+        crashes, health_details = self._crash_history(
+            command.get("hours", CRASH_HISTORY_HOURS))
         report["crashes"] = crashes
         health_check_details.extend(health_details)
 
         # health history
-        report["health"] = self._health_report(HEALTH_HISTORY_HOURS)
+        report["health"] = self._health_report(
+            command.get("hours", HEALTH_HISTORY_HOURS))
 
         # cluster configuration
         config, health_details = self._config_dump()
@@ -271,3 +271,113 @@ class HealthHistoryTest(unittest.TestCase):
 
         self.assertTrue(h.expired())
         self.assertTrue(h.need_flush())
+
+class HealthHistoryRollupTest(unittest.TestCase):
+    def _now(self):
+        # fixed, so that the day boundaries are known
+        return datetime.datetime(
+            year   = 2019,
+            month  = 3,
+            day    = 10,
+            hour   = 12,
+            minute = 30)
+
+    def _slot(self, now, check):
+        HealthHistorySlot._now = mock.Mock(return_value=now)
+        h = HealthHistorySlot()
+        h.add(dict(checks = {
+            check: {
+                "severity": "S0",
+                "summary": { "message": "s0" },
+                "detail": [{ "message": "d0" }]
+            }
+        }))
+        return h
+
+    def _history(self, now, hours):
+        history = HealthHistory()
+        for hour in hours:
+            slot = self._slot(now - datetime.timedelta(hours = hour),
+                              "C{}".format(hour))
+            history.set_slot(slot)
+        HealthHistorySlot._now = mock.Mock(return_value=now)
+        return history
+
+    def test_empty(self):
+        history = HealthHistory()
+        self.assertEqual(history.dump(), { "hours": {}, "days": {} })
+        self.assertEqual(history.report(24).health(), { "checks": {} })
+        self.assertEqual(history.slot_health(self._now()), {})
+
+    def test_report_window(self):
+        now = self._now()
+        history = self._history(now, [0, 5, 23, 24, 30])
+        self.assertEqual(set(history.report(24).health()["checks"]),
+                         set(["C0", "C5", "C23"]))
+        self.assertEqual(set(history.report(1).health()["checks"]),
+                         set(["C0"]))
+
+    def test_compact(self):
+        now = self._now()
+        history = self._history(now, [0, 5, 23, 24, 30, 60])
+        history.compact(24)
+        dump = history.dump()
+        # only the day before yesterday ended before the report window
+        self.assertEqual(len(dump["hours"]), 5)
+        self.assertEqual(set(dump["days"]), set(["2019-03-08"]))
+
+        # hours in the report window are not compacted
+        self.assertEqual(set(history.report(24).health()["checks"]),
+                         set(["C0", "C5", "C23"]))
+        self.assertEqual(set(history.report(24 * 4).health()["checks"]),
+                         set(["C0", "C5", "C23", "C24", "C30", "C60"]))
+
+    def test_report_compacted_day(self):
+        now = self._now()
+        history = self._history(now, [0, 40, 50, 70])
+        history.compact(24)
+        self.assertEqual(set(history.dump()["days"]),
+                         set(["2019-03-08", "2019-03-07"]))
+
+        # 2019-03-08 is inside of the window, 2019-03-07 overlaps its start
+        self.assertEqual(set(history.report(62).health()["checks"]),
+                         set(["C0", "C40", "C50"]))
+        self.assertEqual(set(history.report(24 * 4).health()["checks"]),
+                         set(["C0", "C40", "C50", "C70"]))
+
+    def test_prune(self):
+        now = self._now()
+        history = self._history(now, [0, 5, 30, 60])
+        history.compact(24)
+        history.prune(now - datetime.timedelta(hours = 10))
+        dump = history.dump()
+        self.assertEqual(len(dump["hours"]), 2)
+        self.assertNotIn("C60", history.report(24 * 4).health()["checks"])
+
+        history.prune(now)
+        self.assertEqual(history.dump(), { "hours": {}, "days": {} })
+
+    def test_retention(self):
+        now = self._now()
+        history = self._history(now, [0, 30, 60, 100, 200])
+        history.compact(24)
+        history.prune(now - datetime.timedelta(days = 7))
+        self.assertEqual(set(history.dump()["days"]),
+                         set(["2019-03-08", "2019-03-06"]))
+        # the week is served from the compacted days
+        self.assertEqual(set(history.report(7 * 24).health()["checks"]),
+                         set(["C0", "C30", "C60", "C100"]))
+
+    def test_persist(self):
+        now = self._now()
+        history = self._history(now, [0, 5, 30])
+        history.compact(24)
+        data = json.dumps(history.dump(), cls=HealthEncoder)
+        loaded = HealthHistory(json.loads(data))
+        self.assertEqual(loaded.report(48).health(),
+                         history.report(48).health())
+
+        # the current slot is restored from the history
+        slot = HealthHistorySlot(loaded.slot_health(
+            HealthHistorySlot._curr_slot()))
+        self.assertEqual(set(slot.health()["checks"]), set(["C0"]))
@@ -1,7 +1,28 @@
 
+from collections import deque
+from threading import Lock
+import errno
+import json
+import time
+
 from mgr_module import MgrModule
 
 
+# Order of the rates kept in each history sample
+RATES = ('read_bytes_sec', 'write_bytes_sec', 'read_op_per_sec',
+         'write_op_per_sec')
+
+PERCENTILES = (50, 90, 99)
+
+
+def percentile(ordered, p):
+    """
+    Nearest-rank percentile of an already sorted, non-empty list
+    """
+    rank = int(round(p / 100.0 * len(ordered) + 0.5)) - 1
+    return ordered[max(0, min(len(ordered) - 1, rank))]
+
+
 class Module(MgrModule):
     COMMANDS = [
         {
@@ -10,11 +31,45 @@ class Module(MgrModule):
             "perm": "r",
             "poll": "true"
         },
+        {
+            "cmd": "iostat summary "
+                   "name=period,type=CephInt,range=1,req=false "
+                   "name=pool,type=CephString,req=false",
+            "desc": "Show IO rate percentiles over the last <period> "
+                    "seconds, for the cluster or a pool",
+            "perm": "r",
+        },
+        {
+            "cmd": "iostat history "
+                   "name=since,type=CephFloat,req=false "
+                   "name=pool,type=CephString,req=false",
+            "desc": "Dump the IO rate samples recorded after <since> "
+                    "(a timestamp returned by a previous call)",
+            "perm": "r",
+        },
     ]
 
+    MODULE_OPTIONS = [
+        {
+            'name': 'history_seconds',
+            'type': 'secs',
+            'default': 300,
+            'min': 1,
+            'desc': 'how many seconds of IO rate samples to keep in memory',
+            'runtime': True,
+        },
+    ]
 
     def __init__(self, *args, **kwargs):
         super(Module, self).__init__(*args, **kwargs)
+        self.lock = Lock()
+        # (stamp, cluster rates, {pool name: rates}) of the last
+        # history_seconds, one sample per second at most, oldest first
+        self.history = deque()
+        self.history_seconds = 300
+
+    def serve(self):
+        self.config_notify()
 
     def self_test(self):
         r = self.get('io_rate')
@@ -25,49 +80,156 @@ class Module(MgrModule):
         assert('num_write_kb' in r['pg_stats_delta']['stat_sum'])
         assert('num_write' in r['pg_stats_delta']['stat_sum'])
         assert('num_read' in r['pg_stats_delta']['stat_sum'])
+        self.record_sample()
+        assert(self.get_history())
 
-    def handle_command(self, inbuf, command):
-        rd = 0
-        wr = 0
-        total = 0
-        rd_ops = 0
-        wr_ops = 0
-        total_ops = 0
-        ret = ''
+    def config_notify(self):
+        history_seconds = self.get_module_option('history_seconds')
+        with self.lock:
+            self.history_seconds = history_seconds
+            self.prune_history(int(time.time()))
 
-        if command['prefix'] == 'iostat':
-            r = self.get('io_rate')
-
-            stamp_delta = float(r['pg_stats_delta']['stamp_delta'])
-            if (stamp_delta > 0):
-                rd = int(r['pg_stats_delta']['stat_sum']['num_read_kb']) / stamp_delta
-                wr = int(r['pg_stats_delta']['stat_sum']['num_write_kb']) / stamp_delta
-                # The values are in kB, but to_pretty_iec() requires them to be in bytes
-                rd = int(rd) << 10
-                wr = int(wr) << 10
-                total = rd + wr
-
-                rd_ops = int(r['pg_stats_delta']['stat_sum']['num_read']) / stamp_delta
-                wr_ops = int(r['pg_stats_delta']['stat_sum']['num_write']) / stamp_delta
-                total_ops = rd_ops + wr_ops
-
-            if 'width' in command:
-                width = command['width']
+    def prune_history(self, now):
+        """
+        Drop the samples older than history_seconds; called with the lock
+        held
+        """
+        while self.history and self.history[0][0] <= now - self.history_seconds:
+            self.history.popleft()
+
+    def notify(self, notify_type, notify_id):
+        if notify_type == 'pg_summary':
+            self.record_sample()
+
+    def cluster_rates(self):
+        """
+        Cluster wide client IO rates, as a tuple in RATES order
+        """
+        r = self.get('io_rate')
+        stamp_delta = float(r['pg_stats_delta']['stamp_delta'])
+        if stamp_delta <= 0:
+            return (0, 0, 0, 0)
+        stat_sum = r['pg_stats_delta']['stat_sum']
+        # The values are in kB
+        return ((int(stat_sum['num_read_kb']) << 10) / stamp_delta,
+                (int(stat_sum['num_write_kb']) << 10) / stamp_delta,
+                int(stat_sum['num_read']) / stamp_delta,
+                int(stat_sum['num_write']) / stamp_delta)
+
+    def pool_rates(self):
+        """
+        Client IO rates of every pool, as tuples in RATES order
+        """
+        rates = {}
+        for pool in self.get('osd_pool_stats')['pool_stats']:
+            io_rate = pool.get('client_io_rate', {})
+            rates[pool['pool_name']] = tuple(io_rate.get(k, 0)
+                                             for k in RATES)
+        return rates
+
+    def record_sample(self):
+        stamp = int(time.time())
+        sample = (stamp, self.cluster_rates(), self.pool_rates())
+        with self.lock:
+            if self.history and self.history[-1][0] == stamp:
+                self.history[-1] = sample
             else:
-                width = 80
-
-            if command.get('print_header', False):
-                elems = ['Read', 'Write', 'Total', 'Read IOPS', 'Write IOPS', 'Total IOPS']
-                ret += self.get_pretty_header(elems, width)
-
-            elems = [
-                self.to_pretty_iec(rd) + 'B/s',
-                self.to_pretty_iec(wr) + 'B/s',
-                self.to_pretty_iec(total) + 'B/s',
-                int(rd_ops),
-                int(wr_ops),
-                int(total_ops)
-            ]
-            ret += self.get_pretty_row(elems, width)
+                self.history.append(sample)
+            self.prune_history(stamp)
+
+    def get_history(self, since=0, pool=None):
+        """
+        Samples recorded strictly after ``since``, oldest first, as a list
+        of (stamp, rates) for the cluster or for the given pool.
+        """
+        with self.lock:
+            samples = [s for s in self.history if s[0] > since]
+        if pool is None:
+            return [(s[0], s[1]) for s in samples]
+        return [(s[0], s[2][pool]) for s in samples if pool in s[2]]
+
+    def get_summary(self, period, pool=None):
+        """
+        Mean, max and percentiles of each rate over the last ``period``
+        seconds.
+        """
+        samples = self.get_history(time.time() - period, pool)
+        summary = {
+            'samples': len(samples),
+            'period': period,
+        }
+        if not samples:
+            return summary
+        for i, name in enumerate(RATES):
+            ordered = sorted(s[1][i] for s in samples)
+            stats = {
+                'mean': sum(ordered) / float(len(ordered)),
+                'max': ordered[-1],
+            }
+            for p in PERCENTILES:
+                stats['p%d' % p] = percentile(ordered, p)
+            summary[name] = stats
+        return summary
+
+    def handle_iostat(self, command):
+        ret = ''
+
+        # The latest recorded sample is as fresh as io_rate, which only
+        # changes on pg_summary updates
+        with self.lock:
+            latest = self.history[-1] if self.history else None
+        if latest is not None:
+            rd, wr, rd_ops, wr_ops = latest[1]
+        else:
+            rd, wr, rd_ops, wr_ops = self.cluster_rates()
+        # to_pretty_iec() requires whole bytes
+        rd = int(rd)
+        wr = int(wr)
+        total = rd + wr
+        total_ops = rd_ops + wr_ops
+
+        if 'width' in command:
+            width = command['width']
+        else:
+            width = 80
+
+        if command.get('print_header', False):
+            elems = ['Read', 'Write', 'Total', 'Read IOPS', 'Write IOPS', 'Total IOPS']
+            ret += self.get_pretty_header(elems, width)
+
+        elems = [
+            self.to_pretty_iec(rd) + 'B/s',
+            self.to_pretty_iec(wr) + 'B/s',
+            self.to_pretty_iec(total) + 'B/s',
+            int(rd_ops),
+            int(wr_ops),
+            int(total_ops)
+        ]
+        ret += self.get_pretty_row(elems, width)
 
         return 0, '', ret
+
+    def handle_command(self, inbuf, command):
+        if command['prefix'] == 'iostat':
+            return self.handle_iostat(command)
+
+        pool = command.get('pool', None)
+        if pool is not None and pool not in self.pool_rates():
+            return -errno.ENOENT, '', "pool '{0}' does not exist".format(pool)
+
+        if command['prefix'] == 'iostat summary':
+            period = command.get('period', self.history_seconds)
+            return 0, json.dumps(self.get_summary(period, pool),
+                                 indent=4, sort_keys=True), ''
+        elif command['prefix'] == 'iostat history':
+            samples = self.get_history(command.get('since', 0), pool)
+            r = {
+                # pass this back as <since> to only get newer samples
+                'stamp': samples[-1][0] if samples else command.get('since', 0),
+                'samples': [dict(zip(('stamp',) + RATES, (s[0],) + s[1]))
+                            for s in samples],
+            }
+            return 0, json.dumps(r, indent=4, sort_keys=True), ''
+
+        return (-errno.EINVAL, '',
+                "Command not found '{0}'".format(command['prefix']))
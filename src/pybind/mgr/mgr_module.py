@@ -230,6 +230,14 @@ class OSDMapIncremental(ceph_module.BasePyOSDMapIncremental):
         """
         return self._set_crush_compat_weight_set_weights(weightmap)
 
+    def merge_pg_upmaps(self, other):
+        """
+        Copy the pg_upmap and pg_upmap_items changes of another incremental
+        (e.g. one filled by OSDMap.calc_pg_upmaps() for other pools) into
+        this one.
+        """
+        return self._merge_pg_upmaps(other)
+
 
 class CRUSHMap(ceph_module.BasePyCRUSH):
     ITEM_NONE = 0x7fffffff
@@ -777,6 +785,19 @@ class MgrModule(ceph_module.BaseMgrModule):
         """
         return self._ceph_get_latest_counter(svc_type, svc_name, path)
 
+    def get_latest_counters(self, svc_type, paths):
+        """
+        Called by the plugin to fetch the two newest data points of several
+        performance counters, for all daemons of a service, in a single call.
+
+        :param str svc_type:
+        :param list paths: counter paths, for example ["osd.op_w", "osd.op_r"]
+        :return: A dict of daemon id to a dict of path to a list of
+            (timestamp, value) (or (timestamp, sum, count) for long running
+            averages), oldest first.  Counters without data are omitted.
+        """
+        return self._ceph_get_latest_counters(svc_type, list(paths))
+
     def list_servers(self):
         """
         Like ``get_server``, but gives information about all servers (i.e. all
@@ -1096,6 +1117,24 @@ class MgrModule(ceph_module.BaseMgrModule):
         else:
             return 0, 0
 
+    def get_rates(self, daemon_type, counters):
+        """
+        Current rates (per second) of several counters, for all daemons of a
+        type, from a single get_latest_counters() call.
+
+        :return: dict of daemon id -> dict of counter -> rate
+        """
+        rates = {}
+        latest = self.get_latest_counters(daemon_type, counters)
+        for daemon_name, data in six.iteritems(latest):
+            rates[daemon_name] = dict((counter, 0) for counter in counters)
+            for counter, points in six.iteritems(data):
+                if len(points) > 1 and points[-1][0] > points[-2][0]:
+                    rates[daemon_name][counter] = \
+                        (points[-1][1] - points[-2][1]) / \
+                        float(points[-1][0] - points[-2][0])
+        return rates
+
     def get_all_perf_counters(self, prio_limit=PRIO_USEFUL,
                               services=("mds", "mon", "osd",
                                         "rbd-mirror", "rgw")):
@@ -1,3 +1,5 @@
+import threading
+import time
 
 (
     BLACK,
@@ -71,3 +73,82 @@ def format_dimless(n, width, colored=True):
 
 def format_bytes(n, width, colored=True):
     return format_units(n, width, colored, decimal=False)
+
+
+class RBDImageNames(object):
+    """
+    Directory of RBD image id -> name, per pool and namespace, for modules
+    that need to name images found in OSD perf counters.
+
+    A pool namespace is fully listed on first use, and afterwards only when
+    its rbd_directory object changed: the object is stat'ed by refresh(),
+    or by get() at most every `check_interval` seconds. `generation` is
+    bumped whenever some names were listed again.
+    """
+    def __init__(self, module, check_interval=60):
+        self.module = module
+        self.check_interval = check_interval
+        self.lock = threading.Lock()
+        # (pool_id, namespace) -> [names, rbd_directory stat, check time]
+        self.directories = {}
+        self.generation = 0
+
+    def get(self, pool_id, namespace):
+        with self.lock:
+            directory = self.directories.get((pool_id, namespace))
+            if directory and \
+                    directory[2] + self.check_interval > time.time():
+                return directory[0]
+        return self.refresh(pool_id, namespace)
+
+    def get_cached(self, pool_id, namespace):
+        """
+        The known image names, without checking for changes.
+        """
+        with self.lock:
+            directory = self.directories.get((pool_id, namespace))
+            return directory[0] if directory else {}
+
+    def refresh(self, pool_id, namespace):
+        """
+        List the images again if the rbd_directory object changed since they
+        were last listed.
+        """
+        from rados import ObjectNotFound
+        from rbd import RBD
+
+        key = (pool_id, namespace)
+        with self.lock:
+            # an empty stat never matches, so that the images get listed
+            names, listed_stat, _ = self.directories.get(key, [{}, (), 0])
+        now = time.time()
+        with self.module.rados.open_ioctx2(int(pool_id)) as ioctx:
+            ioctx.set_namespace(namespace)
+            try:
+                size, mtime = ioctx.stat('rbd_directory')
+                stat = (size, time.mktime(mtime))
+            except ObjectNotFound:
+                stat = None
+            if stat != listed_stat:
+                names = {}
+                if stat is not None:
+                    for image_meta in RBD().list2(ioctx):
+                        names[image_meta['id']] = image_meta['name']
+                self.module.log.debug(
+                    "refreshed {} rbd image names of {}".format(
+                        len(names), key))
+                # mtime only has a second resolution: do not trust it if the
+                # directory may have changed again after it was listed
+                if stat is not None and stat[1] >= now - 1:
+                    stat = ()
+        with self.lock:
+            if names is not self.directories.get(key, [None])[0]:
+                self.generation += 1
+            self.directories[key] = [names, stat, now]
+        return names
+
+    def forget(self, pool_id, namespace=None):
+        with self.lock:
+            for key in list(self.directories):
+                if key[0] == pool_id and namespace in (None, key[1]):
+                    del self.directories[key]
@@ -7,7 +7,7 @@ import json
 import mgr_util
 import threading
 import uuid
-from six import itervalues, iteritems
+from six import iteritems
 from collections import defaultdict
 from prettytable import PrettyTable
 
@@ -46,6 +46,25 @@ def nearest_power_of_two(n):
     return x if (v - n) > (n - x) else v
 
 
+class CrushSubtreeResourceStatus(object):
+    def __init__(self):
+        self.root_ids = []
+        self.osds = set()
+        self.osd_count = None  # Number of OSDs
+        self.pg_target = None  # Ideal full-capacity PG count?
+        self.pg_current = 0  # How many PGs already?
+        self.capacity = None  # Total capacity of OSDs in subtree
+        self.pool_ids = []
+        self.pool_names = []
+
+    def merge(self, other):
+        self.root_ids += other.root_ids
+        self.osds |= other.osds
+        self.pg_current += other.pg_current
+        self.pool_ids += other.pool_ids
+        self.pool_names += other.pool_names
+
+
 class PgAutoscaler(MgrModule):
     """
     PG autoscaler.
@@ -78,6 +97,9 @@ class PgAutoscaler(MgrModule):
         # to just keep a copy of the pythonized version.
         self._osd_map = None
 
+        # ((osdmap epoch, mon_target_pg_per_osd), subtree status)
+        self._subtree_status = None
+
     def config_notify(self):
         for opt in self.NATIVE_OPTIONS:
             setattr(self,
@@ -168,62 +190,96 @@ class PgAutoscaler(MgrModule):
         we have pools), calculate the current resource usages and targets,
         such as how many PGs there are, vs. how many PGs we would
         like there to be.
+
+        The result only depends on the osdmap and the OSDs' capacity, so
+        it is cached for the osdmap epoch.
         """
+        key = (osdmap.get_epoch(), self.mon_target_pg_per_osd)
+        if self._subtree_status is None or self._subtree_status[0] != key:
+            result, pool_root, complete = \
+                self._build_subtree_resource_status(osdmap, crush)
+            if not complete:
+                # some OSDs have not reported their capacity yet
+                return result, pool_root
+            self._subtree_status = (key, (result, pool_root))
+        result, pool_root = self._subtree_status[1]
+        return result, dict(pool_root)
+
+    def _build_subtree_resource_status(self, osdmap, crush):
         result = {}
         pool_root = {}
         roots = []
 
-        class CrushSubtreeResourceStatus(object):
-            def __init__(self):
-                self.root_ids = []
-                self.osds = set()
-                self.osd_count = None  # Number of OSDs
-                self.pg_target = None  # Ideal full-capacity PG count?
-                self.pg_current = 0  # How many PGs already?
-                self.capacity = None  # Total capacity of OSDs in subtree
-                self.pool_ids = []
-                self.pool_names = []
-
-        # identify subtrees (note that they may overlap!)
+        # resolve each rule's root and each root's OSDs from a single
+        # crush dump
+        crush_dump = crush.dump()
+        buckets = dict([(b['id'], b) for b in crush_dump['buckets']])
+        rule_root = {}
+        for rule in crush_dump['rules']:
+            takes = [s['item'] for s in rule['steps'] if s['op'] == 'take']
+            if takes:
+                # FIXME: we assume there is only one take per pool, but
+                # that may not be true.
+                rule_root[rule['rule_id']] = takes[0]
+
+        root_osds = {}
+        def osds_under(root_id):
+            if root_id not in root_osds:
+                osds = set()
+                stack = [root_id]
+                while stack:
+                    b = buckets.get(stack.pop())
+                    if b is None:
+                        continue
+                    for item in b['items']:
+                        if item['id'] >= 0:
+                            osds.add(item['id'])
+                        else:
+                            stack.append(item['id'])
+                root_osds[root_id] = frozenset(osds)
+            return root_osds[root_id]
+
+        # identify subtrees (note that they may overlap!), merging any
+        # subtrees that a root overlaps with
         for pool_id, pool in osdmap.get_pools().items():
-            cr_name = crush.get_rule_by_id(pool['crush_rule'])['rule_name']
-            root_id = int(crush.get_rule_root(cr_name))
+            root_id = int(rule_root[pool['crush_rule']])
             pool_root[pool_id] = root_id
-            osds = set(crush.get_osds_under(root_id))
-
-            # do we intersect an existing root?
-            s = None
-            for prev in itervalues(result):
-                if osds & prev.osds:
-                    s = prev
-                    break
-            if not s:
-                s = CrushSubtreeResourceStatus()
-                roots.append(s)
-            result[root_id] = s
-            s.root_ids.append(root_id)
-            s.osds |= osds
+            s = result.get(root_id)
+            if s is None:
+                osds = osds_under(root_id)
+                overlapping = [prev for prev in roots
+                               if not osds.isdisjoint(prev.osds)]
+                if overlapping:
+                    s = overlapping[0]
+                    for other in overlapping[1:]:
+                        s.merge(other)
+                        roots.remove(other)
+                        for r in other.root_ids:
+                            result[r] = s
+                else:
+                    s = CrushSubtreeResourceStatus()
+                    roots.append(s)
+                result[root_id] = s
+                s.root_ids.append(root_id)
+                s.osds |= osds
             s.pool_ids.append(int(pool_id))
             s.pool_names.append(pool['pool_name'])
             s.pg_current += pool['pg_num_target'] * pool['size']
 
-
         # finish subtrees
-        all_stats = self.get('osd_stats')
+        # Intentionally do not apply the OSD's reweight to the capacity,
+        # because we want to calculate PG counts based on the physical
+        # storage available, not how it is reweighted right now.
+        osd_kb = dict([(osd_stats['osd'], osd_stats['kb'])
+                       for osd_stats in self.get('osd_stats')['osd_stats']])
+        complete = True
         for s in roots:
             s.osd_count = len(s.osds)
             s.pg_target = s.osd_count * int(self.mon_target_pg_per_osd)
-
-            capacity = 0.0
-            for osd_stats in all_stats['osd_stats']:
-                if osd_stats['osd'] in s.osds:
-                    # Intentionally do not apply the OSD's reweight to
-                    # this, because we want to calculate PG counts based
-                    # on the physical storage available, not how it is
-                    # reweighted right now.
-                    capacity += osd_stats['kb'] * 1024
-
-            s.capacity = capacity
+            if not s.osds.issubset(osd_kb):
+                complete = False
+            s.capacity = float(sum(osd_kb[osd] for osd in s.osds
+                                   if osd in osd_kb) * 1024)
 
             self.log.debug('root_ids %s pools %s with %d osds, pg_target %d',
                            s.root_ids,
@@ -231,7 +287,7 @@ class PgAutoscaler(MgrModule):
                            s.osd_count,
                            s.pg_target)
 
-        return result, pool_root
+        return result, pool_root, complete
 
 
     def _get_pool_status(
@@ -255,15 +311,12 @@ class PgAutoscaler(MgrModule):
         for pool_name, p in iteritems(pools):
             pool_id = p['pool']
 
-            # FIXME: we assume there is only one take per pool, but that
-            # may not be true.
-            cr_name = crush_map.get_rule_by_id(p['crush_rule'])['rule_name']
-            root_id = int(crush_map.get_rule_root(cr_name))
+            root_id = pool_root[pool_id]
             pool_root[pool_name] = root_id
 
             capacity = root_map[root_id].capacity
             if capacity == 0:
-                self.log.debug('skipping empty subtree %s', cr_name)
+                self.log.debug('skipping empty subtree %s', root_id)
                 continue
 
             raw_used_rate = osdmap.pool_raw_used_rate(pool_id)
@@ -9,6 +9,7 @@ import socket
 import threading
 import time
 from mgr_module import MgrModule, MgrStandbyModule, CommandResult, PG_STATES
+from mgr_util import RBDImageNames
 from rbd import RBD
 
 # Defaults for the Prometheus HTTP server.  Can also set in config-key
@@ -195,6 +196,7 @@ class Module(MgrModule):
         self.collect_time = 0
         self.collect_timeout = 5.0
         self.collect_cache = None
+        self.rbd_image_names = RBDImageNames(self)
         self.rbd_stats = {
             'pools': {},
             'pools_refresh_time': 0,
@@ -635,6 +637,7 @@ class Module(MgrModule):
             name = self.rbd_stats['pools'][pool_id]['name']
             if name not in pools:
                 del self.rbd_stats['pools'][pool_id]
+                self.rbd_image_names.forget(pool_id)
             else:
                 rbd_stats_pools[name] = \
                     self.rbd_stats['pools'][pool_id]['ns_names']
@@ -778,7 +781,8 @@ class Module(MgrModule):
                 pool_id = self.rados.pool_lookup(pool_name)
                 with self.rados.open_ioctx(pool_name) as ioctx:
                     if pool_id not in self.rbd_stats['pools']:
-                        self.rbd_stats['pools'][pool_id] = {'images': {}}
+                        self.rbd_stats['pools'][pool_id] = {'images': {},
+                                                            'names': {}}
                     pool = self.rbd_stats['pools'][pool_id]
                     pool['name'] = pool_name
                     pool['ns_names'] = cfg_ns_names
@@ -786,23 +790,29 @@ class Module(MgrModule):
                         nspace_names = list(cfg_ns_names)
                     else:
                         nspace_names = [''] + rbd.namespace_list(ioctx)
-                    for nspace_name in pool['images']:
+                    for nspace_name in list(pool['images']):
                         if nspace_name not in nspace_names:
                             del pool['images'][nspace_name]
+                            pool['names'].pop(nspace_name, None)
+                            self.rbd_image_names.forget(pool_id, nspace_name)
                     for nspace_name in nspace_names:
                         if (nspace_name and
                                 not rbd.namespace_exists(ioctx, nspace_name)):
                             self.log.debug('unknown namespace %s for pool %s' %
                                            (nspace_name, pool_name))
                             continue
-                        ioctx.set_namespace(nspace_name)
                         if nspace_name not in pool['images']:
                             pool['images'][nspace_name] = {}
                         namespace = pool['images'][nspace_name]
+                        # only listed again if the rbd directory changed
+                        image_names = self.rbd_image_names.refresh(
+                            pool_id, nspace_name)
+                        if image_names is pool['names'].get(nspace_name):
+                            continue
+                        pool['names'][nspace_name] = image_names
                         images = {}
-                        for image_meta in RBD().list2(ioctx):
-                            image = {'n': image_meta['name']}
-                            image_id = image_meta['id']
+                        for image_id, image_name in image_names.items():
+                            image = {'n': image_name}
                             if image_id in namespace:
                                 image['c'] = namespace[image_id]['c']
                             else:
@@ -2,15 +2,17 @@
 RBD support module
 """
 
+import heapq
 import json
 import time
 import traceback
 
 from mgr_module import MgrModule
+from mgr_util import RBDImageNames
 
+from array import array
 from datetime import datetime, timedelta
 from rados import ObjectNotFound
-from rbd import RBD
 from threading import Condition, Lock, Thread
 
 GLOBAL_POOL_KEY = (None, None)
@@ -18,8 +20,7 @@ GLOBAL_POOL_KEY = (None, None)
 QUERY_POOL_ID = "pool_id"
 QUERY_POOL_ID_MAP = "pool_id_map"
 QUERY_IDS = "query_ids"
-QUERY_SUM_POOL_COUNTERS = "pool_counters"
-QUERY_RAW_POOL_COUNTERS = "raw_pool_counters"
+QUERY_IMAGE_COUNTERS = "image_counters"
 QUERY_LAST_REQUEST = "last_request"
 
 OSD_PERF_QUERY_REGEX_MATCH_ALL = '^(.*)$'
@@ -42,6 +43,130 @@ STATS_RATE_INTERVAL = timedelta(minutes=1)
 REPORT_MAX_RESULTS = 64
 
 
+class ImagePerfCounters(object):
+    """
+    Raw and cumulative OSD perf counters of the images matched by a query.
+
+    Each (pool_id, namespace, image_id) key is interned to a slot, and the
+    counters of a slot live at [slot * WIDTH, (slot + 1) * WIDTH) of fixed
+    width arrays. Only the images updated in the current or the previous
+    round are visited when a round is closed.
+    """
+    WIDTH = len(OSD_PERF_QUERY_COUNTERS)
+    ZEROS = array('l', [0] * WIDTH)
+
+    def __init__(self):
+        self.slots = {}
+        self.keys = []
+        self.free_slots = []
+
+        # timestamps of the last two raw counters, 0 if there is none
+        self.current_ts = array('l')
+        self.previous_ts = array('l')
+        # last raw counters and cumulative counters
+        self.current = array('l')
+        self.sums = array('l')
+
+        # slots updated in the current round, and with non-zero raw counters
+        self.updated = set()
+        self.active = set()
+        self.round_ts = 0
+
+        self.generation = 0
+        self.top_cache_generation = 0
+        self.top_cache = {}
+
+    def __len__(self):
+        return len(self.slots)
+
+    def items(self):
+        return self.slots.items()
+
+    def get_slot(self, key):
+        slot = self.slots.get(key)
+        if slot is not None:
+            return slot
+
+        if self.free_slots:
+            slot = self.free_slots.pop()
+            self.keys[slot] = key
+        else:
+            slot = len(self.keys)
+            self.keys.append(key)
+            self.current_ts.append(0)
+            self.previous_ts.append(0)
+            self.current.extend(self.ZEROS)
+            self.sums.extend(self.ZEROS)
+        self.slots[key] = slot
+        return slot
+
+    def update(self, key, now_ts, counters):
+        slot = self.get_slot(key)
+
+        # only keep the first counters reported for an image in a round
+        if self.current_ts[slot] == now_ts:
+            return
+
+        # the raw counters of an image are zeroed at the end of each round
+        # it is not updated in, so its previous ones always date from the
+        # last round
+        self.previous_ts[slot] = self.round_ts if self.current_ts[slot] else 0
+        self.current_ts[slot] = now_ts
+        offset = slot * self.WIDTH
+        self.current[offset:offset + self.WIDTH] = array('l', counters)
+        self.updated.add(slot)
+
+    def end_round(self, now_ts):
+        # zero-out non-updated raw counters
+        for slot in [s for s in self.active if self.current_ts[s] < now_ts]:
+            offset = slot * self.WIDTH
+            self.current[offset:offset + self.WIDTH] = self.ZEROS
+            self.active.discard(slot)
+
+        # increment the cumulative counters of the updated images
+        for slot in self.updated:
+            offset = slot * self.WIDTH
+            for i in range(offset, offset + self.WIDTH):
+                self.sums[i] += self.current[i]
+            self.active.add(slot)
+
+        self.updated = set()
+        self.round_ts = now_ts
+        self.generation += 1
+
+    def remove(self, key):
+        slot = self.slots.pop(key)
+        self.keys[slot] = None
+        self.current_ts[slot] = 0
+        self.previous_ts[slot] = 0
+        offset = slot * self.WIDTH
+        self.current[offset:offset + self.WIDTH] = self.ZEROS
+        self.sums[offset:offset + self.WIDTH] = self.ZEROS
+        self.updated.discard(slot)
+        self.active.discard(slot)
+        self.free_slots.append(slot)
+        self.generation += 1
+
+    def top(self, pool_ids, count, index, key):
+        """
+        The (at most) count slots of the given pools with the largest key,
+        cached per sort index until the counters change.
+        """
+        if self.top_cache_generation != self.generation:
+            self.top_cache_generation = self.generation
+            self.top_cache = {}
+
+        cache_key = (frozenset(pool_ids), count, index)
+        result = self.top_cache.get(cache_key)
+        if result is None:
+            result = heapq.nlargest(
+                count, [slot for slot, image_key in enumerate(self.keys)
+                        if image_key is not None and image_key[0] in pool_ids],
+                key=key)
+            self.top_cache[cache_key] = result
+        return result
+
+
 class Module(MgrModule):
     COMMANDS = [
         {
@@ -75,8 +200,8 @@ class Module(MgrModule):
     refresh_condition = Condition(lock)
     thread = None
 
-    image_name_cache = {}
-    image_name_refresh_time = datetime.fromtimestamp(0)
+    image_names = None
+    image_names_generation = 0
 
     @classmethod
     def prepare_regex(cls, value):
@@ -124,6 +249,8 @@ class Module(MgrModule):
 
     def __init__(self, *args, **kwargs):
         super(Module, self).__init__(*args, **kwargs)
+        self.image_names = RBDImageNames(
+            self, POOL_REFRESH_INTERVAL.total_seconds())
         self.thread = Thread(target=self.run)
         self.thread.start()
 
@@ -149,8 +276,12 @@ class Module(MgrModule):
                                     resolve_image_names):
         pool_id_map = query[QUERY_POOL_ID_MAP]
 
+        # image names of the pools (and namespaces) seen in this round
+        image_names = {}
+
         # collect and combine the raw counters from all sort orders
-        raw_pool_counters = query.setdefault(QUERY_RAW_POOL_COUNTERS, {})
+        image_counters = query.setdefault(QUERY_IMAGE_COUNTERS,
+                                          ImagePerfCounters())
         for query_id in query[QUERY_IDS]:
             res = self.get_osd_perf_counters(query_id)
             for counter in res['counters']:
@@ -169,111 +300,70 @@ class Module(MgrModule):
                 # flag the pool (and namespace) for refresh if we cannot find
                 # image name in the cache
                 resolve_image_key = (pool_id, namespace)
-                if image_id not in self.image_name_cache.get(resolve_image_key, {}):
+                if resolve_image_key not in image_names:
+                    image_names[resolve_image_key] = self.image_names.get(
+                        pool_id, namespace)
+                if image_id not in image_names[resolve_image_key]:
                     resolve_image_names.add(resolve_image_key)
 
                 # copy the 'sum' counter values for each image (ignore count)
                 # if we haven't already processed it for this round
-                raw_namespaces = raw_pool_counters.setdefault(pool_id, {})
-                raw_images = raw_namespaces.setdefault(namespace, {})
-                raw_image = raw_images.setdefault(image_id, [None, None])
-
-                # save the last two perf counters for each image
-                if raw_image[0] and raw_image[0][0] < now_ts:
-                    raw_image[1] = raw_image[0]
-                    raw_image[0] = None
-                if not raw_image[0]:
-                    raw_image[0] = [now_ts, [int(x[0]) for x in counter['c']]]
+                image_counters.update((pool_id, namespace, image_id), now_ts,
+                                      [int(x[0]) for x in counter['c']])
 
-        self.log.debug("merge_raw_osd_perf_counters: {}".format(raw_pool_counters))
-        return raw_pool_counters
+        self.log.debug("merge_raw_osd_perf_counters: {} images".format(
+            len(image_counters)))
+        return image_counters
 
-    def sum_osd_perf_counters(self, query, raw_pool_counters, now_ts):
+    def sum_osd_perf_counters(self, query, image_counters, now_ts):
         # update the cumulative counters for each image
-        sum_pool_counters = query.setdefault(QUERY_SUM_POOL_COUNTERS, {})
-        for pool_id, raw_namespaces in raw_pool_counters.items():
-            sum_namespaces = sum_pool_counters.setdefault(pool_id, {})
-            for namespace, raw_images in raw_namespaces.items():
-                sum_namespace = sum_namespaces.setdefault(namespace, {})
-                for image_id, raw_image in raw_images.items():
-                    # zero-out non-updated raw counters
-                    if not raw_image[0]:
-                        continue
-                    elif raw_image[0][0] < now_ts:
-                        raw_image[1] = raw_image[0]
-                        raw_image[0] = [now_ts, [0 for x in raw_image[1][1]]]
-                        continue
-
-                    counters = raw_image[0][1]
-
-                    # copy raw counters if this is a newly discovered image or
-                    # increment existing counters
-                    sum_image = sum_namespace.setdefault(image_id, None)
-                    if sum_image:
-                        for i in range(len(counters)):
-                            sum_image[i] += counters[i]
-                    else:
-                        sum_namespace[image_id] = [x for x in counters]
-
-        self.log.debug("sum_osd_perf_counters: {}".format(sum_pool_counters))
-        return sum_pool_counters
+        image_counters.end_round(now_ts)
+        self.log.debug("sum_osd_perf_counters: {} active images".format(
+            len(image_counters.active)))
+        return image_counters
 
     def refresh_image_names(self, resolve_image_names):
-        rbd = RBD()
         for pool_id, namespace in resolve_image_names:
-            image_key = (pool_id, namespace)
-            images = self.image_name_cache.setdefault(image_key, {})
-            with self.rados.open_ioctx2(int(pool_id)) as ioctx:
-                ioctx.set_namespace(namespace)
-                for image_meta in rbd.list2(ioctx):
-                    images[image_meta['id']] = image_meta['name']
-            self.log.debug("resolve_image_names: {}={}".format(image_key, images))
+            images = self.image_names.refresh(pool_id, namespace)
+            self.log.debug("resolve_image_names: {}={}".format(
+                (pool_id, namespace), images))
 
     def scrub_missing_images(self):
         for pool_key, query in self.user_queries.items():
-            raw_pool_counters = query.get(QUERY_RAW_POOL_COUNTERS, {})
-            sum_pool_counters = query.get(QUERY_SUM_POOL_COUNTERS, {})
-            for pool_id, sum_namespaces in sum_pool_counters.items():
-                raw_namespaces = raw_pool_counters.get(pool_id, {})
-                for namespace, sum_images in sum_namespaces.items():
-                    raw_images = raw_namespaces.get(namespace, {})
-
-                    image_key = (pool_id, namespace)
-                    image_names = self.image_name_cache.get(image_key, {})
-                    for image_id in list(sum_images.keys()):
-                        # scrub image counters if we failed to resolve image name
-                        if image_id not in image_names:
-                            self.log.debug("scrub_missing_images: dropping {}/{}".format(
-                                image_key, image_id))
-                            del sum_images[image_id]
-                            if image_id in raw_images:
-                                del raw_images[image_id]
+            image_counters = query.get(QUERY_IMAGE_COUNTERS)
+            if image_counters is None:
+                continue
+
+            for image_key, _ in list(image_counters.items()):
+                # scrub image counters if we failed to resolve image name
+                pool_id, namespace, image_id = image_key
+                image_names = self.image_names.get_cached(pool_id, namespace)
+                if image_id not in image_names:
+                    self.log.debug("scrub_missing_images: dropping {}/{}".format(
+                        (pool_id, namespace), image_id))
+                    image_counters.remove(image_key)
 
     def process_raw_osd_perf_counters(self):
         now = datetime.now()
         now_ts = int(now.strftime("%s"))
 
-        # clear the image name cache if we need to refresh all active pools
-        if self.image_name_cache and \
-                self.image_name_refresh_time + POOL_REFRESH_INTERVAL < now:
-            self.log.debug("process_raw_osd_perf_counters: expiring image name cache")
-            self.image_name_cache = {}
-
         resolve_image_names = set()
         for pool_key, query in self.user_queries.items():
             if not query[QUERY_IDS]:
                 continue
 
-            raw_pool_counters = self.merge_raw_osd_perf_counters(
+            image_counters = self.merge_raw_osd_perf_counters(
                 pool_key, query, now_ts, resolve_image_names)
-            self.sum_osd_perf_counters(query, raw_pool_counters, now_ts)
+            self.sum_osd_perf_counters(query, image_counters, now_ts)
 
+        # drop the counters of the images that could not be resolved, or
+        # were removed since the names were listed
         if resolve_image_names:
-            self.image_name_refresh_time = now
             self.refresh_image_names(resolve_image_names)
             self.scrub_missing_images()
-        elif not self.image_name_cache:
+        elif self.image_names.generation != self.image_names_generation:
             self.scrub_missing_images()
+        self.image_names_generation = self.image_names.generation
 
     def get_rbd_pools(self):
         osd_map = self.get('osd_map')
@@ -359,18 +449,19 @@ class Module(MgrModule):
 
         return user_query
 
-    def extract_stat(self, index, raw_image, sum_image):
+    def extract_stat(self, index, image_counters, slot):
         # require two raw counters between a fixed time window
-        if not raw_image or not raw_image[0] or not raw_image[1]:
+        current_time = image_counters.current_ts[slot]
+        previous_time = image_counters.previous_ts[slot]
+        if not current_time or not previous_time:
             return 0
 
-        current_time = raw_image[0][0]
-        previous_time = raw_image[1][0]
         if current_time <= previous_time or \
                 current_time - previous_time > STATS_RATE_INTERVAL.total_seconds():
             return 0
 
-        current_value = raw_image[0][1][index]
+        current_value = image_counters.current[
+            slot * ImagePerfCounters.WIDTH + index]
         instant_rate = float(current_value) / (current_time - previous_time)
 
         # convert latencies from sum to average per op
@@ -381,59 +472,37 @@ class Module(MgrModule):
             ops_index = OSD_PERF_QUERY_COUNTERS_INDICES['read_ops']
 
         if ops_index is not None:
-            ops = max(1, self.extract_stat(ops_index, raw_image, sum_image))
+            ops = max(1, self.extract_stat(ops_index, image_counters, slot))
             instant_rate /= ops
 
         return instant_rate
 
-    def extract_counter(self, index, raw_image, sum_image):
-        if sum_image:
-            return sum_image[index]
-        return 0
+    def extract_counter(self, index, image_counters, slot):
+        return image_counters.sums[slot * ImagePerfCounters.WIDTH + index]
 
     def generate_report(self, query, sort_by, extract_data):
         pool_id_map = query[QUERY_POOL_ID_MAP]
-        sum_pool_counters = query.setdefault(QUERY_SUM_POOL_COUNTERS, {})
-        raw_pool_counters = query.setdefault(QUERY_RAW_POOL_COUNTERS, {})
+        image_counters = query.setdefault(QUERY_IMAGE_COUNTERS,
+                                          ImagePerfCounters())
 
         sort_by_index = OSD_PERF_QUERY_COUNTERS.index(sort_by)
 
-        # pre-sort and limit the response
-        results = []
-        for pool_id, sum_namespaces in sum_pool_counters.items():
-            if pool_id not in pool_id_map:
-                continue
-            raw_namespaces = raw_pool_counters.get(pool_id, {})
-            for namespace, sum_images in sum_namespaces.items():
-                raw_images = raw_namespaces.get(namespace, {})
-                for image_id, sum_image in sum_images.items():
-                    raw_image = raw_images.get(image_id, [])
-
-                    # always sort by recent IO activity
-                    results.append([(pool_id, namespace, image_id),
-                                    self.extract_stat(sort_by_index, raw_image,
-                                                      sum_image)])
-        results = sorted(results, key=lambda x: x[1], reverse=True)[:REPORT_MAX_RESULTS]
+        # pre-sort and limit the response, always by recent IO activity
+        results = image_counters.top(
+            pool_id_map.keys(), REPORT_MAX_RESULTS, sort_by_index,
+            lambda slot: self.extract_stat(sort_by_index, image_counters, slot))
 
         # build the report in sorted order
         pool_descriptors = {}
         counters = []
-        for key, _ in results:
-            pool_id = key[0]
+        for slot in results:
+            pool_id, namespace, image_id = image_counters.keys[slot]
             pool_name = pool_id_map[pool_id]
 
-            namespace = key[1]
-            image_id = key[2]
-            image_names = self.image_name_cache.get((pool_id, namespace), {})
-            image_name = image_names[image_id]
-
-            raw_namespaces = raw_pool_counters.get(pool_id, {})
-            raw_images = raw_namespaces.get(namespace, {})
-            raw_image = raw_images.get(image_id, [])
-
-            sum_namespaces = sum_pool_counters[pool_id]
-            sum_images = sum_namespaces[namespace]
-            sum_image = sum_images.get(image_id, [])
+            image_names = self.image_names.get_cached(pool_id, namespace)
+            image_name = image_names.get(image_id)
+            if image_name is None:
+                continue
 
             pool_descriptor = pool_name
             if namespace:
@@ -441,7 +510,7 @@ class Module(MgrModule):
             pool_index = pool_descriptors.setdefault(pool_descriptor,
                                                      len(pool_descriptors))
             image_descriptor = "{}/{}".format(pool_index, image_name)
-            data = [extract_data(i, raw_image, sum_image)
+            data = [extract_data(i, image_counters, slot)
                     for i in range(len(OSD_PERF_QUERY_COUNTERS))]
 
             # skip if no data to report
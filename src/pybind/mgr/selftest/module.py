@@ -352,6 +352,8 @@ class Module(MgrModule):
     def _self_test_perf_counters(self):
         self.get_perf_schema("osd", "0")
         self.get_counter("osd", "0", "osd.op")
+        self.get_latest_counters("osd", ["osd.op", "osd.op_r"])
+        self.get_rates("osd", ["osd.op", "osd.op_r"])
         #get_counter
         #get_all_perf_coutners
 
@@ -24,8 +24,10 @@ class Module(MgrModule):
         },
         {
             "cmd": "osd status "
-                   "name=bucket,type=CephString,req=false",
-            "desc": "Show the status of OSDs within a bucket, or all",
+                   "name=bucket,type=CephString,req=false "
+                   "name=by_host,type=CephBool,req=false",
+            "desc": "Show the status of OSDs within a bucket, or all "
+                    "(optionally summed up per host)",
             "perm": "r"
         },
     ]
@@ -193,7 +195,6 @@ class Module(MgrModule):
         return 0, output, ""
 
     def handle_osd_status(self, cmd):
-        osd_table = PrettyTable(['id', 'host', 'used', 'avail', 'wr ops', 'wr data', 'rd ops', 'rd data', 'state'])
         osdmap = self.get("osd_map")
 
         filter_osds = set()
@@ -214,7 +215,14 @@ class Module(MgrModule):
 
         # Build dict of OSD ID to stats
         osd_stats = dict([(o['osd'], o) for o in self.get("osd_stats")['osd_stats']])
-
+        osd_metadata = self.get("osd_metadata")
+        # Fetch the rates of all OSDs at once rather than one counter of
+        # one OSD at a time
+        osd_rates = self.get_rates("osd", ["osd.op_w", "osd.op_rw",
+                                           "osd.op_in_bytes", "osd.op_r",
+                                           "osd.op_out_bytes"])
+
+        rows = []
         for osd in osdmap['osds']:
             osd_id = osd['osd']
             if bucket_filter and osd_id not in filter_osds:
@@ -225,25 +233,63 @@ class Module(MgrModule):
             kb_avail = 0
 
             if osd_id in osd_stats:
-                metadata = self.get_metadata('osd', "%s" % osd_id)
                 stats = osd_stats[osd_id]
-                hostname = metadata['hostname']
+                hostname = osd_metadata.get(str(osd_id), {}).get('hostname', "")
                 kb_used = stats['kb_used'] * 1024
                 kb_avail = stats['kb_avail'] * 1024
 
+            rates = osd_rates.get(str(osd_id), defaultdict(int))
+            rows.append([osd_id, hostname, kb_used, kb_avail,
+                         rates['osd.op_w'] + rates['osd.op_rw'],
+                         rates['osd.op_in_bytes'],
+                         rates['osd.op_r'],
+                         rates['osd.op_out_bytes'],
+                         ','.join(osd['state'])])
+
+        if cmd.get('by_host', False):
+            return 0, self._format_osd_status_by_host(rows), ""
+
+        osd_table = PrettyTable(['id', 'host', 'used', 'avail', 'wr ops', 'wr data', 'rd ops', 'rd data', 'state'])
+        for (osd_id, hostname, kb_used, kb_avail, wr_ops, wr_data, rd_ops,
+             rd_data, state) in rows:
             osd_table.add_row([osd_id, hostname,
                                mgr_util.format_bytes(kb_used, 5),
                                mgr_util.format_bytes(kb_avail, 5),
-                               mgr_util.format_dimless(self.get_rate("osd", osd_id.__str__(), "osd.op_w") +
-                               self.get_rate("osd", osd_id.__str__(), "osd.op_rw"), 5),
-                               mgr_util.format_bytes(self.get_rate("osd", osd_id.__str__(), "osd.op_in_bytes"), 5),
-                               mgr_util.format_dimless(self.get_rate("osd", osd_id.__str__(), "osd.op_r"), 5),
-                               mgr_util.format_bytes(self.get_rate("osd", osd_id.__str__(), "osd.op_out_bytes"), 5),
-                               ','.join(osd['state']),
+                               mgr_util.format_dimless(wr_ops, 5),
+                               mgr_util.format_bytes(wr_data, 5),
+                               mgr_util.format_dimless(rd_ops, 5),
+                               mgr_util.format_bytes(rd_data, 5),
+                               state,
                                ])
 
         return 0, osd_table.get_string(), ""
 
+    def _format_osd_status_by_host(self, rows):
+        hosts = {}
+        for (osd_id, hostname, kb_used, kb_avail, wr_ops, wr_data, rd_ops,
+             rd_data, state) in rows:
+            host = hosts.setdefault(hostname, [0, 0, 0, 0, 0, 0, 0, 0])
+            host[0] += 1
+            if 'up' in state.split(','):
+                host[1] += 1
+            for i, v in enumerate([kb_used, kb_avail, wr_ops, wr_data,
+                                   rd_ops, rd_data]):
+                host[i + 2] += v
+
+        host_table = PrettyTable(['host', 'osds', 'up', 'used', 'avail', 'wr ops', 'wr data', 'rd ops', 'rd data'])
+        for hostname in sorted(hosts):
+            (osds, up, kb_used, kb_avail, wr_ops, wr_data, rd_ops,
+             rd_data) = hosts[hostname]
+            host_table.add_row([hostname, osds, up,
+                                mgr_util.format_bytes(kb_used, 5),
+                                mgr_util.format_bytes(kb_avail, 5),
+                                mgr_util.format_dimless(wr_ops, 5),
+                                mgr_util.format_bytes(wr_data, 5),
+                                mgr_util.format_dimless(rd_ops, 5),
+                                mgr_util.format_bytes(rd_data, 5),
+                                ])
+        return host_table.get_string()
+
     def handle_command(self, inbuf, cmd):
         self.log.error("handle_command")
 
@@ -1,6 +1,8 @@
-from threading import Event
+from contextlib import contextmanager
+from threading import Event, Lock
 import errno
 import json
+import time
 try:
     import queue as Queue
 except ImportError:
@@ -9,7 +11,12 @@ except ImportError:
 from mgr_module import MgrModule
 import orchestrator
 
-from ceph_volume_client import CephFSVolumeClient, VolumePath
+from ceph_volume_client import CephFSVolumeClient, VolumePath, \
+    PurgeInterrupted
+
+# Purge jobs are persisted as <prefix><fscid>/<subvolume id>
+PURGE_KEY_PREFIX = "purge/"
+
 
 class PurgeJob(object):
     def __init__(self, volume_fscid, subvolume_path):
@@ -21,6 +28,138 @@ class PurgeJob(object):
         """
         self.fscid = volume_fscid
         self.subvolume_path = subvolume_path
+        self.stop = Event()
+
+    @property
+    def key(self):
+        return "{0}{1}/{2}".format(PURGE_KEY_PREFIX, self.fscid,
+                                   self.subvolume_path.volume_id)
+
+    def to_json(self):
+        return json.dumps({
+            'fscid': self.fscid,
+            'group_id': self.subvolume_path.group_id,
+            'volume_id': self.subvolume_path.volume_id,
+        })
+
+    @classmethod
+    def from_json(cls, data):
+        job = json.loads(data)
+        return cls(job['fscid'], VolumePath(job['group_id'], job['volume_id']))
+
+
+class Connection(object):
+    def __init__(self, fscid):
+        self.fscid = fscid
+        # set once mounted; left None if the mount failed
+        self.volume_client = None
+        self.mounted = Event()
+        self.ops_in_progress = 0
+        self.last_used = time.time()
+        self.dropped = False
+
+
+class ConnectionPool(object):
+    """
+    Mounted volume clients, one per filesystem, shared by all the commands
+    and kept until they are unused for CONNECTION_IDLE_TIMEOUT seconds.
+
+    Recovery from partial auth updates is only run on the first mount of
+    each filesystem by this mgr, i.e. at startup or after a failover.
+
+    Mounting happens outside the lock: the connection is published as soon
+    as the mount starts, and the other users of the volume wait for it
+    without keeping the other volumes, cleanup() or shutdown() waiting.
+    """
+    CONNECTION_IDLE_TIMEOUT = 60
+
+    def __init__(self, mgr):
+        self.mgr = mgr
+        self.lock = Lock()
+        self.connections = {}
+        self.recovered = set()
+
+    def _mount(self, vol_name, conn, recover):
+        try:
+            vc = CephFSVolumeClient(rados=self.mgr.rados, fs_name=vol_name)
+            vc.connect(recover=recover)
+        except Exception:
+            with self.lock:
+                if self.connections.get(vol_name) is conn:
+                    del self.connections[vol_name]
+                conn.ops_in_progress -= 1
+            conn.mounted.set()
+            raise
+        with self.lock:
+            conn.volume_client = vc
+            if recover:
+                self.recovered.add(conn.fscid)
+        conn.mounted.set()
+
+    def _release(self, conn):
+        with self.lock:
+            conn.ops_in_progress -= 1
+            conn.last_used = time.time()
+            if conn.dropped and not conn.ops_in_progress:
+                conn.volume_client.disconnect()
+
+    @contextmanager
+    def connection(self, vol_name, fscid):
+        while True:
+            with self.lock:
+                conn = self.connections.get(vol_name)
+                if conn is not None and conn.fscid != fscid:
+                    # the volume was removed and created again
+                    self._drop(vol_name)
+                    conn = None
+                mount = conn is None
+                if mount:
+                    conn = Connection(fscid)
+                    self.connections[vol_name] = conn
+                    recover = fscid not in self.recovered
+                conn.ops_in_progress += 1
+
+            if mount:
+                self._mount(vol_name, conn, recover)
+                break
+            conn.mounted.wait()
+            if conn.volume_client is not None:
+                break
+            # the mount by another command failed, try it again
+            with self.lock:
+                conn.ops_in_progress -= 1
+
+        try:
+            yield conn.volume_client
+        finally:
+            self._release(conn)
+
+    def _drop(self, vol_name):
+        conn = self.connections.pop(vol_name, None)
+        if conn is None:
+            return
+        # disconnected by the last user if it is in use
+        conn.dropped = True
+        if not conn.ops_in_progress:
+            conn.volume_client.disconnect()
+
+    def drop(self, vol_name):
+        with self.lock:
+            self._drop(vol_name)
+
+    def cleanup(self):
+        expired = time.time() - self.CONNECTION_IDLE_TIMEOUT
+        with self.lock:
+            for vol_name, conn in list(self.connections.items()):
+                if not conn.ops_in_progress and conn.last_used < expired:
+                    self.mgr.log.debug(
+                        "Disconnecting idle volume '{0}'".format(vol_name))
+                    self._drop(vol_name)
+
+    def shutdown(self):
+        with self.lock:
+            for vol_name in list(self.connections):
+                self._drop(vol_name)
 
 
 class Module(orchestrator.OrchestratorClientMixin, MgrModule):
@@ -68,33 +207,155 @@ class Module(orchestrator.OrchestratorClientMixin, MgrModule):
         # volume auth list (vc.get_authorized_ids)
 
         # snapshots?
+    ]
 
-        # FIXME: we're doing CephFSVolumeClient.recover on every
-        # path where we instantiate and connect a client.  Perhaps
-        # keep clients alive longer, or just pass a "don't recover"
-        # flag in if it's the >1st time we connected a particular
-        # volume in the lifetime of this module instance.
+    MODULE_OPTIONS = [
+        {
+            'name': 'purge_workers',
+            'type': 'uint',
+            'default': 4,
+            'min': 1,
+            'desc': 'number of threads removing the directories of a '
+                    'deleted subvolume in parallel',
+            'runtime': True,
+        },
     ]
 
     def __init__(self, *args, **kwargs):
         super(Module, self).__init__(*args, **kwargs)
         self._initialized = Event()
+        self._stopping = Event()
 
         self._background_jobs = Queue.Queue()
+        self._purge_lock = Lock()
+        self._purging = None
+
+        self._connections = ConnectionPool(self)
 
     def serve(self):
-        # TODO: discover any subvolumes pending purge, and enqueue
-        # them in background_jobs at startup
+        self._initialized.set()
 
-        # TODO: consume background_jobs
-        #   skip purge jobs if their fscid no longer exists
+        self._recover_purge_jobs()
 
-        # TODO: on volume delete, cancel out any background jobs that
-        # affect subvolumes within that volume.
+        while not self._stopping.is_set():
+            self._connections.cleanup()
+            try:
+                job = self._background_jobs.get(timeout=5)
+            except Queue.Empty:
+                continue
+            self._purge(job)
 
-        # ... any background init needed?  Can get rid of this
-        # and _initialized if not
-        self._initialized.set()
+    def shutdown(self):
+        self._stopping.set()
+        with self._purge_lock:
+            if self._purging:
+                self._purging.stop.set()
+        self._connections.shutdown()
+
+    def _recover_purge_jobs(self):
+        """
+        Queue the purges that were pending when the previous active mgr
+        stopped, and any subvolume left in the trash without one.
+        """
+        volumes = dict((fs['id'], fs['mdsmap']['fs_name'])
+                       for fs in self.get('fs_map')['filesystems'])
+
+        jobs = {}
+        for key, data in self.get_store_prefix(PURGE_KEY_PREFIX).items():
+            job = PurgeJob.from_json(data)
+            if job.fscid in volumes:
+                jobs[key] = job
+            else:
+                self.set_store(key, None)
+
+        for fscid, vol_name in volumes.items():
+            try:
+                with self._connections.connection(vol_name, fscid) as vc:
+                    sub_names = vc.list_deleted_volumes()
+            except Exception:
+                self.log.exception(
+                    "Failed to list deleted subvolumes of '{0}'".format(
+                        vol_name))
+                continue
+
+            for sub_name in sub_names:
+                job = PurgeJob(fscid, VolumePath(None, sub_name))
+                if job.key not in jobs:
+                    self.set_store(job.key, job.to_json())
+                    jobs[job.key] = job
+
+        for job in jobs.values():
+            self._background_jobs.put(job)
+
+    def _purge(self, job):
+        """
+        Remove a deleted subvolume, reporting progress as a progress
+        module event.  The job is only dropped once it completed, or was
+        cancelled by the removal of its volume.
+        """
+        if self.get_store(job.key) is None:
+            # cancelled
+            return
+
+        vol_name = None
+        for fs in self.get('fs_map')['filesystems']:
+            if fs['id'] == job.fscid:
+                vol_name = fs['mdsmap']['fs_name']
+        if vol_name is None:
+            self.set_store(job.key, None)
+            return
+
+        with self._purge_lock:
+            if self._stopping.is_set():
+                return
+            self._purging = job
+
+        ev_id = "volumes-purge-{0}-{1}".format(job.fscid,
+                                               job.subvolume_path.volume_id)
+        ev_msg = "Purging subvolume '{0}' of volume '{1}'".format(
+            job.subvolume_path.volume_id, vol_name)
+
+        def progress(removed, total):
+            self._progress('update', ev_id, ev_msg,
+                           float(removed) / total if total else 0.0)
+
+        self.log.info(ev_msg)
+        try:
+            with self._connections.connection(vol_name, job.fscid) as vc:
+                vc.purge_volume(job.subvolume_path,
+                                workers=self.get_module_option('purge_workers'),
+                                progress=progress, stop=job.stop)
+        except PurgeInterrupted:
+            # either stopping, and resumed by the next active mgr, or
+            # cancelled with its volume
+            self.log.info("Interrupted purge of subvolume '{0}'".format(
+                job.subvolume_path.volume_id))
+        except Exception:
+            # left in the store, to be retried after a mgr restart
+            self.log.exception("Failed to purge subvolume '{0}'".format(
+                job.subvolume_path.volume_id))
+        else:
+            self.set_store(job.key, None)
+        finally:
+            with self._purge_lock:
+                self._purging = None
+            self._progress('complete', ev_id)
+
+    def _progress(self, method, *args):
+        try:
+            self.remote('progress', method, *args)
+        except (ImportError, RuntimeError):
+            # the progress module is not enabled
+            pass
+
+    def _cancel_purge_jobs(self, vol_fscid):
+        prefix = "{0}{1}/".format(PURGE_KEY_PREFIX, vol_fscid)
+        for key in self.get_store_prefix(prefix):
+            self.set_store(key, None)
+
+        with self._purge_lock:
+            if self._purging and self._purging.fscid == vol_fscid:
+                self._purging.stop.set()
 
     def handle_command(self, inbuf, cmd):
         self._initialized.wait()
@@ -215,14 +476,15 @@ class Module(orchestrator.OrchestratorClientMixin, MgrModule):
 
         size = cmd.get('size', None)
 
-        if not self._volume_exists(vol_name):
+        fs = self._volume_get_fs(vol_name)
+        if fs is None:
             return -errno.ENOENT, "", \
                    "Volume not found, create it with `ceph volume create` " \
                    "before trying to create subvolumes"
 
         # TODO: validate that subvol size fits in volume size
 
-        with CephFSVolumeClient(rados=self.rados, fs_name=vol_name) as vc:
+        with self._connections.connection(vol_name, fs['id']) as vc:
             # TODO: support real subvolume groups rather than just
             # always having them 1:1 with subvolumes.
             vp = VolumePath(sub_name, sub_name)
@@ -241,21 +503,27 @@ class Module(orchestrator.OrchestratorClientMixin, MgrModule):
 
         vol_fscid = fs['id']
 
-        with CephFSVolumeClient(rados=self.rados, fs_name=vol_name) as vc:
+        with self._connections.connection(vol_name, vol_fscid) as vc:
             # TODO: support real subvolume groups rather than just
             # always having them 1:1 with subvolumes.
             vp = VolumePath(sub_name, sub_name)
 
             vc.delete_volume(vp)
 
-        # TODO: create a progress event
-        self._background_jobs.put(PurgeJob(vol_fscid, vp))
+        job = PurgeJob(vol_fscid, vp)
+        self.set_store(job.key, job.to_json())
+        self._background_jobs.put(job)
 
         return 0, "", ""
 
     def _cmd_fs_volume_rm(self, inbuf, cmd):
         vol_name = cmd['vol_name']
 
+        fs = self._volume_get_fs(vol_name)
+        if fs is not None:
+            self._cancel_purge_jobs(fs['id'])
+        self._connections.drop(vol_name)
+
         # Tear down MDS daemons
         # =====================
         try:
@@ -47,6 +47,15 @@ def test_fstat():
     assert(len(stat) == 13)
     cephfs.close(fd)
 
+@with_setup(setup_test)
+def test_fchange_attr():
+    fd = cephfs.open(b'file-1', 'w', 0o755)
+    before = cephfs.fchange_attr(fd)
+    cephfs.write(fd, b"1111", 0)
+    cephfs.fsync(fd, 0)
+    assert(cephfs.fchange_attr(fd) > before)
+    cephfs.close(fd)
+
 @with_setup(setup_test)
 def test_statfs():
     stat = cephfs.statfs(b'/')
@@ -111,6 +120,27 @@ def test_xattr():
     # Pass explicit size, and we'll get the value
     assert_equal(300, len(cephfs.getxattr("/", "user.big", 300)))
 
+    cephfs.setxattr("/", "user.key2", b"value2", 0)
+    names = cephfs.listxattr("/")
+    assert(b"user.key" in names)
+    assert(b"user.key2" in names)
+
+
+@with_setup(setup_test)
+def test_lstat_chown():
+    fd = cephfs.open(b'file-1', 'w', 0o755)
+    cephfs.close(fd)
+    cephfs.symlink(b'file-1', b'file-2')
+    assert_equal(0o120777, cephfs.lstat(b'file-2').st_mode)
+    assert_equal(0o100755, cephfs.stat(b'file-2').st_mode)
+
+    cephfs.chown(b'file-1', 1000, 1000)
+    assert_equal(1000, cephfs.stat(b'file-1').st_uid)
+    cephfs.lchown(b'file-2', 2000, 2000)
+    assert_equal(2000, cephfs.lstat(b'file-2').st_gid)
+    assert_equal(1000, cephfs.stat(b'file-2').st_gid)
+    cephfs.unlink(b'file-2')
+    cephfs.unlink(b'file-1')
 
 @with_setup(setup_test)
 def test_rename():